@@ -17,6 +17,8 @@ import discord
 from discord.ext import commands
 from redis import asyncio as aioredis
 from utils import error_handler, settings, util
+from utils.role_cache import member_roles
+from utils.settings_cache import SettingsCache
 from utils.storage import StorageManager
 
 
@@ -98,6 +100,10 @@ class Bot(commands.Bot):
         # contexts without a guild, such as private messages, and allows the guild to be indexed
         #  directly.
         self.storage[None] = StorageManager(self)
+        # Guild settings, such as the prefix checked for every message, and codex tables are cached here and kept
+        # coherent with other processes through redis pub/sub, or by redis itself with client tracking.
+        self.settings_cache = SettingsCache(self.redis, track=self.settings.REDIS_CLIENT_TRACKING)
+        self.settings_cache.start_listening()
 
         self.logging_status = list(
             (await self.redis.hgetall("settings:logging_status")).keys()
@@ -126,6 +132,7 @@ class Bot(commands.Bot):
         # Guild is a safe index because hash(discord.Guild) == guild.id >> 22
         for guild in self.guilds:
             self.storage[guild] = StorageManager(self, guild=guild)
+        self.settings_cache.track_guilds(guild.id for guild in self.guilds)
 
         while len(self.cogs_ready) < self.extensions_to_load:
             await asyncio.sleep(0)
@@ -150,6 +157,31 @@ class Bot(commands.Bot):
     async def on_guild_join(self, guild):
         """Triggered on joining a guild. Adds a storage manager for the guild."""
         self.storage[guild] = StorageManager(self, guild=guild)
+        self.settings_cache.track_guilds([guild.id])
+
+    async def on_member_update(self, before: discord.Member, after: discord.Member) -> None:
+        """Forgets the cached roles of a member whose roles changed."""
+        if before.roles != after.roles:
+            member_roles.forget(after)
+
+    async def on_member_remove(self, member: discord.Member) -> None:
+        member_roles.forget(member)
+
+    async def on_guild_role_create(self, role: discord.Role) -> None:
+        member_roles.forget_guild(role.guild.id)
+
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role) -> None:
+        member_roles.forget_guild(after.guild.id)
+
+    async def on_guild_role_delete(self, role: discord.Role) -> None:
+        member_roles.forget_guild(role.guild.id)
+
+    async def on_ready(self) -> None:
+        """Forgets all cached roles, as member updates may have been missed while disconnected."""
+        member_roles.clear()
+
+    async def on_resumed(self) -> None:
+        member_roles.clear()
 
     async def on_message(self, message):
         if isinstance(self.stats["message_counter"], int):
@@ -171,6 +203,7 @@ class Bot(commands.Bot):
 
         if isinstance(self.session, aiohttp.ClientSession):
             await self.session.close()
+        self.settings_cache.stop_listening()
         await self.redis.close()
         await self.change_presence(status=discord.Status.offline)
 
@@ -1,22 +1,25 @@
 import asyncio
-import json
 from collections import Counter
-from typing import Optional
+from typing import Collection, Optional
 
+import aiohttp
 import discord
-from discord.ext import commands  # type: ignore
+from discord.ext import commands, tasks  # type: ignore
 
+from utils.blacklist_mirror import BlacklistMirror
 from utils.cryptomonkey_util import nifty
-from utils.exceptions import UnableToCompleteRequestedAction
+from utils.exceptions import InvalidInput, UnableToCompleteRequestedAction
+from utils.exporter import StreamingExporter
 from utils.green_api_wrapper import GreenApi, GreenApiException
 from utils.logic_parser import parse_addresses
 from utils.meta_cog import MetaCog
+from utils.settings import BLACKLIST_BLOOM_FP_RATE, BLACKLIST_RECONCILE_INTERVAL, HOLDER_INDEX_MAX_AGE
 from utils.util import (
     scope,
     get_addrs_from_content_or_file,
 )
 from wax_chain.wax_addresses import (
-    is_valid_wax_address,
+    validate_wax_addresses,
     async_get_special_wax_address_list,
 )
 
@@ -26,6 +29,46 @@ class Blacklisting(MetaCog):
         super().__init__(bot)
         if not hasattr(self.bot, "green_api"):
             self.bot.green_api = GreenApi(self.session)
+        if not hasattr(self.bot, "blacklist_mirror"):
+            self.bot.blacklist_mirror = BlacklistMirror(self.bot.redis, bloom_fp_rate=BLACKLIST_BLOOM_FP_RATE)
+        self.bot.green_api.mirror = self.bot.blacklist_mirror
+        self.reconcile_blacklist.start()
+        self.bot.log("Started the reconcile_blacklist task (1).", self.bot.debug)
+
+    def cog_unload(self):
+        self.reconcile_blacklist.cancel()
+        self.bot.blacklist_mirror.stop_listening()
+        self.bot.log("Ended the reconcile_blacklist task.", self.bot.debug)
+
+    @tasks.loop(seconds=BLACKLIST_RECONCILE_INTERVAL)
+    async def reconcile_blacklist(self):
+        if self.session.closed:
+            return
+        mirror: BlacklistMirror = self.bot.blacklist_mirror
+        mirror.begin_reconcile()
+        try:
+            blacklist = await self.bot.green_api.fetch_blacklist()
+        except (aiohttp.ClientError, asyncio.TimeoutError, GreenApiException) as e:
+            self.bot.log(f"Unable to reconcile the blacklist mirror: {type(e)} {e}", "WARN")
+            return
+        added, removed = await mirror.reconcile(blacklist)
+        if added or removed:
+            self.bot.log(f"Reconciled the blacklist mirror: {added} added and {removed} removed.")
+
+    @reconcile_blacklist.before_loop
+    async def before_reconcile_blacklist(self):
+        mirror: BlacklistMirror = self.bot.blacklist_mirror
+        await mirror.load()
+        mirror.start_listening()
+        await self.bot.wait_until_ready()
+
+    async def special_addresses(self) -> Collection[str]:
+        """The special wax address list kept by the SpecialWaxAddresses cog, or a freshly fetched one if it isn't
+        loaded."""
+        specials = getattr(self.bot, "special_addr_list", None)
+        if specials:
+            return specials
+        return await async_get_special_wax_address_list(self.session)
 
     # Commands
     @commands.command(
@@ -52,27 +95,22 @@ class Blacklisting(MetaCog):
                 f"`{i_list[0]}` has been blacklisted from future filtered giveaways."
             )
         # Mass-blacklist
-        specials = await async_get_special_wax_address_list(self.session)
-        to_blacklist, unable = [], []
-        for addr in list(set(i_list)):
-            if is_valid_wax_address(addr, valid_specials=specials):
-                to_blacklist.append(addr)
-            else:
-                unable.append(addr)
+        specials = await self.special_addresses()
+        to_blacklist, unable = validate_wax_addresses(set(i_list), valid_specials=specials)
         to_send = ""
         if len(unable) > 0:
             to_send += f"Skipping the following invalid addresses: {unable}."
         to_send += f" Attempting to blacklist {len(to_blacklist)} addresses, stand by."
-        await ctx.send(to_send)
-        tasks = [
-            asyncio.create_task(self.bot.green_api.blacklist_add(address))
-            for address in to_blacklist
-        ]
-        results = await asyncio.gather(*tasks)
+        msg = await ctx.send(to_send)
+
+        async def report(done: int, total: int) -> None:
+            await msg.edit(content=f"{to_send[:1900]}\nProgress: {done}/{total}")
+
+        results = await self.bot.green_api.blacklist_add_many(to_blacklist, progress=report)
         failed: Counter[str] = Counter()
         for result in results:
             if not result.get("success"):
-                failed[result["exception"]] += 1
+                failed[result.get("exception", "of an unknown error")] += 1
         if len(to_blacklist) - sum(failed.values()) > 0:
             to_send = f"Successfully blacklisted {len(to_blacklist)-sum(failed.values())} addresses."
         else:
@@ -138,29 +176,23 @@ class Blacklisting(MetaCog):
             ctx.message, provided
         )
 
-        print(i_list)
-        blacklist = set(await self.bot.green_api.get_blacklist())
-        special_addresses = set(await async_get_special_wax_address_list(self.session))
-        result_list = [
-            i
-            for i in i_list
-            if i not in blacklist
-            and is_valid_wax_address(i, valid_specials=special_addresses)
-        ]
-        print(result_list)
-        to_send = "\n".join(result_list)
+        special_addresses = await self.special_addresses()
+        result_list, _ = validate_wax_addresses(
+            await self.bot.green_api.exclude_blacklisted(i_list), valid_specials=special_addresses
+        )
         if return_inline:
+            to_send = "\n".join(result_list)
             return await ctx.send(
                 f"Here's your {len(result_list)} results:\n {to_send}"
             )
         file = ctx.message.attachments[0]
-        with open(f"res/tmp/filtered_{file.filename}", "w+", encoding="utf-8") as f:
-            f.write(to_send)
-        num_removed = len(i_list) - len(result_list)
-        await ctx.send(
-            f"{num_removed} results removed. Here's your {len(result_list)} results:",
-            file=discord.File(f"res/tmp/filtered_{file.filename}"),
-        )
+        async with StreamingExporter(f"filtered_{file.filename}") as export:
+            await export.write_all(result_list)
+            num_removed = len(i_list) - len(result_list)
+            await ctx.send(
+                f"{num_removed} results removed. Here's your {len(result_list)} results:",
+                file=await export.discord_file(),
+            )
 
     @commands.command(
         description="Gets all wax addresses that fit specified ownership criteria."
@@ -170,73 +202,79 @@ class Blacklisting(MetaCog):
     async def get_addresses(self, ctx: commands.Context, *, text=None):
         """
         Creates a text file of addresses, one per line, that meet specified conditions. You can specify card IDs
-         with and and or between them. You **must** also use brackets for ordering. If you do not use
-         brackets whenever order could be ambiguous, the returned result will not be valid.
-         You can optionally add a True flag before the logic in order to include results from the blacklist.
+         with and (&), or (|) and not (!) between them, and `atleast k (a, b, c)` to require at least k of a list.
+         not binds tightest, then and, then or; use brackets to group otherwise. not means "holds any of the
+         cards in the query, but not this one".
+         Add -noblacklist after the query to include results from the blacklist, and -max n to limit the results.
          Addresses in the blacklist are *excluded* by default.
         """
-        blacklist = await self.bot.green_api.get_blacklist()
         resultant_list = await parse_addresses(
-            self.session, text=text, blacklist=blacklist
+            self.session,
+            text=text,
+            exclude=self.bot.green_api.exclude_blacklisted,
+            index=getattr(self.bot, "holder_index", None),
+            max_index_age=HOLDER_INDEX_MAX_AGE,
         )
-        # Prepare final results for sending
-        to_send = "\n".join(resultant_list)
         # If short, can give result inline
         if len(resultant_list) < 10:
+            to_send = "\n".join(resultant_list)
             return await ctx.send(f"I found the following few addresses:\n{to_send}")
         # If long, send result in a file
-        with open("res/tmp/requested_addresses.txt", "w+", encoding="utf-8") as f:
-            f.write(to_send)
-        await ctx.send(
-            f"I found {len(resultant_list)} results, so I put them in a file:",
-            file=discord.File("res/tmp/requested_addresses.txt"),
-        )
+        async with StreamingExporter("requested_addresses.txt") as export:
+            await export.write_all(resultant_list)
+            await ctx.send(
+                f"I found {len(resultant_list)} results, so I put them in a file:",
+                file=await export.discord_file(),
+            )
 
     @commands.command(
         description="Quickly fetch miners for the cycle specified",
         aliases=["topminers"],
     )
     @commands.check(nifty())
-    async def topminers_x(self, ctx: commands.Context, cycle: int, top: int = 10):
-        """Quickly fetch miners for the cycle specified from Green's api."""
+    async def topminers_x(self, ctx: commands.Context, cycle: int, top: int = 10, export: str = "json"):
+        """Quickly fetch miners for the cycle specified from Green's api. The full data is sent as json, or with
+        export csv, as a gzipped csv with one column per field."""
+        if export not in ("json", "csv"):
+            raise InvalidInput("The export format must be json or csv.")
         msg = await ctx.send(
             f"Fetching data for cycle {cycle}, this shouldn't take longer than a minute..."
         )
         try:
-            self.bot.got_miner_data = await self.bot.green_api.all_miners_for_cycle(
-                cycle
-            )
+            table = await self.bot.green_api.miner_table_for_cycle(cycle)
         except GreenApiException as e:
             return await msg.edit(content=e)
+        self.bot.got_miner_data = table
 
         to_send = f"Top miners for cycle {cycle}:\n"
-        i = 0
-        for item in self.bot.got_miner_data:
-            self.bot.log(
-                f'Miner {item["user"]} mined {item["tlm"]:.4f} TLM over {item["mines"]} mines.',
-                "DBUG",
+        for i, item in enumerate(table.rows(table.top(top, "rank")), start=1):
+            to_send += f'{i}) {item["user"]} - {item["tlm"]:.4f} TLM over {item["mines"]}x mines\n'
+        total = table.total("tlm")
+        by_rank = table.order("rank")
+
+        if export == "csv":
+            exporter = StreamingExporter(f"minersCycle{cycle}.csv", fmt="csv", compress=True)
+        else:
+            exporter = StreamingExporter(f"minersCycle{cycle}.json", fmt="json")
+        async with exporter:
+            if export == "csv":
+                await exporter.write(table.fields)
+                await exporter.write_all(table.tuples())
+            else:
+                await exporter.write_all(table.rows(by_rank))
+            await ctx.send(
+                f"Total TLM mined for cycle {cycle} is {total:.4f} by {len(table)} "
+                f"different miners.\n"
+                f"Here's the full data.",
+                file=await exporter.discord_file(),
             )
-            i += 1
-            if i <= top:
-                to_send += f'{i}) {item["user"]} - {item["tlm"]:.4f} TLM over {item["mines"]}x mines\n'
-        total = sum(item["tlm"] for item in self.bot.got_miner_data)
-
-        with open(f"res/tmp/minersCycle{cycle}.json", "w+") as f:
-            json.dump(self.bot.got_miner_data, f, indent=4)
-        with open(f"res/tmp/minersCycle{cycle}.txt", "w+", encoding="utf-8") as f:
-            f.write(",".join(item["user"] for item in self.bot.got_miner_data))
-        await ctx.send(
-            f"Total TLM mined for cycle {cycle} is {total:.4f} by {len(self.bot.got_miner_data)} "
-            f"different miners.\n"
-            f"Here's the full data.",
-            file=discord.File(f"res/tmp/minersCycle{cycle}.json"),
-        )
         await msg.edit(content=to_send[:1990])
-        await ctx.send(
-            "Here's a csv of all those miners.",
-            file=discord.File(f"res/tmp/minersCycle{cycle}.txt"),
-        )
-
+        async with StreamingExporter(f"minersCycle{cycle}.txt", fmt="commas") as exporter:
+            await exporter.write_all(table.column("user")[i] for i in by_rank)
+            await ctx.send(
+                "Here's a csv of all those miners.",
+                file=await exporter.discord_file(),
+            )
 
 async def setup(bot):
     await bot.add_cog(Blacklisting(bot))
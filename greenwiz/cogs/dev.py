@@ -10,6 +10,7 @@ import discord
 from discord.ext import commands
 
 from utils.meta_cog import MetaCog
+from utils.role_cache import member_roles
 from utils.util import embed_footer
 from wax_chain.collection_config import collections
 
@@ -30,14 +31,9 @@ def insert_returns(body):
 
 def fanta():
     async def user_auth_check(ctx):
-        if not hasattr(ctx.author, "roles"):
-            return False
-        for role in ctx.author.roles:
-            if role.name == "Jungle Fanta":
-                return True
-            # if ctx.author.id == 125449182663278592:
-            #    return True
-        return False
+        # if ctx.author.id == 125449182663278592:
+        #    return True
+        return member_roles.has_named(ctx.author, ["Jungle Fanta"])
 
     return user_auth_check
 
@@ -253,6 +249,25 @@ class Dev(MetaCog):
             "CMMD",
         )
 
+    @commands.command(aliases=["cache_stats"])
+    @commands.is_owner()
+    async def cachestats(self, ctx: commands.Context):
+        """Show how well the in-process caches of redis settings and member roles are doing."""
+        caches = {"Settings": self.bot.settings_cache, "Member roles": member_roles}
+        lines = []
+        for name, cache in caches.items():
+            reads = cache.hits + cache.misses
+            rate = f"{cache.hits / reads:.1%}" if reads else "n/a"
+            lines.append(f"{name}: {len(cache)} entries, {cache.hits} hits, {cache.misses} misses ({rate} hit rate)")
+        settings_cache = self.bot.settings_cache
+        lines.append(
+            f"Settings invalidations: {settings_cache.invalidations}, "
+            f"{'redis client tracking' if settings_cache.track else 'pub/sub'}, "
+            f"{'active' if settings_cache.active else 'inactive'}"
+        )
+        await ctx.send("\n".join(lines))
+        self.log(f"Cachestats command used by {ctx.author}.", "CMMD")
+
     @commands.command(name="eval", hidden=True)
     @commands.is_owner()
     async def eval_(self, ctx: commands.Context, *, cmd: str):
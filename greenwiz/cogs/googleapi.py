@@ -123,8 +123,7 @@ class Googleapi(MetaCog):
             if role_required is None or role in user.roles:
                 valid_addresses.add(address)
         self.log(valid_addresses, "DBUG")
-        blacklist = await self.bot.green_api.get_blacklist()
-        adders = valid_addresses - blacklist
+        adders = await self.bot.green_api.exclude_blacklisted(valid_addresses)
         with open("res/tmp/addresses_from_sheet.txt", "w+", encoding="utf-8") as f:
             f.write(",".join(adders))
 
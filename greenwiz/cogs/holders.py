@@ -0,0 +1,135 @@
+import asyncio
+import re
+from time import time
+from typing import Any, Optional
+
+import aiohttp
+from discord.ext import commands, tasks  # type: ignore
+
+from utils.cryptomonkey_util import nifty
+from utils.exceptions import InvalidInput, UnableToCompleteRequestedAction
+from utils.exporter import StreamingExporter
+from utils.logic_parser import compile_query
+from utils.meta_cog import MetaCog
+from utils.settings import (
+    HOLDER_INDEX_PATH,
+    HOLDER_INDEX_REFRESH_INTERVAL,
+    HOLDER_SNAPSHOT_INTERVAL,
+    HOLDER_SNAPSHOT_RETENTION,
+)
+from utils.util import scope
+from wax_chain.holder_index import HolderIndex
+from wax_chain.wax_market_utils import get_owners
+from wax_chain.wax_util import update_cache_cards
+
+# An optional "to <days>" before a holderdiff query, giving the age of the later snapshot.
+TO_DAYS = re.compile(r"to\s+(\d+(?:\.\d+)?)\s+(.*)", re.DOTALL)
+
+
+class Holders(MetaCog):
+    """Keeps an index of the holders of every cryptomonKey up to date in the background and persists it to disk, so
+    that ownership queries don't need to sweep the atomic api. The index is snapshotted periodically so that holders
+    can be compared over time."""
+
+    def __init__(self, bot):
+        super().__init__(bot)
+        self.concurrency = 5
+        self.update_holder_index.start()
+        self.bot.log("Started the update_holder_index task (1).", self.bot.debug)
+
+    def cog_unload(self):
+        self.update_holder_index.cancel()
+        self.bot.log("Ended the update_holder_index task.", self.bot.debug)
+
+    @tasks.loop(seconds=HOLDER_INDEX_REFRESH_INTERVAL)
+    async def update_holder_index(self):
+        if self.session.closed:
+            return
+        index: HolderIndex = self.bot.holder_index
+        cards = await update_cache_cards(self.session)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(info: dict) -> tuple[int, list[str]]:
+            async with semaphore:
+                return await get_owners(int(info["template_id"]), self.session, num=info["issued_supply"])
+
+        results = await asyncio.gather(*[fetch(info) for info in cards.values()], return_exceptions=True)
+        added = removed = 0
+        for result in results:
+            if isinstance(result, (aiohttp.ClientError, asyncio.TimeoutError, KeyError)):
+                self.bot.log(f"Unable to index the holders of a card: {type(result)} {result}", "WARN")
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            template_id, owners = result
+            changes = index.update(template_id, owners)
+            added += changes[0]
+            removed += changes[1]
+        now = time()
+        snapshot_due = not index.snapshot_times or now - index.snapshot_times[-1] >= HOLDER_SNAPSHOT_INTERVAL
+        if snapshot_due:
+            changed = index.snapshot(now)
+            index.prune_snapshots(now - HOLDER_SNAPSHOT_RETENTION)
+            self.bot.log(f"Took a holder snapshot, {changed} templates changed since the last one.")
+        if added or removed or snapshot_due:
+            await asyncio.to_thread(index.save, HOLDER_INDEX_PATH)
+        self.bot.log(
+            f"Updated the holder index: {len(index)} accounts, {added} new and {removed} removed holdings."
+        )
+
+    @update_holder_index.before_loop
+    async def before_update_holder_index(self):
+        await self.bot.wait_until_ready()
+        if not hasattr(self.bot, "holder_index"):
+            index = await asyncio.to_thread(HolderIndex.load, HOLDER_INDEX_PATH)
+            self.bot.holder_index = index if index is not None else HolderIndex()
+
+    @commands.command(
+        description="Show who started or stopped matching a card query between two snapshots.",
+        aliases=["holdersdiff"],
+    )
+    @commands.check(nifty())
+    @commands.check(scope())
+    async def holderdiff(self, ctx: commands.Context[Any], days: float, *, text: str):
+        """Compares the holders matching a query (the same syntax as get_addresses, for example `1 and 2`) in the
+        snapshot from the given number of days ago with the current holders, and lists who newly matches and who
+        no longer matches. For example `holderdiff 7 atleast 3 (1, 2, 3)` shows who completed or broke up a
+        set of cards 1 to 3 this week. To compare with an older snapshot instead of the current holders, give its
+        age after `to`: `holderdiff 30 to 7 1 and 2` compares the snapshots from 30 and 7 days ago.
+        Uses stored snapshots only, so it is instant."""
+        index: Optional[HolderIndex] = getattr(self.bot, "holder_index", None)
+        if index is None or not index.snapshot_times:
+            raise UnableToCompleteRequestedAction("I don't have any holder snapshots yet.")
+        to_days: Optional[float] = None
+        if match := TO_DAYS.fullmatch(text.strip()):
+            to_days, text = float(match.group(1)), match.group(2)
+        if days <= 0 or (to_days is not None and not 0 <= to_days < days):
+            raise InvalidInput("Days must be above 0, and above the days given after `to`.")
+        query = compile_query(text)
+        now = time()
+        before = index.snapshot_before(now - days * 24 * 60 * 60)
+        if before is None:
+            before = index.snapshot_times[0]
+        after: Optional[float] = None
+        if to_days:
+            after = index.snapshot_before(now - to_days * 24 * 60 * 60)
+            if after is None or after <= before:
+                raise InvalidInput(f"I don't have a snapshot from {to_days} days ago that is newer than the first.")
+        added, removed = query.diff_index(index, before, after)
+        until = "now" if after is None else f"the snapshot of <t:{int(after)}:f>"
+        header = (
+            f"Between the snapshot of <t:{int(before)}:f> and {until}, {len(added)} addresses started and "
+            f"{len(removed)} stopped matching."
+        )
+        if len(added) + len(removed) < 20:
+            return await ctx.send(
+                f"{header}\nStarted: {', '.join(added) or 'none'}\nStopped: {', '.join(removed) or 'none'}"
+            )
+        async with StreamingExporter("holder_diff.txt") as export:
+            await export.write_all(f"+{address}" for address in added)
+            await export.write_all(f"-{address}" for address in removed)
+            await ctx.send(header, file=await export.discord_file())
+
+
+async def setup(bot):
+    await bot.add_cog(Holders(bot))
@@ -2,8 +2,11 @@ import discord
 from discord.ext import commands
 
 from utils.meta_cog import MetaCog
+from utils.role_cache import member_roles
 from utils.settings import CM_GUID
 
+LINKS_NOT_ALLOWED_ROLE_IDS = frozenset({822929698358820905})
+
 
 class LinkDeleter(MetaCog):
     @commands.Cog.listener()
@@ -13,9 +16,8 @@ class LinkDeleter(MetaCog):
             return
         if message.guild.id != CM_GUID:
             return
-        role = message.guild.get_role(822929698358820905)
         author = message.guild.get_member(message.author.id)
-        if author is None or role not in author.roles:
+        if not member_roles.has_any(author, LINKS_NOT_ALLOWED_ROLE_IDS):
             return
 
         if (
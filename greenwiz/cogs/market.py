@@ -0,0 +1,60 @@
+from typing import Any
+
+from discord.ext import commands, tasks  # type: ignore
+
+from utils.exceptions import InvalidInput, UnableToCompleteRequestedAction
+from utils.meta_cog import MetaCog
+from utils.paginate import send
+from utils.settings import MARKET_REFRESH_INTERVAL
+from utils.util import scope
+from wax_chain.market_aggregates import MarketAggregates
+
+
+class Market(MetaCog):
+    """Keeps collection-wide market figures up to date in the background and displays them on request."""
+
+    def __init__(self, bot):
+        super().__init__(bot)
+        self.bot.market_stats = MarketAggregates()
+        self.update_market_stats.start()
+        self.bot.log("Started the update_market_stats task (1).", self.bot.debug)
+
+    def cog_unload(self):
+        self.update_market_stats.cancel()
+        self.bot.log("Ended the update_market_stats task.", self.bot.debug)
+
+    @tasks.loop(seconds=MARKET_REFRESH_INTERVAL)
+    async def update_market_stats(self):
+        if self.session.closed:
+            return
+        updated = await self.bot.market_stats.refresh(self.session)
+        self.bot.log(f"Updated market stats for {updated}/{len(self.bot.market_stats)} templates.")
+
+    @update_market_stats.before_loop
+    async def before_update_market_stats(self):
+        await self.bot.wait_until_ready()
+
+    @commands.command(
+        description="Show floor, last sale, volume and holders for every card in the collection.",
+        aliases=["dashboard", "marketboard"],
+    )
+    @commands.check(scope())
+    async def market(self, ctx: commands.Context[Any], sort: str = "card"):
+        """Shows the floor price, last sale, 24h and 7d volume and holder count of every cryptomonKey.
+        Sort by card (default), floor, 24h, 7d or holders. Figures are refreshed in the background every few
+        minutes, so this is always instant."""
+        aggregates: MarketAggregates = self.bot.market_stats
+        if len(aggregates) < 1:
+            raise UnableToCompleteRequestedAction(
+                "I'm still gathering market data, try again in a few minutes."
+            )
+        try:
+            table = aggregates.render(sort)
+        except ValueError as e:
+            raise InvalidInput(str(e))
+        await ctx.send(f"Market data as of <t:{int(aggregates.updated)}:R>:")
+        await send(ctx, table, page_length=1990, pre_text="```\n", post_text="```")
+
+
+async def setup(bot):
+    await bot.add_cog(Market(bot))
@@ -0,0 +1,135 @@
+import asyncio
+from typing import Any
+
+import aiohttp
+import discord
+from discord.ext import commands, tasks  # type: ignore
+from redis.exceptions import RedisError
+
+from utils.exceptions import InvalidInput
+from utils.meta_cog import MetaCog
+from utils.settings import PRICE_ALERT_COLLECTIONS, PRICE_ALERT_POLL_INTERVAL
+from utils.storage import StorageManager
+from utils.util import scope
+from wax_chain.market_feed import ListingFeed, cheapest_listings, match_price_alerts
+from wax_chain.wax_util import get_template_id
+
+ATOMICHUB_SALE_URL = "https://wax.atomichub.io/market/sale/"
+
+
+class PriceAlerts(MetaCog):
+    """DMs users when a card they're watching is listed on the market at or below their price. New listings are
+    fetched once per poll for everyone, then matched against the subscriptions of just the templates that were
+    listed."""
+
+    def __init__(self, bot):
+        super().__init__(bot)
+        self.feed = ListingFeed(PRICE_ALERT_COLLECTIONS)
+        self.check_price_alerts.start()
+        self.bot.log("Started the check_price_alerts task (1).", self.bot.debug)
+
+    def cog_unload(self):
+        self.check_price_alerts.cancel()
+        self.bot.log("Ended the check_price_alerts task.", self.bot.debug)
+
+    @property
+    def alerts(self) -> StorageManager:
+        # Alerts follow the user rather than the server they were set in.
+        return self.storage[None]
+
+    async def to_template_id(self, card: int) -> int:
+        if card < 1000:
+            card = await get_template_id(card, self.session)
+        if card < 0:
+            raise InvalidInput("That card doesn't exist or hasn't been minted yet.")
+        return card
+
+    @tasks.loop(seconds=PRICE_ALERT_POLL_INTERVAL)
+    async def check_price_alerts(self):
+        if self.session.closed:
+            return
+        # tasks.loop only survives network errors, so anything else would stop alerts until the cog is reloaded.
+        try:
+            listings = await self.feed.poll(self.session)
+            if not listings:
+                return
+            cheapest = cheapest_listings(listings)
+            subscriptions = await self.alerts.get_price_alerts(list(cheapest))
+            for user_id, matched in match_price_alerts(cheapest, subscriptions).items():
+                await self.notify(user_id, matched)
+        except (
+            aiohttp.ClientError,
+            asyncio.TimeoutError,
+            RedisError,
+            AttributeError,
+            KeyError,
+            TypeError,
+            ValueError,
+        ) as e:
+            self.log(f"Unable to check price alerts: {type(e)} {e}", "WARN")
+
+    @check_price_alerts.before_loop
+    async def before_check_price_alerts(self):
+        await self.bot.wait_until_ready()
+
+    async def notify(self, user_id: int, listings: list[dict]) -> None:
+        """DMs a user the listings which matched their alerts. Alerts fire once, so they are removed once the DM is
+        sent. If it can't be sent, they are kept to fire again on the next matching listing, unless the user no
+        longer exists."""
+        user = self.bot.get_user(user_id)
+        try:
+            if user is None:
+                user = await self.bot.fetch_user(user_id)
+            lines = [
+                f"Template {listing['template_id']} was just listed for {listing['price']:.2f} WAX: "
+                f"<{ATOMICHUB_SALE_URL}{listing['sale_id']}>"
+                for listing in listings
+            ]
+            await user.send("Price alert!\n" + "\n".join(lines))
+        except discord.NotFound as e:
+            self.log(f"Removing the price alerts of {user_id}, who couldn't be found: {e}", "WARN")
+        except (discord.Forbidden, discord.HTTPException) as e:
+            self.log(f"Unable to send price alert to {user_id}, keeping it: {type(e)} {e}", "WARN")
+            return
+        for listing in listings:
+            await self.alerts.remove_price_alert(user_id, listing["template_id"])
+
+    @commands.command(
+        description="Get a DM when a card is listed on the market at or below a price.",
+        aliases=["pa"],
+    )
+    @commands.check(scope())
+    async def pricealert(self, ctx: commands.Context[Any], card: int, max_price: float):
+        """Sends you a DM the next time the given card # (or template id) is listed for sale at or below max_price
+        WAX. The alert is removed once it has fired."""
+        if max_price <= 0:
+            raise InvalidInput("The price must be above 0 WAX.")
+        template_id = await self.to_template_id(card)
+        await self.alerts.add_price_alert(ctx.author, template_id, max_price)
+        await ctx.send(
+            f"I'll DM you when template {template_id} is listed for {max_price:.2f} WAX or less."
+        )
+
+    @commands.command(description="List your active price alerts.")
+    @commands.check(scope())
+    async def pricealerts(self, ctx: commands.Context[Any]):
+        alerts = await self.alerts.get_user_price_alerts(ctx.author)
+        if not alerts:
+            return await ctx.send("You don't have any price alerts set.")
+        lines = [
+            f"Template {template_id}: {max_price:.2f} WAX or less"
+            for template_id, max_price in sorted(alerts.items())
+        ]
+        await ctx.send("Your price alerts:\n" + "\n".join(lines))
+
+    @commands.command(description="Remove one of your price alerts.")
+    @commands.check(scope())
+    async def unpricealert(self, ctx: commands.Context[Any], card: int):
+        template_id = await self.to_template_id(card)
+        if await self.alerts.remove_price_alert(ctx.author, template_id):
+            return await ctx.send(f"Removed your price alert for template {template_id}.")
+        await ctx.send(f"You don't have a price alert for template {template_id}.")
+
+
+async def setup(bot):
+    await bot.add_cog(PriceAlerts(bot))
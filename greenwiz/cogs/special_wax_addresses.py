@@ -1,31 +1,39 @@
 from discord.ext import tasks  # type: ignore
 
 from utils.meta_cog import MetaCog
-from wax_chain.wax_addresses import async_get_special_wax_address_list
+from wax_chain.special_address_registry import SpecialAddressRegistry
 
 
 class SpecialWaxAddresses(MetaCog):
-    """A small cog which takes care of maintaining a list of valid special wax addresses for the bot."""
+    """A small cog which takes care of maintaining a list of valid special wax addresses for the bot.
+    bot.special_addr_list is always a complete frozenset, replaced rather than modified when the list changes."""
 
     def __init__(self, bot):
         super().__init__(bot)
-        self.bot.special_addr_list = set()
+        self.bot.special_addresses = SpecialAddressRegistry(self.bot.redis)
+        self.bot.special_addr_list = frozenset()
         self.update_valid_special_wax_list.start()
         self.bot.log(
             "Started the update_valid_special_wax_list task (1).", self.bot.debug
         )
 
+    async def cog_load(self) -> None:
+        # Loaded before the cog's commands can be used, so that nothing sees the empty list.
+        registry: SpecialAddressRegistry = self.bot.special_addresses
+        source = await registry.load()
+        self.bot.special_addr_list = registry.specials
+        self.bot.log(f"Loaded {len(registry)} special wax addresses from {source}.")
+
     def cog_unload(self):
         self.update_valid_special_wax_list.cancel()
         self.bot.log("Ended the update_valid_special_wax_list task.", self.bot.debug)
 
     @tasks.loop(seconds=28800)
     async def update_valid_special_wax_list(self):
-        specials = await async_get_special_wax_address_list(self.bot.session)
-        self.bot.special_addr_list.update(specials)
-        self.bot.log(
-            f"Updated cached list of {len(self.bot.special_addr_list)} special wax addresses."
-        )
+        registry: SpecialAddressRegistry = self.bot.special_addresses
+        new = await registry.refresh(self.bot.session)
+        self.bot.special_addr_list = registry.specials
+        self.bot.log(f"Found {new} new special wax addresses. Cached {registry.describe()}")
 
     @update_valid_special_wax_list.before_loop
     async def before_update_valid_special_wax_list(self):
@@ -2,6 +2,7 @@ from discord.ext import commands
 from typing import Any
 
 from wax_chain.wax_addresses import is_valid_wax_address
+from utils.cryptomonkey_util import nifty
 from utils.meta_cog import MetaCog
 from utils.settings import WALLETLINK_LOG_CHANNEL
 
@@ -10,6 +11,13 @@ class WalletLinks(MetaCog):
     def __init__(self, bot):
         super().__init__(bot)
 
+    async def cog_load(self) -> None:
+        # Wallets linked before the reverse index existed only live in users' notes.
+        wallets = self.bot.storage[None].wallets
+        if not await self.bot.redis.exists(wallets.indexed_key):
+            found = await wallets.rebuild_index()
+            self.log(f"Indexed {found} linked wallets", "INFO")
+
     @commands.hybrid_command(
         description="Set wallet to which future drops will be sent directly to.",
         aliases=["setwallet", "linkwallet"]
@@ -59,6 +67,20 @@ class WalletLinks(MetaCog):
             await log_channel.send(f"User <@{ctx.author.id}> cleared their set wallet")
             await ctx.send("Linked wallet cleared")
 
+    @commands.hybrid_command(
+        description="Find the users who linked a wallet.",
+        aliases=["walletowner"]
+    )
+    @commands.check(nifty())
+    async def wallet_owner(
+        self, ctx: commands.Context[Any], wallet: str
+    ):
+        user_ids = await self.bot.storage[None].wallets.owners(wallet)
+        if not user_ids:
+            await ctx.send(f"No user has linked {wallet}.")
+        else:
+            await ctx.send(f"{wallet} is linked by " + ", ".join(f"<@{user_id}> ({user_id})" for user_id in user_ids))
+
 
 async def setup(bot):
     await bot.add_cog(WalletLinks(bot))
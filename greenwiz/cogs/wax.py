@@ -14,6 +14,7 @@ from discord.ext import commands, tasks  # type: ignore
 from utils.cryptomonkey_util import monkeyprinter
 from utils.exceptions import UnableToCompleteRequestedAction, InvalidInput
 from utils.meta_cog import MetaCog
+from utils.paginate import send
 from utils.settings import (
     WAX_ACC_NAME,
     DEFAULT_WAX_COLLECTION,
@@ -37,8 +38,12 @@ from wax_chain.wax_util import (
     WaxConnection,
     get_template_id,
     send_link_start_to_finish,
+    import_card_sends,
     get_card_dict,
+    cached_fair_price,
+    card_info_cache,
 )
+from wax_chain.inventory import value_inventory
 from wax_chain import link_deletion
 
 
@@ -58,6 +63,9 @@ class Wax(MetaCog):
             )
         self.bot.wax_con = WaxConnection(self.bot)
 
+    async def cog_load(self) -> None:
+        await import_card_sends(self.bot)
+
     def cog_unload(self):
         self.update_bot_known_assets.cancel()
         self.bot.log("Ended the update_bot_known_assets task.", self.bot.debug)
@@ -548,7 +556,16 @@ class Wax(MetaCog):
                         self.bot.log(
                             f"Unable to get IPFS hash for asset {asset_id}", "WARN",
                         )
-                    assets.append(WaxNFT(asset_id=asset_id, ipfs_hash=ipfs_hash))
+                    template_id = -1
+                    if item.get("template"):
+                        template_id = int(item["template"]["template_id"])
+                    assets.append(
+                        WaxNFT(
+                            asset_id=asset_id,
+                            ipfs_hash=ipfs_hash,
+                            template_id=template_id,
+                        )
+                    )
                 if len(response) < 1000:
                     break
                 page += 1
@@ -566,6 +583,40 @@ class Wax(MetaCog):
     async def before_update_bot_known_assets(self):
         await self.bot.wait_until_ready()
 
+    @commands.command(
+        description="Value the drop account's inventory using cached market prices",
+        aliases=["valuation"],
+    )
+    @commands.check(monkeyprinter())
+    async def inventory(
+        self,
+        ctx: commands.Context[Any],
+        collection: str = DEFAULT_WAX_COLLECTION,
+        days: int = 7,
+    ):
+        """Shows what the drop account of a collection holds, grouped by template, with the total and per-template
+        value and how many days it lasts at the average daily drop rate of the last few days. Only cached prices are
+        used, so templates which haven't been priced recently are listed without a value."""
+        if not 0 < days <= 60:
+            raise InvalidInput("Days must be between 1 and 60.")
+        assets = getattr(self.bot, "cached_cards", {}).get(collection)
+        if assets is None:
+            raise UnableToCompleteRequestedAction(
+                f"I don't know the inventory of {collection} yet, try again in a few minutes."
+            )
+        names = {
+            int(info["template_id"]): info["name"]
+            for info in card_info_cache.peek(DEFAULT_WAX_COLLECTION, {}).values()
+        }
+        valuation = value_inventory(assets, cached_fair_price, names)
+        await send(
+            ctx,
+            valuation.render(await self.storage[None].drops.average_per_day(days)),
+            page_length=1990,
+            pre_text="```\n",
+            post_text="```",
+        )
+
     @commands.command(description="Fetch the top monkeysmatch completers")
     @commands.check(monkeyprinter())
     async def monkeysmatch(
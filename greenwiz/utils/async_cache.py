@@ -0,0 +1,145 @@
+import asyncio
+from collections import OrderedDict
+from time import monotonic
+from typing import Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+
+from utils.util import log
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class AsyncTTLCache(Generic[K, V]):
+    """A bounded cache for values that are expensive to fetch asynchronously.
+    Entries younger than ttl are served directly. Older entries are still served, but trigger a single background
+    refresh (stale-while-revalidate), unless they are more than max_stale seconds past their ttl, in which case the
+    caller waits for the refresh. Concurrent loads of the same key are collapsed into one call to the loader, and
+    the least recently used entry is evicted once there are more than maxsize entries."""
+
+    def __init__(
+        self,
+        ttl: float,
+        maxsize: int = 1024,
+        max_stale: Optional[float] = None,
+        name: str = "cache",
+    ) -> None:
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1.")
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.max_stale = max_stale
+        self.name = name
+        self._entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._inflight: dict[K, asyncio.Task[V]] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._entries
+
+    def __repr__(self) -> str:
+        return (
+            f"<AsyncTTLCache {self.name}: {len(self)}/{self.maxsize} entries, {self.hits} hits, "
+            f"{self.stale_hits} stale hits, {self.misses} misses>"
+        )
+
+    def age(self, key: K) -> float:
+        """Seconds since the entry for key was stored, or infinity if there isn't one."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return float("inf")
+        return monotonic() - entry[0]
+
+    def peek(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """Returns the stored value for key regardless of its age, without loading or refreshing anything."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        return entry[1]
+
+    def set(self, key: K, value: V) -> None:
+        """Stores a value as freshly loaded, evicting the least recently used entry if the cache is full."""
+        self._entries[key] = (monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def expire(self, key: Optional[K] = None) -> None:
+        """Marks the entry for key, or every entry if no key is given, as past its ttl without dropping it, so that
+        the next get refreshes it but can still serve the old value meanwhile."""
+        self._detach(key)
+        expired_at = monotonic() - self.ttl
+        for k in list(self._entries) if key is None else [key]:
+            entry = self._entries.get(k)
+            if entry is not None and entry[0] > expired_at:
+                self._entries[k] = (expired_at, entry[1])
+
+    def invalidate(self, key: Optional[K] = None) -> None:
+        """Drops the entry for key, or every entry if no key is given."""
+        self._detach(key)
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    async def get(self, key: K, loader: Callable[[], Awaitable[V]], force: bool = False) -> V:
+        """Returns the value for key, calling loader to fetch it if it isn't cached. If force is set, a stored value
+        is ignored and the caller waits for a reload."""
+        entry = self._entries.get(key)
+        if entry is not None and not force:
+            stored_at, value = entry
+            age = monotonic() - stored_at
+            if age < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return value
+            if self.max_stale is None or age < self.ttl + self.max_stale:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                self.refresh(key, loader)
+                return value
+        self.misses += 1
+        # Shielded so that a cancelled caller doesn't cancel a load other callers are waiting on.
+        return await asyncio.shield(self.refresh(key, loader))
+
+    def refresh(self, key: K, loader: Callable[[], Awaitable[V]]) -> asyncio.Task[V]:
+        """Starts loading key in the background unless a load for it is already running, and returns the task
+        which will produce the value."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, loader))
+            task.add_done_callback(self._log_failure)
+            self._inflight[key] = task
+        return task
+
+    def _detach(self, key: Optional[K]) -> None:
+        """Stops the loads in flight for key, or for every key, from storing what they load, as it may predate an
+        invalidation. Their callers still get it, but the next get starts a new load."""
+        if key is None:
+            self._inflight.clear()
+        else:
+            self._inflight.pop(key, None)
+
+    async def _load(self, key: K, loader: Callable[[], Awaitable[V]]) -> V:
+        task = asyncio.current_task()
+        try:
+            value = await loader()
+            # Only the current load of a key is stored, see _detach.
+            if self._inflight.get(key) is task:
+                self.set(key, value)
+            return value
+        finally:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+
+    def _log_failure(self, task: asyncio.Task[V]) -> None:
+        """Background refreshes have no caller to raise to, so failures are logged. The stale value is kept."""
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            log(f"Failed to refresh an entry of the {self.name} cache: {type(exc).__name__}: {exc}", "WARN")
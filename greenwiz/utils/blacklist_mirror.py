@@ -0,0 +1,198 @@
+import asyncio
+import json
+import uuid
+from typing import AbstractSet, Iterable, Optional
+
+from utils.bloom_filter import ScreenedSet
+from utils.util import log
+
+
+class BlacklistMirror:
+    """A local copy of the blacklist, kept as a redis set so that every process shares it, and published in process
+    as an immutable frozenset so membership checks never wait on the network.
+    Changes made through this process are applied to redis and announced on a pub/sub channel, which other processes
+    listen to in order to apply the same change to their frozenset. reconcile replaces the contents with the
+    authoritative list, touching only the addresses that differ. Call begin_reconcile before fetching that list, so
+    that changes made while it was being fetched aren't reverted.
+
+    With a bloom_fp_rate, the mirror is compact: instead of the frozenset, only a Bloom filter of the blacklist is held
+    in process, and the filter's few positives are checked exactly against redis. Membership is then only available
+    through exclude, which is exact in both modes."""
+
+    key = "blacklist:mirror"
+    channel = "blacklist:events"
+
+    def __init__(self, redis, bloom_fp_rate: Optional[float] = None) -> None:
+        self.redis = redis
+        self.members: frozenset[str] = frozenset()
+        self.screen: Optional[ScreenedSet] = None
+        if bloom_fp_rate is not None:
+            self.screen = ScreenedSet(redis, self.key, bloom_fp_rate)
+        self.loaded = False
+        # Addresses changed since begin_reconcile, which reconcile leaves alone.
+        self._changed_since: Optional[set[str]] = None
+        # The sizes of the consecutive blacklists reconcile has ignored as too small.
+        self._shrunk_to: list[int] = []
+        # Identifies this process's own events, so it doesn't apply them twice.
+        self.origin = uuid.uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+
+    def __contains__(self, address: str) -> bool:
+        return address in self.members
+
+    def __len__(self) -> int:
+        return len(self.members) if self.screen is None else len(self.screen)
+
+    @property
+    def compact(self) -> bool:
+        return self.screen is not None
+
+    async def load(self) -> None:
+        """Reads the shared copy from redis. If it is empty, the mirror isn't considered loaded until the first
+        reconcile, so that callers don't mistake it for an empty blacklist."""
+        if self.screen is not None:
+            self.loaded = await self.screen.load() > 0
+            return
+        self.members = frozenset(await self.redis.smembers(self.key))
+        self.loaded = len(self.members) > 0
+
+    async def exclude(self, addresses: Iterable[str]) -> list[str]:
+        """The addresses which aren't blacklisted, in order."""
+        if self.screen is not None:
+            return await self.screen.exclude(addresses)
+        members = self.members
+        return [address for address in addresses if address not in members]
+
+    def _apply(self, op: str, addresses: Iterable[str]) -> None:
+        addresses = list(addresses)
+        if self._changed_since is not None:
+            self._changed_since.update(addresses)
+        if self.screen is not None:
+            # Removed addresses stay in the filter until it is rebuilt; the exact check in redis rules them out.
+            if op == "add":
+                for address in addresses:
+                    self.screen.bloom.add(address)
+        elif op == "add":
+            self.members = self.members | frozenset(addresses)
+        elif op == "remove":
+            self.members = self.members - frozenset(addresses)
+
+    def _resize(self, op: str, count: int) -> None:
+        """Keeps the compact mirror's size in step with a change which added or removed count members of the redis
+        set, as the filter can't tell."""
+        if self.screen is not None:
+            self.screen.size += count if op == "add" else -count
+
+    async def _change(self, op: str, addresses: list[str]) -> None:
+        if not addresses:
+            return
+        self._apply(op, addresses)
+        if op == "add":
+            count = await self.redis.sadd(self.key, *addresses)
+        else:
+            count = await self.redis.srem(self.key, *addresses)
+        self._resize(op, count)
+        await self.redis.publish(
+            self.channel, json.dumps({"op": op, "addresses": addresses, "count": count, "origin": self.origin})
+        )
+
+    async def add(self, addresses: Iterable[str]) -> None:
+        await self._change("add", list(addresses))
+
+    async def remove(self, addresses: Iterable[str]) -> None:
+        await self._change("remove", list(addresses))
+
+    def begin_reconcile(self) -> None:
+        """Starts noting changes, to be left alone by the next reconcile. Call it before fetching the blacklist."""
+        self._changed_since = set()
+
+    async def reconcile(
+        self, authoritative: AbstractSet[str], min_ratio: float = 0.5, confirmations: int = 3
+    ) -> tuple[int, int]:
+        """Makes the mirror match the authoritative blacklist, except for addresses changed since begin_reconcile.
+        Returns how many addresses were added and removed.
+        A blacklist smaller than min_ratio of the mirror is more likely a truncated response than a real change, so
+        it is ignored with a warning, until confirmations blacklists in a row have all come back about that small.
+        An empty blacklist is always ignored."""
+        changed, self._changed_since = self._changed_since or set(), None
+        if not authoritative or len(authoritative) < len(self) * min_ratio:
+            size = len(authoritative)
+            last = self._shrunk_to[-1] if self._shrunk_to else 0
+            if size and min(size, last) >= max(size, last) * min_ratio:
+                self._shrunk_to.append(size)
+            else:
+                self._shrunk_to = [size] if size else []
+            if len(self._shrunk_to) < confirmations:
+                log(
+                    f"Not reconciling the blacklist mirror of {len(self)} addresses with a blacklist of "
+                    f"{len(authoritative)}, which looks truncated.",
+                    "WARN",
+                )
+                return 0, 0
+            log(
+                f"Reconciling the blacklist mirror of {len(self)} addresses with a blacklist of {len(authoritative)}, "
+                f"as it has been about that size {len(self._shrunk_to)} times in a row.",
+                "WARN",
+            )
+        self._shrunk_to = []
+        if self.screen is not None:
+            return await self._reconcile_compact(authoritative, changed)
+        added = [address for address in authoritative if address not in self.members and address not in changed]
+        removed = [address for address in self.members if address not in authoritative and address not in changed]
+        await self.add(added)
+        await self.remove(removed)
+        self.loaded = True
+        return len(added), len(removed)
+
+    async def _reconcile_compact(self, authoritative: AbstractSet[str], changed: set[str]) -> tuple[int, int]:
+        assert self.screen is not None
+        candidates = [address for address in authoritative if address not in changed]
+        present = await self.redis.smismember(self.key, candidates) if candidates else []
+        added = [address for address, found in zip(candidates, present) if not found]
+        removed = [
+            address
+            async for address in self.redis.sscan_iter(self.key, count=self.screen.chunk_size)
+            if address not in authoritative and address not in changed
+        ]
+        await self.add(added)
+        await self.remove(removed)
+        # The changes left alone are in redis but may not match authoritative.
+        changed_list = list(changed)
+        kept = await self.redis.smismember(self.key, changed_list) if changed_list else []
+        self.screen.rebuild(
+            {address for address in authoritative if address not in changed}
+            | {address for address, found in zip(changed_list, kept) if found}
+        )
+        self.loaded = True
+        return len(added), len(removed)
+
+    def handle_event(self, data: str) -> None:
+        event = json.loads(data)
+        if event.get("origin") != self.origin:
+            self._apply(event["op"], event["addresses"])
+            self._resize(event["op"], int(event.get("count", 0)))
+
+    async def listen(self) -> None:
+        """Applies changes announced by other processes until cancelled."""
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self.channel)
+        try:
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                try:
+                    self.handle_event(message["data"])
+                except (ValueError, KeyError) as e:
+                    log(f"Ignoring a malformed blacklist event: {e}", "WARN")
+        finally:
+            await pubsub.unsubscribe(self.channel)
+            await pubsub.close()
+
+    def start_listening(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self.listen())
+
+    def stop_listening(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
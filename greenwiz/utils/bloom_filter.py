@@ -0,0 +1,149 @@
+import hashlib
+import math
+from typing import Collection, Iterable
+
+from bitarray import bitarray
+
+
+class BloomFilter:
+    """A compact, probabilistic set of strings. `in` is never wrong for items that were added, but returns True for
+    roughly fp_rate of other items, so positives need an exact check elsewhere. Items can't be removed.
+    Sized for capacity items; adding more than that raises the false positive rate."""
+
+    def __init__(self, capacity: int, fp_rate: float = 0.01) -> None:
+        if not 0 < fp_rate < 1:
+            raise ValueError("The false positive rate must be between 0 and 1.")
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.size = max(8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bitarray(self.size)
+        self.bits.setall(0)
+        self.count = 0
+
+    @classmethod
+    def from_items(cls, items: Iterable[str], capacity: int, fp_rate: float = 0.01) -> "BloomFilter":
+        bloom = cls(capacity, fp_rate)
+        for item in items:
+            bloom.add(item)
+        return bloom
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes
+
+    def _positions(self, item: str) -> list[int]:
+        # Double hashing: k positions from the two halves of one 128 bit digest.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position] = 1
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        bits = self.bits
+        return all(bits[position] for position in self._positions(item))
+
+
+class ScreenedSet:
+    """A large set of strings kept exactly in a redis set, with only a Bloom filter of it held in process.
+    Candidates are screened against the filter first, and only the few that might be members are checked exactly
+    with a single SMISMEMBER, so answers are always exact while the process holds about a byte per member instead of
+    a Python string. Removed members stay in the filter until it is next rebuilt, which only costs an extra exact
+    check. The filter is sized with headroom for growth when it is rebuilt, which load and replace both do."""
+
+    headroom = 1.5
+    chunk_size = 10_000
+
+    def __init__(self, redis, key: str, fp_rate: float = 0.01) -> None:
+        self.redis = redis
+        self.key = key
+        self.fp_rate = fp_rate
+        self.bloom = BloomFilter(0, fp_rate)
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        return self.bloom.nbytes
+
+    def _fresh_filter(self, size: int) -> BloomFilter:
+        return BloomFilter(int(size * self.headroom), self.fp_rate)
+
+    def rebuild(self, members: Collection[str]) -> None:
+        """Rebuilds the filter from members, which must match the redis set, without writing anything."""
+        self.bloom = BloomFilter.from_items(members, int(len(members) * self.headroom), self.fp_rate)
+        self.size = len(members)
+
+    async def load(self) -> int:
+        """Builds the filter from the redis set, streaming it rather than holding it all at once.
+        Returns how many members there are."""
+        bloom = self._fresh_filter(await self.redis.scard(self.key))
+        async for member in self.redis.sscan_iter(self.key, count=self.chunk_size):
+            bloom.add(member)
+        self.bloom = bloom
+        self.size = len(bloom)
+        return self.size
+
+    async def replace(self, members: Iterable[str]) -> int:
+        """Replaces the contents with members, writing them to a temporary key in chunks and renaming it over the
+        old set so readers never see a partial set. Returns how many members there are."""
+        members = set(members)
+        tmp = f"{self.key}:tmp"
+        tr = self.redis.pipeline()
+        tr.delete(tmp)
+        chunk: list[str] = []
+        for member in members:
+            chunk.append(member)
+            if len(chunk) >= self.chunk_size:
+                tr.sadd(tmp, *chunk)
+                chunk = []
+        if chunk:
+            tr.sadd(tmp, *chunk)
+        if members:
+            tr.rename(tmp, self.key)
+        else:
+            tr.delete(self.key)
+        await tr.execute()
+        self.rebuild(members)
+        return self.size
+
+    async def add(self, members: Iterable[str]) -> None:
+        members = list(members)
+        if not members:
+            return
+        self.size += await self.redis.sadd(self.key, *members)
+        for member in members:
+            self.bloom.add(member)
+
+    async def remove(self, members: Iterable[str]) -> None:
+        members = list(members)
+        if members:
+            self.size -= await self.redis.srem(self.key, *members)
+
+    async def contains_many(self, candidates: Iterable[str]) -> list[bool]:
+        """Whether each candidate is a member, in order."""
+        candidates = list(candidates)
+        maybe = [candidate for candidate in candidates if candidate in self.bloom]
+        if not maybe:
+            return [False] * len(candidates)
+        confirmed = {
+            candidate for candidate, found in zip(maybe, await self.redis.smismember(self.key, maybe)) if found
+        }
+        return [candidate in confirmed for candidate in candidates]
+
+    async def exclude(self, candidates: Iterable[str]) -> list[str]:
+        """The candidates which are not members, in order."""
+        candidates = list(candidates)
+        found = await self.contains_many(candidates)
+        return [candidate for candidate, member in zip(candidates, found) if not member]
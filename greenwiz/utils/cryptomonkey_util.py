@@ -1,7 +1,14 @@
 import discord
 
+from utils.role_cache import member_roles
 from utils.settings import CM_GUID, BANANO_GUID, CRYPTOMONKEY_DROP_ADMINS
 
+# monkeyprinter, and the other cryptomonKeys roles allowed to drop cards
+NIFTY_ROLE_IDS = frozenset({733313560247140422, 800575369090039838, 733313838375632979})
+MONKEYPRINTER_ROLE_IDS = frozenset({733313560247140422})
+# Banano Jungle Juntas
+JUNGLE_JUNTA_ROLE_IDS = frozenset({416789711034777600})
+
 
 def has_nifty(member: discord.Member, bot):
     """Niftys can drop some cards every day."""
@@ -16,16 +23,12 @@ def has_nifty(member: discord.Member, bot):
         417522436792254475,  # anemone
     ]:
         return True
-    for role in _member.roles:
-        if role.id in [733313560247140422, 800575369090039838, 733313838375632979]:
-            return True
+    if member_roles.has_any(_member, NIFTY_ROLE_IDS):
+        return True
 
     # Also let banano Jungle Juntas drop like niftys
     _member = bot.get_guild(BANANO_GUID).get_member(_member.id)
-    for role in _member.roles:
-        if role.id in [416789711034777600]:
-            return True
-    return False
+    return member_roles.has_any(_member, JUNGLE_JUNTA_ROLE_IDS)
 
 
 # Checks if a user has nifty or monkeyprinter roles specifically
@@ -54,11 +57,7 @@ def monkeyprinter():
             return False
         if member.id == 118923557265735680:  # Special override for Kron
             return True
-        for role in member.roles:
-            if role.id in [733313560247140422]:
-                return True
-        return False
-        # monkeyprinter is 733313560247140422:
+        return member_roles.has_any(member, MONKEYPRINTER_ROLE_IDS)
 
     return user_auth_check
 
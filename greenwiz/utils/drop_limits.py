@@ -0,0 +1,82 @@
+import json
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Optional
+
+from utils.redis_scripts import scripts_for
+
+
+class DropLimits:
+    """Counts of the limited drops each user has given today, kept in redis so that checking and counting a drop is
+    one atomic call. Today's counts are a hash which expires at the next UTC midnight; the total given each day is
+    kept separately for drop rate estimates."""
+
+    totals_key = "drops:daily_totals"
+    imported_key = "drops:imported"
+
+    def __init__(self, redis) -> None:
+        self.redis = redis
+        self.scripts = scripts_for(redis)
+
+    @staticmethod
+    def _today() -> date:
+        return datetime.now(timezone.utc).date()
+
+    @staticmethod
+    def day_key(day: date) -> str:
+        return f"drops:given:{day}"
+
+    @staticmethod
+    def _rollover(day: date) -> int:
+        return int(datetime.combine(day + timedelta(days=1), time.min, tzinfo=timezone.utc).timestamp())
+
+    async def _claim(self, user_id: int, amount: int, limit: Optional[int], day: date) -> tuple[bool, int]:
+        ok, used = await self.scripts.claim_drops(
+            keys=[self.day_key(day), self.totals_key],
+            args=[str(user_id), amount, "" if limit is None else limit, self._rollover(day), str(day)],
+        )
+        return bool(ok), int(used)
+
+    async def claim(self, user_id: int, limit: int, amount: int = 1) -> tuple[bool, int, date]:
+        """Counts amount drops given by a user today, unless that would take them over limit.
+        Returns whether the drops were counted, the number the user has given today, and the day they were counted
+        on, which release needs."""
+        day = self._today()
+        ok, used = await self._claim(user_id, amount, limit, day)
+        return ok, used, day
+
+    async def record(self, user_id: int, amount: int = 1) -> int:
+        """Counts drops given by a user today regardless of their limit. Returns the number given today."""
+        return (await self._claim(user_id, amount, None, self._today()))[1]
+
+    async def release(self, user_id: int, day: date, amount: int = 1) -> int:
+        """Gives back drops claimed on day which couldn't be sent, even if that day has since ended.
+        Returns the number still counted for that day."""
+        return (await self._claim(user_id, -amount, None, day))[1]
+
+    async def given_today(self, user_id: int) -> int:
+        return int(await self.redis.hget(self.day_key(self._today()), str(user_id)) or 0)
+
+    async def average_per_day(self, days: int = 7) -> float:
+        """The average number of limited drops given out per day over the last few days, including today."""
+        start = self._today()
+        dates = [str(start - timedelta(days=offset)) for offset in range(days)]
+        totals = await self.redis.hmget(self.totals_key, dates)
+        return sum(int(total or 0) for total in totals) / days
+
+    async def import_json(self, usage: dict[str, dict[str, Any]]) -> bool:
+        """Adds the counts from the old card_sends.json file, of drops given by user id by day, to those in redis.
+        Only the first import does anything; returns whether this was it. The counts and the marker saying they were
+        imported are written in one atomic call, so an import that fails can be retried."""
+        today = self._today()
+        totals = {day: sum(int(count) for count in users.values()) for day, users in usage.items()}
+        given = {user_id: int(count) for user_id, count in usage.get(str(today), {}).items()}
+        imported = await self.scripts.import_drops(
+            keys=[self.imported_key, self.totals_key, self.day_key(today)],
+            args=[
+                str(today),
+                json.dumps({day: total for day, total in totals.items() if total}),
+                json.dumps({user_id: count for user_id, count in given.items() if count}),
+                self._rollover(today),
+            ],
+        )
+        return bool(imported)
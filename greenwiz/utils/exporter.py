@@ -0,0 +1,145 @@
+import asyncio
+import csv
+import gzip
+import json
+import os
+import tempfile
+from typing import IO, Any, AsyncIterable, Iterable, Optional, Union
+
+import discord
+
+FORMATS = ("lines", "csv", "ndjson", "json", "commas")
+# Formats whose rows are joined by a separator rather than each ending a line, with what goes around them.
+JOINED = {"json": (",\n", "[\n", "\n]\n"), "commas": (",", "", "")}
+
+
+class StreamingExporter:
+    """Writes results to a temporary file in batches from a background thread, so that large exports neither block
+    the event loop nor need the whole output in memory at once. Use as an async context manager: the file is
+    deleted when the block exits, whether or not it succeeded, so send it from inside the block.
+
+        async with StreamingExporter("addresses.txt") as export:
+            await export.write_all(addresses)
+            await ctx.send(file=await export.discord_file())
+
+    Rows are written as str(row) one per line, as csv (dict rows use fields as the header), as ndjson, as a json
+    array, or as str(row) separated by commas on a single line."""
+
+    def __init__(
+        self,
+        filename: str,
+        fmt: str = "lines",
+        compress: bool = False,
+        fields: Optional[list[str]] = None,
+        directory: str = "res/tmp",
+        batch_size: int = 5000,
+    ) -> None:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format {fmt}, use one of {', '.join(FORMATS)}.")
+        self.filename = f"{filename}.gz" if compress else filename
+        self.fmt = fmt
+        self.compress = compress
+        self.fields = fields
+        self.directory = directory
+        self.batch_size = batch_size
+        self.path: Optional[str] = None
+        self.rows_written = 0
+        self._file: Optional[IO[str]] = None
+        self._csv: Any = None
+        self._buffer: list[Any] = []
+        # Whether a joined format needs a separator before the next row.
+        self._joined_rows = False
+
+    async def __aenter__(self) -> "StreamingExporter":
+        await asyncio.to_thread(self._open)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                await self.close()
+            elif self._file is not None:
+                await asyncio.to_thread(self._file.close)
+        finally:
+            self._file = None
+            if self.path is not None:
+                await asyncio.to_thread(self._remove)
+
+    def _open(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix="export_", suffix=f"_{self.filename}", dir=self.directory)
+        if self.compress:
+            os.close(fd)
+            self._file = gzip.open(self.path, "wt", encoding="utf-8", newline="")
+        else:
+            self._file = open(fd, "w", encoding="utf-8", newline="")
+        if self.fmt in JOINED:
+            self._file.write(JOINED[self.fmt][1])
+        if self.fmt == "csv":
+            if self.fields is not None:
+                self._csv = csv.DictWriter(self._file, fieldnames=self.fields, extrasaction="ignore")
+                self._csv.writeheader()
+            else:
+                self._csv = csv.writer(self._file)
+
+    def _remove(self) -> None:
+        try:
+            os.remove(self.path)  # type: ignore[arg-type]
+        except FileNotFoundError:
+            pass
+
+    def _write_batch(self, rows: list[Any]) -> None:
+        assert self._file is not None
+        if self.fmt == "csv":
+            if self.fields is None:
+                rows = [row if isinstance(row, (list, tuple)) else [row] for row in rows]
+            self._csv.writerows(rows)
+        elif self.fmt == "ndjson":
+            self._file.writelines(json.dumps(row) + "\n" for row in rows)
+        elif self.fmt in JOINED:
+            separator = JOINED[self.fmt][0]
+            text = separator.join(json.dumps(row) if self.fmt == "json" else str(row) for row in rows)
+            self._file.write((separator if self._joined_rows else "") + text)
+            self._joined_rows = True
+        else:
+            self._file.writelines(f"{row}\n" for row in rows)
+
+    async def write(self, row: Any) -> None:
+        """Queues a row, writing the queued rows out once a batch is full."""
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    async def write_all(self, rows: Union[Iterable[Any], AsyncIterable[Any]]) -> int:
+        """Writes every row of an iterable or async iterable. Returns how many rows have been written in total."""
+        if hasattr(rows, "__aiter__"):
+            async for row in rows:  # type: ignore[union-attr]
+                await self.write(row)
+        else:
+            for row in rows:  # type: ignore[union-attr]
+                await self.write(row)
+        await self.flush()
+        return self.rows_written
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+        rows, self._buffer = self._buffer, []
+        await asyncio.to_thread(self._write_batch, rows)
+        self.rows_written += len(rows)
+
+    async def close(self) -> None:
+        """Writes any queued rows and closes the file. The file is kept until the context manager exits."""
+        if self._file is None:
+            return
+        await self.flush()
+        if self.fmt in JOINED:
+            await asyncio.to_thread(self._file.write, JOINED[self.fmt][2])
+        await asyncio.to_thread(self._file.close)
+        self._file = None
+
+    async def discord_file(self) -> discord.File:
+        """Finishes the export and returns it as an attachment."""
+        await self.close()
+        assert self.path is not None
+        return discord.File(self.path, filename=self.filename)
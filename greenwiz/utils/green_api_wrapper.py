@@ -1,16 +1,27 @@
-from typing import Set, Any, Optional, Union, Protocol
+import asyncio
+from typing import Set, Any, Optional, Union, Callable, Awaitable, Iterable, AbstractSet, AsyncIterator
 
 import aiohttp.web_exceptions
 
+from utils.async_cache import AsyncTTLCache
+from utils.blacklist_mirror import BlacklistMirror
 from utils.exceptions import InvalidInput
+from utils.json_stream import JsonStream
+from utils.miner_table import MinerTable
 from utils.settings import (
     BLACKLIST_GET,
     AW_BLACKLIST,
+    AW_BLACKLIST_CACHE_TTL,
+    AW_BLACKLIST_CONCURRENCY,
     BLACKLIST_AUTH_CODE,
     AW_BLACKLIST_AUTH_KEY,
     CMSTATS_SERVER,
+    GREEN_API_TIMEOUT,
+    GREEN_API_STREAM_TIMEOUT,
+    BLACKLIST_BULK_CONCURRENCY,
+    MINER_FETCH_CONCURRENCY,
 )
-from utils.util import utcnow
+from utils.util import log, utcnow
 
 
 class GreenApiException(Exception):
@@ -20,8 +31,21 @@ class GreenApiException(Exception):
     pass
 
 
-class ReprProtocol(Protocol):
-    def __repr__(self) -> str: ...
+# Called with (done, total) as a bulk operation progresses.
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+# Errors that may be worth retrying: the server was unreachable, timed out or returned an error status. Of the error
+# statuses, only server errors and rate limiting are retried, see is_retryable.
+RETRYABLE_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+# Bytes read from a streamed response at a time.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a request that failed with error might succeed if repeated. A client error status such as a bad
+    request or a refused auth code will be returned again, so only server errors and 429 are retried."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500 or error.status == 429
+    return isinstance(error, RETRYABLE_ERRORS)
 
 
 class GreenApi:
@@ -30,35 +54,94 @@ class GreenApi:
         self.limit = 1000
         self.server = server
         self.url_base = f"http://{self.server}"
+        # Every request is bounded by timeout. Streamed responses may take longer in total, but not stall.
+        self.timeout = aiohttp.ClientTimeout(total=GREEN_API_TIMEOUT)
+        self.stream_timeout = aiohttp.ClientTimeout(total=GREEN_API_STREAM_TIMEOUT, sock_read=GREEN_API_TIMEOUT)
         self.cached_blacklist: Set[str] = set()
-        self.cached_awblacklist: Set[str] = set()
+        self.awblacklist_cache: AsyncTTLCache[str, frozenset[str]] = AsyncTTLCache(
+            ttl=AW_BLACKLIST_CACHE_TTL, maxsize=1, max_stale=5 * AW_BLACKLIST_CACHE_TTL, name="AW blacklist"
+        )
         self.cache_updated = 0
+        # When set and loaded, get_blacklist is answered from the mirror instead of the 30 second cache.
+        self.mirror: Optional[BlacklistMirror] = None
 
     async def all_miners_for_cycle(
-        self, cycle: Optional[int] = None
+        self,
+        cycle: Optional[int] = None,
+        concurrency: int = MINER_FETCH_CONCURRENCY,
+        max_attempts: int = 3,
+    ) -> list[dict[str, Any]]:
+        """Fetches every miner in a cycle, excluding blacklisted ones, sorted by rank. See miners_for_cycle."""
+        miners = await self.miners_for_cycle(cycle, concurrency, max_attempts)
+        result_list: list[dict[str, Any]] = sorted(miners, key=lambda x: x["rank"])  # type: ignore[no-any-return]
+        return result_list
+
+    async def miner_table_for_cycle(
+        self,
+        cycle: Optional[int] = None,
+        concurrency: int = MINER_FETCH_CONCURRENCY,
+        max_attempts: int = 3,
+    ) -> MinerTable:
+        """Fetches every miner in a cycle, excluding blacklisted ones, as a MinerTable in no particular order.
+        Use its top method rather than sorting when only the best few are wanted."""
+        return MinerTable.from_rows(await self.miners_for_cycle(cycle, concurrency, max_attempts))
+
+    async def miners_for_cycle(
+        self,
+        cycle: Optional[int] = None,
+        concurrency: int = MINER_FETCH_CONCURRENCY,
+        max_attempts: int = 3,
     ) -> list[dict[str, Any]]:
+        """Fetches every miner in a cycle, excluding blacklisted ones, in no particular order.
+        Page 1 pins the snapshot (its last_update), the remaining pages are fetched concurrently, and the pages are
+        checked against the pinned snapshot once at the end. If the stats were updated meanwhile, page 1 is fetched
+        again to pin the new snapshot and only the pages from an older one are fetched again. After max_attempts
+        the most recent pages are used even if they still span two snapshots, so an active cycle can't keep the
+        crawl going forever."""
         assert cycle is not None, "Cycle is a required field."
-        page: int = 1
-        responses: int = 1000
-        time: str = ""
+        pages: dict[int, dict[str, Any]] = {}
+        for attempt in range(1, max_attempts + 1):
+            pages[1] = await self.miner(cycle=cycle, page=1)
+            pinned = pages[1]["last_update"]
+            pages = {page: resp for page, resp in pages.items() if resp["last_update"] == pinned}
+            await self._fetch_miner_pages(cycle, pages, concurrency)
+            if all(resp["last_update"] == pinned for resp in pages.values()):
+                break
+            if attempt == max_attempts:
+                log(
+                    f"Miner stats for cycle {cycle} kept changing during {max_attempts} attempts to fetch them, "
+                    f"using the most recent pages.",
+                    "WARN",
+                )
         users: dict[str, Any] = dict()
-        while responses >= 1000:
-            resp = await self.miner(cycle=cycle, page=page)
-            responses = resp["count"]
-            if time == "":
-                time = resp["last_update"]
-            elif time != resp["last_update"]:
-                # Start again
-                time = resp["last_update"]
-                page = 0
-                users = dict()
-            page += 1
-            users.update({item["user"]: item for item in resp["data"]})
+        for page in sorted(pages):
+            users.update({item["user"]: item for item in pages[page]["data"]})
 
-        blacklist = await self.get_blacklist()
-        miners = [i for i in users.values() if i["user"] not in blacklist]
-        result_list: list[dict[str, Any]] = sorted(miners, key=lambda x: x["rank"])  # type: ignore[no-any-return]
-        return result_list
+        allowed = set(await self.exclude_blacklisted(users))
+        return [i for i in users.values() if i["user"] in allowed]
+
+    async def _fetch_miner_pages(self, cycle: int, pages: dict[int, dict[str, Any]], concurrency: int) -> None:
+        """Fills in pages with every page of the cycle not already in it, up to the first short page. The number of
+        pages isn't known up front, so pages past the highest one fetched are requested concurrency at a time."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(page: int) -> None:
+            async with semaphore:
+                pages[page] = await self.miner(cycle=cycle, page=page)
+
+        while True:
+            last = min((page for page, resp in pages.items() if resp["count"] < self.limit), default=None)
+            if last is None:
+                highest = max(pages)
+                missing = [page for page in range(2, highest) if page not in pages]
+                missing += range(highest + 1, highest + 1 + concurrency)
+            else:
+                missing = [page for page in range(2, last) if page not in pages]
+                if not missing:
+                    for page in [page for page in pages if page > last]:
+                        del pages[page]
+                    return
+            await asyncio.gather(*(fetch(page) for page in missing))
 
     async def miner(
         self, cycle: Optional[int] = None, page: int = 1, user: str = ""
@@ -68,8 +151,9 @@ class GreenApi:
             url = f"{self.url_base}/miner/{cycle}?page={page}"
         else:
             url = f"{self.url_base}/miner/{cycle}?page={page}&user={user}"
-        resp: dict[str, Any] = await self.get_resp(url)
-        return resp
+        meta: dict[str, Any] = {}
+        data = [item async for item in self.stream_resp(url, key="data", meta=meta)]
+        return {**meta, "data": data}
 
     async def get_resp(
         self,
@@ -81,64 +165,206 @@ class GreenApi:
         if headers is None:
             headers = dict()
         if _type == "get":
-            resp = await self.session.get(url, headers=headers)
+            resp = await self.session.get(url, headers=headers, timeout=self.timeout)
         elif _type == "post":
-            resp = await self.session.post(url, data=data, headers=headers)
+            resp = await self.session.post(url, data=data, headers=headers, timeout=self.timeout)
         elif _type == "delete":
-            resp = await self.session.delete(url, data=data, headers=headers)
+            resp = await self.session.delete(url, data=data, headers=headers, timeout=self.timeout)
         elif _type == "put":
-            resp = await self.session.put(url, data=data, headers=headers)
+            resp = await self.session.put(url, data=data, headers=headers, timeout=self.timeout)
         resp.raise_for_status()
         js = await resp.json()
         if hasattr(js, "get") and js.get("error"):
             raise GreenApiException(js.get("error"))
         return js
 
-    async def blacklist_add(self, address: str) -> dict[str, Any]:
-        """Add a wax address to the blacklist"""
+    async def stream_resp(
+        self,
+        url: str,
+        key: Optional[str] = None,
+        meta: Optional[dict[str, Any]] = None,
+        headers: Optional[dict[str, str]] = None,
+    ) -> AsyncIterator[Any]:
+        """Like get_resp, but yields the items of a list in the response as they are parsed instead of loading the
+        whole response first. The list is the response itself, or its member named key; the response's other
+        members are put in meta once the list has been read. Raises GreenApiException if the response is an error
+        or isn't shaped as expected."""
+        async with self.session.get(url, headers=headers or {}, timeout=self.stream_timeout) as resp:
+            resp.raise_for_status()
+            stream = JsonStream(resp.content.iter_chunked(STREAM_CHUNK_SIZE), key)
+            try:
+                async for item in stream:
+                    yield item
+            except ValueError as e:
+                raise GreenApiException(f"Malformed response from {url}: {e}")
+        if stream.meta.get("error"):
+            raise GreenApiException(stream.meta["error"])
+        if not stream.found:
+            raise GreenApiException(f"Unexpected response from {url}: {str(stream.meta)[:200]}")
+        if meta is not None:
+            meta.update(stream.meta)
+
+    async def _blacklist_request(self, action: str, address: str) -> dict[str, Any]:
+        """Asks the blacklist server to add or remove an address, without updating the mirror."""
         if "<" in address or ">" in address or "!" in address or "@" in address:
             raise InvalidInput(f"{address} is not a valid wax address.")
 
         try:
             resp: dict[str, Any] = await self.get_resp(
-                f"{BLACKLIST_GET}add?code={BLACKLIST_AUTH_CODE}&wallet={address}"
+                f"{BLACKLIST_GET}{action}?code={BLACKLIST_AUTH_CODE}&wallet={address}"
             )
         except GreenApiException as e:
             return {"success": False, "exception": repr(e)}
         self.cache_updated = 0
         return resp
 
+    async def _mirror_change(self, action: str, addresses: list[str], results: list[dict[str, Any]]) -> None:
+        """Applies the successful changes to the blacklist mirror, if there is one."""
+        if self.mirror is None:
+            return
+        changed = [address for address, result in zip(addresses, results) if result.get("success")]
+        if action == "add":
+            await self.mirror.add(changed)
+        else:
+            await self.mirror.remove(changed)
+
+    async def blacklist_add(self, address: str) -> dict[str, Any]:
+        """Add a wax address to the blacklist"""
+        resp = await self._blacklist_request("add", address)
+        await self._mirror_change("add", [address], [resp])
+        return resp
+
     async def blacklist_remove(self, address: str) -> dict[str, Any]:
         """Remove an address from the blacklist"""
-        if "<" in address or ">" in address or "!" in address or "@" in address:
-            raise InvalidInput(f"{address} is not a valid wax address.")
+        resp = await self._blacklist_request("remove", address)
+        await self._mirror_change("remove", [address], [resp])
+        return resp
 
+    async def _with_retries(
+        self, call: Callable[[], Awaitable[dict[str, Any]]], retries: int, backoff: float
+    ) -> dict[str, Any]:
+        """Calls call, retrying connection errors, timeouts, server error statuses and 429s with exponential backoff.
+        Returns a failed result rather than raising once out of retries, or on any other error status."""
+        attempt = 0
+        while True:
+            try:
+                return await call()
+            except RETRYABLE_ERRORS as e:
+                if attempt >= retries or not is_retryable(e):
+                    return {"success": False, "exception": f"{type(e).__name__}: {e}"}
+            except GreenApiException as e:
+                return {"success": False, "exception": repr(e)}
+            except InvalidInput as e:
+                return {"success": False, "exception": str(e)}
+            await asyncio.sleep(backoff * 2**attempt)
+            attempt += 1
+
+    @staticmethod
+    async def _report(progress: Optional[ProgressCallback], done: int, total: int) -> None:
+        """Calls progress, if given. It only reports on the operation, so its failures are logged rather than
+        aborting it."""
+        if progress is None:
+            return
         try:
-            resp: dict[str, Any] = await self.get_resp(
-                f"{BLACKLIST_GET}remove?code={BLACKLIST_AUTH_CODE}&wallet={address}"
-            )
-        except GreenApiException as e:
-            return {"success": False, "exception": repr(e)}
-        self.cache_updated = 0
-        return resp
+            await progress(done, total)
+        except Exception as e:
+            log(f"Progress callback failed at {done}/{total}: {type(e).__name__}: {e}", "WARN")
+
+    async def _bulk(
+        self,
+        operation: Callable[[str], Awaitable[dict[str, Any]]],
+        addresses: list[str],
+        concurrency: int,
+        retries: int,
+        backoff: float,
+        progress: Optional[ProgressCallback],
+    ) -> list[dict[str, Any]]:
+        """Applies operation to every address, at most concurrency at a time. Results are in the same order as
+        addresses. progress is called about ten times over the run, and once at the end."""
+        semaphore = asyncio.Semaphore(concurrency)
+        total = len(addresses)
+        report_every = max(1, total // 10)
+        done = 0
+
+        async def run_one(address: str) -> dict[str, Any]:
+            nonlocal done
+            async with semaphore:
+                result = await self._with_retries(lambda: operation(address), retries, backoff)
+            done += 1
+            if done % report_every == 0 and done < total:
+                await self._report(progress, done, total)
+            return result
+
+        results = await asyncio.gather(*[run_one(address) for address in addresses])
+        await self._report(progress, total, total)
+        return list(results)
+
+    async def blacklist_add_many(
+        self,
+        addresses: Iterable[str],
+        concurrency: int = BLACKLIST_BULK_CONCURRENCY,
+        retries: int = 2,
+        backoff: float = 0.5,
+        progress: Optional[ProgressCallback] = None,
+    ) -> list[dict[str, Any]]:
+        """Adds many addresses to the blacklist, with at most concurrency requests in flight. Returns one
+        blacklist_add style result per address, in order."""
+        addresses = list(addresses)
+        results = await self._bulk(
+            lambda address: self._blacklist_request("add", address),
+            addresses,
+            concurrency,
+            retries,
+            backoff,
+            progress,
+        )
+        await self._mirror_change("add", addresses, results)
+        return results
+
+    async def blacklist_remove_many(
+        self,
+        addresses: Iterable[str],
+        concurrency: int = BLACKLIST_BULK_CONCURRENCY,
+        retries: int = 2,
+        backoff: float = 0.5,
+        progress: Optional[ProgressCallback] = None,
+    ) -> list[dict[str, Any]]:
+        """Removes many addresses from the blacklist, with at most concurrency requests in flight. Returns one
+        blacklist_remove style result per address, in order."""
+        addresses = list(addresses)
+        results = await self._bulk(
+            lambda address: self._blacklist_request("remove", address),
+            addresses,
+            concurrency,
+            retries,
+            backoff,
+            progress,
+        )
+        await self._mirror_change("remove", addresses, results)
+        return results
+
+    async def fetch_blacklist(self) -> Set[str]:
+        """Fetch the whole blacklist from source, bypassing any caching."""
+        return {i["wallet"].replace(" ", "") async for i in self.stream_resp(BLACKLIST_GET)}
 
     async def get_blacklist(
         self, force: bool = False, expiry: float = 30.0
-    ) -> Set[str]:
+    ) -> AbstractSet[str]:
         """Fetch the blacklist from source. Cache for a minute, but cache is rendered out of date by a call to
-        blacklist_add or blacklist_remove."""
+        blacklist_add or blacklist_remove. If a loaded mirror is attached, it is returned instead unless forced.
+        A compact mirror doesn't hold the blacklist in process, so prefer exclude_blacklisted for filtering."""
+        if not force and self.mirror is not None and self.mirror.loaded and not self.mirror.compact:
+            return self.mirror.members
 
         if force or utcnow().timestamp() - self.cache_updated > expiry:
             # Refresh cached_blacklist
             try:
-                results = await self.get_resp(BLACKLIST_GET)
+                results = await self.fetch_blacklist()
 
-                if results is not None and len(results) > 0:
-                    self.cached_blacklist = set(
-                        [i["wallet"].replace(" ", "") for i in results]
-                    )
+                if len(results) > 0:
+                    self.cached_blacklist = results
                 self.cache_updated = int(utcnow().timestamp())
-            except aiohttp.web_exceptions.HTTPError as e:
+            except (aiohttp.web_exceptions.HTTPError, GreenApiException, *RETRYABLE_ERRORS) as e:
                 print(
                     f"Encountered an error attempting to fetch the monKeyconnect blacklist, returning cached "
                     f"blacklist. {e}"
@@ -146,6 +372,14 @@ class GreenApi:
 
         return self.cached_blacklist
 
+    async def exclude_blacklisted(self, addresses: Iterable[str]) -> list[str]:
+        """The addresses which aren't blacklisted, in order. Answered from the mirror if it is loaded, which is exact
+        and memory light even when the mirror is compact."""
+        if self.mirror is not None and self.mirror.loaded:
+            return await self.mirror.exclude(addresses)
+        blacklist = await self.get_blacklist()
+        return [address for address in addresses if address not in blacklist]
+
     async def awblacklist_add(self, address: str) -> dict[str, Any]:
         """Add a wax address to the blacklist"""
         if "<" in address or ">" in address or "!" in address or "@" in address:
@@ -163,7 +397,7 @@ class GreenApi:
             )
         except GreenApiException as e:
             return {"success": False, "exception": repr(e)}
-        self.awcache_updated = 0
+        self.awblacklist_cache.expire()
         return resp
 
     async def awblacklist_remove(self, address: str) -> dict[str, Any]:
@@ -183,45 +417,56 @@ class GreenApi:
             )
         except GreenApiException as e:
             return {"success": False, "exception": repr(e)}
-        self.awcache_updated = 0
+        self.awblacklist_cache.expire()
         return resp
 
-    async def awget_blacklist(
-        self, force: bool = False, expiry: float = 60.0
-    ) -> Set[str]:
-        """Fetch the blacklist from source. Cache for a minute, but cache is rendered out of date by a call to
-        awblacklist_add or awblacklist_remove."""
-        if not force and utcnow().timestamp() - self.awcache_updated < expiry:
-            return self.cached_awblacklist
-        # Refresh cached_blacklist
-        limit: int = 1000
-        offset: int = 0
-        res = set()
-
-        def err(msg: ReprProtocol) -> set[str]:
+    async def _awblacklist_page(self, offset: int, limit: int) -> tuple[list[str], dict[str, Any]]:
+        """Returns the wallets on a page of the AW blacklist, and the response's other members."""
+        meta: dict[str, Any] = {}
+        url = f"{AW_BLACKLIST}list?limit={limit}&offset={offset}"
+        wallets = [i["wallet"].replace(" ", "") async for i in self.stream_resp(url, key="data", meta=meta)]
+        return wallets, meta
+
+    async def fetch_awblacklist(
+        self, concurrency: int = AW_BLACKLIST_CONCURRENCY, limit: int = 1000
+    ) -> frozenset[str]:
+        """Fetch the whole AW blacklist from source, bypassing the cache. The first page tells us the total, if the
+        server reports one, and the remaining pages are then fetched with at most concurrency requests in flight.
+        Without a total, pages are requested concurrency at a time until one comes back short."""
+        semaphore = asyncio.Semaphore(concurrency)
+        wallets: set[str] = set()
+
+        async def fetch(offset: int) -> int:
+            async with semaphore:
+                page, _ = await self._awblacklist_page(offset, limit)
+            wallets.update(page)
+            return len(page)
+
+        first, meta = await self._awblacklist_page(0, limit)
+        wallets.update(first)
+        total = meta.get("total")
+        if len(first) < limit:
+            return frozenset(wallets)
+        if isinstance(total, int):
+            await asyncio.gather(*(fetch(offset) for offset in range(limit, total, limit)))
+            return frozenset(wallets)
+        offset = limit
+        while True:
+            offsets = range(offset, offset + concurrency * limit, limit)
+            counts = await asyncio.gather(*(fetch(offset) for offset in offsets))
+            if min(counts) < limit:
+                return frozenset(wallets)
+            offset += concurrency * limit
+
+    async def awget_blacklist(self, force: bool = False) -> AbstractSet[str]:
+        """Fetch the AW blacklist, cached for AW_BLACKLIST_CACHE_TTL seconds. awblacklist_add and
+        awblacklist_remove mark the cached list stale, and concurrent callers share a single fetch. A stale list is
+        served while it is refreshed in the background. If it can't be fetched, the last list is returned."""
+        try:
+            return await self.awblacklist_cache.get("aw", self.fetch_awblacklist, force=force)
+        except (GreenApiException, *RETRYABLE_ERRORS) as e:
             print(
                 f"Encountered an error attempting to fetch the AW blacklist, returning cached "
-                f"blacklist. Result: {msg}"
+                f"blacklist. {e!r}"
             )
-            return self.cached_awblacklist
-
-        while True:
-            results: Optional[list[dict[str, Any]]] = None
-            try:
-                response: dict[str, list[dict[str, Any]]] = await self.get_resp(
-                    f"{AW_BLACKLIST}list?limit={limit}&offset={offset}"
-                )
-                if results is None or not hasattr(results, "data"):
-                    return err(str(results))
-                results = response["data"]
-                if results is not None and len(results) > 0:
-                    res |= set([i["wallet"].replace(" ", "") for i in results])
-            except aiohttp.web_exceptions.HTTPError as e:
-                return err(e)
-            if not results:
-                return err("")
-            if len(results) < limit:
-                self.cache_updated = int(utcnow().timestamp())
-                self.cached_awblacklist = res
-                return self.cached_awblacklist
-            offset += limit
+            return self.awblacklist_cache.peek("aw", frozenset()) or frozenset()
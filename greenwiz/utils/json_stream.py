@@ -0,0 +1,111 @@
+import codecs
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Optional
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_CONTINUES = ".eE+-"
+_decoder = json.JSONDecoder()
+
+
+def _is_number(value: Any) -> bool:
+    return type(value) in (int, float)
+
+
+class JsonStream:
+    """Parses a JSON document incrementally from chunks of bytes, yielding the items of one array as soon as each is
+    complete, so that a large list never has to be held as text or as a whole parsed list.
+
+    With a key, the document is an object and the array is its member named key; the object's other members are
+    collected in meta, which is complete once iteration finishes, and found tells whether the key was there.
+    Without a key, the document is the array, or an object whose members all go in meta, such as an error.
+    Raises ValueError if the document isn't shaped like that, and json.JSONDecodeError if it isn't valid JSON."""
+
+    def __init__(self, chunks: AsyncIterable[bytes], key: Optional[str] = None) -> None:
+        self._chunks = chunks.__aiter__()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.key = key
+        self.meta: dict[str, Any] = {}
+        self.found = False
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    async def _fill(self) -> bool:
+        """Reads another chunk into the buffer, discarding what has been parsed. Returns False at the end."""
+        if self._eof:
+            return False
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self._eof = True
+            self._buffer += self._utf8.decode(b"", final=True)
+            return False
+        self._buffer += self._utf8.decode(chunk)
+        return True
+
+    async def _peek(self) -> str:
+        """Skips whitespace and returns the next character, or "" at the end."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not await self._fill():
+                return ""
+
+    async def _expect(self, chars: str) -> str:
+        char = await self._peek()
+        if char == "" or char not in chars:
+            raise ValueError(f"Expected one of {chars!r} in the JSON stream, found {char or 'the end'!r}.")
+        self._pos += 1
+        return char
+
+    async def _value(self) -> Any:
+        await self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if await self._fill():
+                    continue
+                raise
+            # A number may continue in the next chunk: one running up to the end of the buffer, or one that was cut
+            # off just before its fraction or exponent, which raw_decode reads as a shorter number.
+            if _is_number(value) and (end == len(self._buffer) or self._buffer[end] in _NUMBER_CONTINUES):
+                if await self._fill():
+                    continue
+            self._pos = end
+            return value
+
+    async def _items(self) -> AsyncIterator[Any]:
+        await self._expect("[")
+        if await self._peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield await self._value()
+            if await self._expect(",]") == "]":
+                return
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        if self.key is None and await self._peek() != "{":
+            self.found = True
+            async for item in self._items():
+                yield item
+            return
+        await self._expect("{")
+        if await self._peek() == "}":
+            return
+        while True:
+            name = await self._value()
+            await self._expect(":")
+            if name == self.key:
+                self.found = True
+                async for item in self._items():
+                    yield item
+            else:
+                self.meta[name] = await self._value()
+            if await self._expect(",}") == "}":
+                return
@@ -1,129 +1,269 @@
 # ==================== Logic Parser =========================
-# Adapted from the simple logic parser at https://stackoverflow.com/a/2472414 to support logical operands on lists.
+# Compiles queries such as `1 and (2 or 3)`, `atleast 2 (4, 5, 6) and !7` into a tree once, then evaluates the tree
+# with set operations over the holders of each referenced template, or with bitwise operations over the bitmaps of a
+# HolderIndex.
 import asyncio
-from typing import Iterable, Union, Callable, Any
+import re
+from dataclasses import dataclass
+from typing import AbstractSet, Awaitable, Callable, Iterable, Optional, Union
 
 from aiohttp import ClientSession
+from bitarray import bitarray
+from bitarray.util import ones
+
 from utils.exceptions import InvalidInput, InvalidResponse
 from utils.util import log
+from wax_chain.holder_index import HolderIndex
 from wax_chain.wax_market_utils import get_owners
 
+# The words and symbols understood in queries. Operators are case insensitive and & | ! may be used instead of and,
+# or and not. Listed from loosest to tightest binding: or, and, not.
+OR_WORDS = {"or", "|", "||"}
+AND_WORDS = {"and", "&", "&&"}
+NOT_WORDS = {"not", "!"}
+AT_LEAST_WORDS = {"atleast"}
+TOKEN_RE = re.compile(r"\d+|&&?|\|\|?|!|\(|\)|,|[A-Za-z_]+|\S")
 
-def _and(l1: list[str], l2: list[str]) -> list[str]:
-    # return [i for i in l1 if i in l2]
-    return list(set(l1) & set(l2))
-
-
-def _or(l1: list[str], l2: list[str]) -> list[str]:
-    return list(set(l1 + l2))
-
-
-str_to_tokens: dict[str, Union[str, Callable[[list[str], list[str]], list[str]]]] = {
-    "and": _and,
-    "or": _or,
-    "(": "(",
-    ")": ")",
-}
+Holders = dict[int, frozenset[str]]
+Bitmaps = dict[int, bitarray]
 
 
-def create_token_lst(
-    s: str, tokens: dict[str, list[str]]
-) -> list[Union[str, Callable[[list[str], list[str]], list[str]], list[str]]]:
-    """
-    Turns a raw string and guideline tokens into a set of instruction symbols
-    """
-    str_to_token: dict[
-        str, Union[str, Callable[[list[str], list[str]], list[str]], list[str]]
-    ] = {
-        **str_to_tokens,
-        **tokens,
-    }  # The full set of symbols used in this case
-    s = s.replace("(", " ( ")
-    s = s.replace(")", " ) ")
+@dataclass(frozen=True)
+class Card:
+    template_id: int
 
-    return [str_to_token[it] for it in s.split()]
+    def evaluate(self, holders: Holders, universe: frozenset[str]) -> frozenset[str]:
+        return holders.get(self.template_id, frozenset())
 
+    def evaluate_bits(self, bitmaps: Bitmaps, universe: bitarray) -> bitarray:
+        return bitmaps[self.template_id]
 
-def find(
-    list_: Iterable[Any],
-    what: Union[str, Callable[[list[str], list[str]], list[str]]],
-    start: int = 0,
-) -> list[int]:
-    return [i for i, it in enumerate(list_) if it == what and i >= start]
-
-
-def parentheses(
-    token_list: list[Union[str, Callable[[list[str], list[str]], list[str]], list[str]]]
-) -> tuple[bool, int, int]:
-    """
-    Deals with parentheses.
-    :returns: (bool)parentheses_exist, left_paren_pos, right_paren_pos
-    """
-    left_list = find(token_list, "(")
-
-    if not left_list:
-        return False, -1, -1
 
-    left = left_list[-1]
+@dataclass(frozen=True)
+class Not:
+    operand: "Node"
+
+    def evaluate(self, holders: Holders, universe: frozenset[str]) -> frozenset[str]:
+        return universe - self.operand.evaluate(holders, universe)
+
+    def evaluate_bits(self, bitmaps: Bitmaps, universe: bitarray) -> bitarray:
+        return universe & ~self.operand.evaluate_bits(bitmaps, universe)
+
+
+@dataclass(frozen=True)
+class And:
+    operands: tuple["Node", ...]
+
+    def evaluate(self, holders: Holders, universe: frozenset[str]) -> frozenset[str]:
+        # a & !b is evaluated as a - b, so negations only need the universe when nothing positive is and-ed.
+        positive = [op.evaluate(holders, universe) for op in self.operands if not isinstance(op, Not)]
+        negative = [op.operand.evaluate(holders, universe) for op in self.operands if isinstance(op, Not)]
+        if positive:
+            positive.sort(key=len)
+            result = positive[0].intersection(*positive[1:])
+        else:
+            result = universe
+        return result.difference(*negative)
+
+    def evaluate_bits(self, bitmaps: Bitmaps, universe: bitarray) -> bitarray:
+        result = universe
+        for op in self.operands:
+            if isinstance(op, Not):
+                result = result & ~op.operand.evaluate_bits(bitmaps, universe)
+            else:
+                result = result & op.evaluate_bits(bitmaps, universe)
+        return result
+
+
+@dataclass(frozen=True)
+class Or:
+    operands: tuple["Node", ...]
+
+    def evaluate(self, holders: Holders, universe: frozenset[str]) -> frozenset[str]:
+        return frozenset().union(*(op.evaluate(holders, universe) for op in self.operands))
+
+    def evaluate_bits(self, bitmaps: Bitmaps, universe: bitarray) -> bitarray:
+        result = universe & ~universe
+        for op in self.operands:
+            result = result | op.evaluate_bits(bitmaps, universe)
+        return result
+
+
+@dataclass(frozen=True)
+class AtLeast:
+    k: int
+    operands: tuple["Node", ...]
+
+    def evaluate(self, holders: Holders, universe: frozenset[str]) -> frozenset[str]:
+        counts: dict[str, int] = {}
+        for op in self.operands:
+            for address in op.evaluate(holders, universe):
+                counts[address] = counts.get(address, 0) + 1
+        return frozenset(address for address, count in counts.items() if count >= self.k)
+
+    def evaluate_bits(self, bitmaps: Bitmaps, universe: bitarray) -> bitarray:
+        if self.k > len(self.operands):
+            return universe & ~universe
+        # at_least[j] holds the accounts in at least j of the operands seen so far.
+        at_least = [ones(len(universe))] + [universe & ~universe] * self.k
+        for op in self.operands:
+            bits = op.evaluate_bits(bitmaps, universe)
+            for j in range(self.k, 0, -1):
+                at_least[j] = at_least[j] | (at_least[j - 1] & bits)
+        return at_least[self.k]
+
+
+Node = Union[Card, Not, And, Or, AtLeast]
+
+
+class _Parser:
+    """A recursive descent parser over the tokens of a query."""
+
+    def __init__(self, text: str) -> None:
+        self.tokens = [token.lower() for token in TOKEN_RE.findall(text)]
+        self.pos = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self, expected: Optional[set[str]] = None) -> str:
+        token = self.peek()
+        if token is None:
+            raise InvalidInput("Incomplete query.")
+        if expected is not None and token not in expected:
+            raise InvalidInput(f"Expected {' or '.join(sorted(expected))} but found `{token}`.")
+        self.pos += 1
+        return token
+
+    def parse(self) -> Node:
+        if not self.tokens:
+            raise InvalidInput("Please provide a query, for example `1 and (2 or 3)`.")
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise InvalidInput(f"Unexpected `{self.peek()}`.")
+        return node
+
+    def parse_or(self) -> Node:
+        operands = [self.parse_and()]
+        while self.peek() in OR_WORDS:
+            self.take()
+            operands.append(self.parse_and())
+        return operands[0] if len(operands) == 1 else Or(tuple(operands))
+
+    def parse_and(self) -> Node:
+        operands = [self.parse_not()]
+        while self.peek() in AND_WORDS:
+            self.take()
+            operands.append(self.parse_not())
+        return operands[0] if len(operands) == 1 else And(tuple(operands))
+
+    def parse_not(self) -> Node:
+        if self.peek() in NOT_WORDS:
+            self.take()
+            return Not(self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self) -> Node:
+        token = self.take()
+        if token.isdigit():
+            return Card(int(token))
+        if token == "(":
+            node = self.parse_or()
+            self.take({")"})
+            return node
+        if token in AT_LEAST_WORDS:
+            k = self.take()
+            if not k.isdigit() or int(k) < 1:
+                raise InvalidInput("atleast must be followed by a number, for example `atleast 2 (1, 2, 3)`.")
+            if self.peek() == "of":
+                self.take()
+            self.take({"("})
+            operands = [self.parse_or()]
+            while self.peek() == ",":
+                self.take()
+                operands.append(self.parse_or())
+            self.take({")"})
+            return AtLeast(int(k), tuple(operands))
+        raise InvalidInput(
+            "Only template ids, brackets, `and`, `or`, `not` and `atleast k (a, b, ...)` are supported."
+        )
+
 
-    # can not occur earlier, hence there are args and op.
-    right = find(token_list, ")", left + 4)[0]
+def template_ids(node: Node) -> set[int]:
+    """Every template id referenced by a query."""
+    if isinstance(node, Card):
+        return {node.template_id}
+    if isinstance(node, Not):
+        return template_ids(node.operand)
+    return set().union(*(template_ids(op) for op in node.operands))
 
-    return True, left, right
 
+@dataclass(frozen=True)
+class Query:
+    """A compiled query. `not` is relative to every holder of any card in the query."""
 
-def do_next_token(token_list: list[Callable[[list[str], list[str]], list[str]]]) -> str:
-    """
-    Does the next appropriate operand in the list of instructions that is token_lst.
-    """
-    return token_list[1](token_list[0], token_list[2])  # type: ignore
+    root: Node
 
+    @property
+    def template_ids(self) -> set[int]:
+        return template_ids(self.root)
 
-def recursive_token_eval(
-    token_list: list[
-        Union[str, Callable[[list[str], list[str]], list[str]], list[str]]
-    ],
-) -> list[str]:
-    """
-    Recursively evaluates the operands in the list of instructions that is token_list.
-    """
-    """eval a formatted (i.e. of the form 'ToFa(ToF)') string"""
-    if not token_list:
-        return []
+    def evaluate(self, holders: dict[int, Iterable[str]]) -> set[str]:
+        """Evaluates the query given the holders of each referenced template."""
+        frozen: Holders = {
+            template_id: frozenset(holders.get(template_id, ())) for template_id in self.template_ids
+        }
+        universe = frozenset().union(*frozen.values())
+        return set(self.root.evaluate(frozen, universe))
 
-    if len(token_list) == 1:
-        return token_list[0]  # type: ignore
+    def evaluate_index(self, index: HolderIndex, when: Optional[float] = None) -> list[str]:
+        """Evaluates the query with bitwise operations over the holder bitmaps of an index, as of the snapshot in
+        effect at a time if one is given. Templates missing from the index are treated as having no holders."""
+        return index.names(self.evaluate_bitmap(index, when))
 
-    has_parens, l_paren, r_paren = parentheses(token_list)
+    def evaluate_bitmap(self, index: HolderIndex, when: Optional[float] = None) -> bitarray:
+        bitmaps = {template_id: index.bitmap_at(template_id, when) for template_id in self.template_ids}
+        universe = bitarray(len(index))
+        universe.setall(0)
+        for bits in bitmaps.values():
+            universe |= bits
+        return self.root.evaluate_bits(bitmaps, universe)
 
-    if not has_parens:
-        return do_next_token(token_list)  # type: ignore
+    def diff_index(
+        self, index: HolderIndex, before: float, after: Optional[float] = None
+    ) -> tuple[list[str], list[str]]:
+        """Returns the accounts which started and stopped matching the query between two snapshots of an index. If
+        after isn't given, the current holders are used."""
+        old = self.evaluate_bitmap(index, before)
+        new = self.evaluate_bitmap(index, after)
+        return index.names(new & ~old), index.names(old & ~new)
 
-    token_list[l_paren : r_paren + 1] = [
-        do_next_token(token_list[l_paren + 1 : r_paren])  # type: ignore
-    ]
+    async def fetch_holders(self, session: ClientSession) -> Holders:
+        """Fetches the holders of every referenced template concurrently, once each."""
+        responses = await asyncio.gather(*[get_owners(template_id, session) for template_id in self.template_ids])
+        return {template_id: frozenset(owners) for template_id, owners in responses}
 
-    return recursive_token_eval(token_list)
+    async def run(self, session: ClientSession) -> set[str]:
+        return self.evaluate(await self.fetch_holders(session))
 
 
-def nested_bool_eval(s: str, list_dict: dict[str, list[str]]) -> list[str]:
-    """
-    Evaluates the boolean logic expression s, substituting keys in list_dict with their corresponding lists.
-    """
-    """The actual 'eval' routine,
-    if 's' is empty, 'True' is returned,
-    otherwise 's' is evaluated according to parentheses nesting.
-    The format assumed:
-        [1] 'LEFT OPERATOR RIGHT',
-        where LEFT and RIGHT are either:
-                True or False or '(' [1] ')' (subexpression in parentheses)
-    """
-    return recursive_token_eval(create_token_lst(s, list_dict))
+def compile_query(text: str) -> Query:
+    """Parses a query into a tree which can be evaluated any number of times. Raises InvalidInput if malformed."""
+    return Query(_Parser(text).parse())
 
 
 async def parse_addresses(
-    session: ClientSession, text: str = "", blacklist: set[str] = set()
+    session: ClientSession,
+    text: str = "",
+    blacklist: AbstractSet[str] = frozenset(),
+    index: Optional[HolderIndex] = None,
+    max_index_age: float = float("inf"),
+    exclude: Optional[Callable[[Iterable[str]], Awaitable[list[str]]]] = None,
 ) -> list[str]:
+    """Returns the addresses matching a query, with -max and -noblacklist options. The holders come from index when
+    it has every template in the query indexed within max_index_age seconds, and from the atomic api otherwise.
+    Blacklisted addresses are removed using exclude if given, which returns the addresses that aren't blacklisted,
+    and blacklist otherwise."""
     maximum = None
     use_blacklist = True
     # Pre-processing
@@ -147,52 +287,27 @@ async def parse_addresses(
             f"Found - in text. maximum = {maximum}, use_blacklist = {use_blacklist}",
             "DBUG",
         )
-    t_text = text.replace(")", " ) ")
-    t_text = t_text.replace("(", " ( ")
-    words = t_text.split()
-    ids = []
-
-    for word in words:
-        try:
-            ids.append(int(word))
-        except ValueError:
-            if word not in str_to_tokens:
-                raise InvalidInput(
-                    "Only template ids, brackets, `and`, and `or` are supported."
-                )
-    # Get the template id owners
-    _tasks = []
-    for card_id in ids:
-        _tasks.append(asyncio.create_task(get_owners(card_id, session)))
-    responses = await asyncio.gather(
-        *_tasks
-    )  # a list of the list of owners of each card specified in the command
-    lists_dict: dict[str, list[str]] = {
-        str(template_id): list_ for template_id, list_ in responses
-    }  # dict id:list of owners
-    log(str(lists_dict), "DBUG")
-    # Parse boolean list logic
-    try:
-        resultant_list: list[str] = nested_bool_eval(text, lists_dict)
-    except AttributeError:
-        raise InvalidInput("Incomplete command.")
-    except IndexError:
-        raise InvalidInput(
-            "Make sure you use brackets whenever the result could be ambiguous."
-        )
-
-    # Empty address list
-    if resultant_list is None or len(resultant_list) < 1:
-        raise InvalidResponse("No addresses found with that combination of cards.")
+    query = compile_query(text)
+    if index is not None and index.is_fresh(query.template_ids, max_index_age):
+        resultant = set(query.evaluate_index(index))
+    else:
+        # Get the template id owners
+        holders = await query.fetch_holders(session)
+        log(f"Fetched holders of {len(holders)} templates", "DBUG")
+        # Evaluate the boolean set logic
+        resultant = query.evaluate(holders)
     # Exclude invalid addresses
-    resultant_list = [i for i in resultant_list if i is not None and len(i) > 0]
+    resultant.discard("")
     # Exclude blacklisted addresses
     if use_blacklist:
-        resultant_list = [
-            i
-            for i in resultant_list
-            if i is not None and len(i) > 0 and i not in blacklist
-        ]
+        if exclude is not None:
+            resultant = set(await exclude(resultant))
+        else:
+            resultant.difference_update(blacklist)
+    # Empty address list
+    if len(resultant) < 1:
+        raise InvalidResponse("No addresses found with that combination of cards.")
+    resultant_list = list(resultant)
     # Concatenate list if longer than maximum
     if maximum is not None:
         log(f"Using max {maximum}", "DBUG")
@@ -0,0 +1,81 @@
+import heapq
+from array import array
+from itertools import compress
+from typing import Any, Iterable, Iterator, Optional, Sequence
+
+
+class MinerTable:
+    """Miner stats stored by column rather than as a dict per miner. Numeric columns are packed into arrays, so a
+    full cycle takes a fraction of the memory, and top uses a heap over row numbers, so asking for the best k miners
+    costs O(n log k) without sorting or copying the rows. Rows are only built as dicts when asked for."""
+
+    def __init__(self, columns: dict[str, Sequence[Any]]) -> None:
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("Every column of a MinerTable must have the same length.")
+        self.columns = columns
+        self.fields = list(columns)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict[str, Any]]) -> "MinerTable":
+        """Builds a table from miner dicts. The first row decides the fields; fields missing from a row are None."""
+        columns: dict[str, list[Any]] = {}
+        for row in rows:
+            if not columns:
+                columns = {field: [] for field in row}
+            for field, values in columns.items():
+                values.append(row.get(field))
+        return cls({field: _pack(values) for field, values in columns.items()})
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()), ()))
+
+    def column(self, field: str) -> Sequence[Any]:
+        return self.columns[field]
+
+    def total(self, field: str) -> float:
+        return sum(self.columns[field])
+
+    def row(self, index: int) -> dict[str, Any]:
+        return {field: values[index] for field, values in self.columns.items()}
+
+    def rows(self, indices: Optional[Iterable[int]] = None) -> Iterator[dict[str, Any]]:
+        """Yields the rows at indices, or every row, as dicts."""
+        for index in range(len(self)) if indices is None else indices:
+            yield self.row(index)
+
+    def top(self, k: int, field: str = "rank", largest: bool = False) -> list[int]:
+        """The row numbers of the k miners with the smallest (or largest) values of field, best first."""
+        values = self.columns[field]
+        if k <= 0 or not values:
+            return []
+        # Find the kth best value with a heap over the values alone, then pick out the rows at least that good;
+        # both passes run in C, and only about k row numbers are ever sorted.
+        select = heapq.nlargest if largest else heapq.nsmallest
+        cutoff = select(k, values)[-1]
+        good_enough = cutoff.__le__ if largest else cutoff.__ge__
+        candidates = list(compress(range(len(values)), map(good_enough, values)))
+        candidates.sort(key=values.__getitem__, reverse=largest)
+        return candidates[:k]
+
+    def order(self, field: str = "rank", largest: bool = False) -> list[int]:
+        """The row numbers of every miner sorted by field, smallest (or largest) first, in a single sort. Use top for
+        just the first few."""
+        values = self.columns[field]
+        return sorted(range(len(values)), key=values.__getitem__, reverse=largest)
+
+    def tuples(self, fields: Optional[list[str]] = None) -> Iterator[tuple[Any, ...]]:
+        """Yields each row as a tuple of fields, in the order given, which is what a csv export wants."""
+        return zip(*(self.columns[field] for field in fields or self.fields))
+
+
+def _pack(values: list[Any]) -> Sequence[Any]:
+    """Packs a column of ints or floats into an array, leaving anything else as a list."""
+    if values and all(type(value) is int for value in values):
+        try:
+            return array("q", values)
+        except OverflowError:
+            return values
+    if values and all(type(value) in (int, float) for value in values):
+        return array("d", values)
+    return values
@@ -0,0 +1,132 @@
+import weakref
+from typing import Any
+
+# Moves each user's recent activity into their long-term activity, and clears the recent activity.
+# KEYS[1]: hash of recent activity by user id, KEYS[2]: hash of long-term activity by user id.
+# ARGV: the user ids to update, or none to update every user with recent activity.
+# Returns the number of users whose activity changed.
+FOLD_ACTIVITY = """
+local users = ARGV
+if #users == 0 then
+    users = redis.call('HKEYS', KEYS[1])
+end
+local updated = 0
+for _, user in ipairs(users) do
+    local recent = tonumber(redis.call('HGET', KEYS[1], user))
+    if recent and recent > 0 then
+        redis.call('HINCRBY', KEYS[2], user, recent)
+        updated = updated + 1
+    end
+    redis.call('HDEL', KEYS[1], user)
+end
+return updated
+"""
+
+# Adds to a user's decimal stat, refusing to take it below zero and capping it.
+# KEYS[1]: hash of the stat by user id. ARGV[1]: user id, ARGV[2]: amount to add, ARGV[3]: cap.
+# Returns {1, new value} on success, or {0, current value} if the stat would become negative.
+# Values that aren't numbers count as zero. The checks are done in Lua doubles, and the increment by HINCRBYFLOAT in
+# long doubles (about 18 significant digits), stored with at most 17 decimal places, so large or long sums round.
+ADD_DECIMAL_STAT = """
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+local current = tonumber(raw)
+local new = (current or 0) + tonumber(ARGV[2])
+if new < 0 then
+    return {0, raw or '0'}
+end
+if new > tonumber(ARGV[3]) then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+    return {1, ARGV[3]}
+end
+if current == nil then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    return {1, ARGV[2]}
+end
+return {1, redis.call('HINCRBYFLOAT', KEYS[1], ARGV[1], ARGV[2])}
+"""
+
+# Links a user to a wallet, or unlinks them, keeping the reverse index of wallet owners up to date. Several users
+# may link the same wallet, so each wallet has a set of owners. The caller reads the linked wallet first, so that
+# every key the script touches is declared, and the script only goes ahead if that is still the linked wallet.
+# KEYS[1]: the user's notes hash, KEYS[2]: owner set of the linked wallet, KEYS[3]: owner set of the new wallet.
+# ARGV[1]: the notes field holding the wallet, ARGV[2]: user id, ARGV[3]: the wallet, or "" to unlink,
+# ARGV[4]: the wallet the caller read as linked, or "" for none.
+# Returns {1, previously linked wallet or ""} on success, or {0, linked wallet or ""} if it has changed since.
+LINK_WALLET = """
+local old = redis.call('HGET', KEYS[1], ARGV[1]) or ''
+if old ~= ARGV[4] then
+    return {0, old}
+end
+if old ~= '' then
+    redis.call('SREM', KEYS[2], ARGV[2])
+end
+if ARGV[3] == '' then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+else
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+    redis.call('SADD', KEYS[3], ARGV[2])
+end
+return {1, old}
+"""
+
+# Counts drops given by a user today, refusing any that would take them over their daily limit.
+# KEYS[1]: hash of today's drops by user id, KEYS[2]: hash of the total drops given by day.
+# ARGV[1]: user id, ARGV[2]: number of drops (negative to give them back), ARGV[3]: daily limit, or "" for none,
+# ARGV[4]: unix time at which today's hash expires, ARGV[5]: today's date.
+# Returns {1, drops given today} on success, or {0, drops given today} if over the limit.
+CLAIM_DROPS = """
+local used = tonumber(redis.call('HGET', KEYS[1], ARGV[1])) or 0
+local amount = tonumber(ARGV[2])
+if ARGV[3] ~= '' and amount > 0 and used + amount > tonumber(ARGV[3]) then
+    return {0, used}
+end
+used = redis.call('HINCRBY', KEYS[1], ARGV[1], amount)
+redis.call('EXPIREAT', KEYS[1], ARGV[4])
+redis.call('HINCRBY', KEYS[2], ARGV[5], amount)
+return {1, used}
+"""
+
+# Imports daily drop counts kept before they were in redis, unless that has been done already.
+# KEYS[1]: marker set once imported, KEYS[2]: hash of the total drops given by day, KEYS[3]: hash of today's drops.
+# ARGV[1]: today's date, ARGV[2]: JSON object of total by day, ARGV[3]: JSON object of today's drops by user id,
+# ARGV[4]: unix time at which today's hash expires.
+# Returns 1 if the counts were imported, 0 if they had been before.
+IMPORT_DROPS = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+for day, total in pairs(cjson.decode(ARGV[2])) do
+    redis.call('HINCRBY', KEYS[2], day, total)
+end
+local given = cjson.decode(ARGV[3])
+if next(given) then
+    for user, count in pairs(given) do
+        redis.call('HINCRBY', KEYS[3], user, count)
+    end
+    redis.call('EXPIREAT', KEYS[3], ARGV[4])
+end
+redis.call('SET', KEYS[1], ARGV[1])
+return 1
+"""
+
+_registered: "weakref.WeakKeyDictionary[Any, RedisScripts]" = weakref.WeakKeyDictionary()
+
+
+class RedisScripts:
+    """The bot's Lua scripts, for updates that have to read and write several values atomically in one round trip.
+    They are registered once per redis client and invoked by SHA; redis-py loads them again if redis restarted."""
+
+    def __init__(self, redis) -> None:
+        self.fold_activity = redis.register_script(FOLD_ACTIVITY)
+        self.add_decimal_stat = redis.register_script(ADD_DECIMAL_STAT)
+        self.link_wallet = redis.register_script(LINK_WALLET)
+        self.claim_drops = redis.register_script(CLAIM_DROPS)
+        self.import_drops = redis.register_script(IMPORT_DROPS)
+
+
+def scripts_for(redis) -> RedisScripts:
+    """Returns the scripts registered with a redis client, registering them the first time."""
+    scripts = _registered.get(redis)
+    if scripts is None:
+        scripts = _registered[redis] = RedisScripts(redis)
+    return scripts
@@ -0,0 +1,83 @@
+import time
+from typing import AbstractSet, Iterable, Optional
+
+import discord
+
+from utils.settings import MEMBER_ROLE_CACHE_TTL
+
+
+class MemberRoleCache:
+    """The role ids of members, kept as frozensets so that role checks are a set intersection instead of building
+    and scanning member.roles each time. The bot forgets a member whenever discord reports that they changed or
+    left, a whole guild when one of its roles is created, changed or deleted, and everything when it reconnects,
+    since events may have been missed while it was away. Entries older than ttl seconds are read again regardless.
+    At most maxsize members are kept; the oldest entry is dropped first."""
+
+    def __init__(self, maxsize: int = 50_000, ttl: float = MEMBER_ROLE_CACHE_TTL) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._roles: dict[tuple[int, int], tuple[float, frozenset[int]]] = {}
+        self._named: dict[tuple[int, frozenset[str], bool], frozenset[int]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._roles)
+
+    def role_ids(self, member: discord.Member) -> frozenset[int]:
+        key = (member.guild.id, member.id)
+        now = time.monotonic()
+        entry = self._roles.get(key)
+        if entry is not None and now - entry[0] < self.ttl:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        ids = frozenset(role.id for role in member.roles)
+        # Moved to the end, so that the oldest entry stays first.
+        self._roles.pop(key, None)
+        if len(self._roles) >= self.maxsize:
+            del self._roles[next(iter(self._roles))]
+        self._roles[key] = (now, ids)
+        return ids
+
+    def has_any(self, member: Optional[discord.Member], role_ids: AbstractSet[int]) -> bool:
+        """Whether member has at least one of the roles. False for a missing member or a user outside a guild."""
+        # Users outside a guild have no guild attribute. Checked instead of roles, which builds a list each time.
+        if member is None or getattr(member, "guild", None) is None:
+            return False
+        return not self.role_ids(member).isdisjoint(role_ids)
+
+    def named(self, guild: discord.Guild, names: Iterable[str], ignore_case: bool = False) -> frozenset[int]:
+        """The ids of the roles in guild with any of the names, for checks against roles known only by name.
+        Kept until a role of the guild is created, changed or deleted."""
+        wanted = frozenset(name.lower() for name in names) if ignore_case else frozenset(names)
+        key = (guild.id, wanted, ignore_case)
+        ids = self._named.get(key)
+        if ids is None:
+            ids = frozenset(
+                role.id for role in guild.roles if (role.name.lower() if ignore_case else role.name) in wanted
+            )
+            self._named[key] = ids
+        return ids
+
+    def has_named(self, member: Optional[discord.Member], names: Iterable[str], ignore_case: bool = False) -> bool:
+        """Whether member has at least one role with any of the names in their guild."""
+        if member is None or getattr(member, "guild", None) is None:
+            return False
+        return self.has_any(member, self.named(member.guild, names, ignore_case))
+
+    def forget(self, member: discord.Member) -> None:
+        self._roles.pop((member.guild.id, member.id), None)
+
+    def forget_guild(self, guild_id: int) -> None:
+        for key in [key for key in self._roles if key[0] == guild_id]:
+            del self._roles[key]
+        for named in [named for named in self._named if named[0] == guild_id]:
+            del self._named[named]
+
+    def clear(self) -> None:
+        self._roles.clear()
+        self._named.clear()
+
+
+member_roles = MemberRoleCache()
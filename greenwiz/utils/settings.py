@@ -10,9 +10,47 @@ import os
 DONT_LOG = ["MESG", "DBUG"]
 # Seconds before querying api again to refresh user dict
 WAX_CACHE_TIME = 60
+# Maximum number of entries kept by each of the wax lookup caches (card info, card distribution pages, prices)
+WAX_CACHE_MAX_ENTRIES = 2048
+# Seconds between background refreshes of the collection market dashboard figures
+MARKET_REFRESH_INTERVAL = 15 * 60
 # The default collection that can be used (with appropriate privileges) to drop NFTs in servers without a configured
 # collection .
 DEFAULT_WAX_COLLECTION = "crptomonkeys"
+# Seconds between checks of the market for new listings that match users' price alerts
+PRICE_ALERT_POLL_INTERVAL = 60
+# The collections whose new listings are checked against price alerts
+PRICE_ALERT_COLLECTIONS = [DEFAULT_WAX_COLLECTION]
+# Where the holder index (a bitmap of the holders of each card) is persisted
+HOLDER_INDEX_PATH = "res/holder_index.json"
+# Seconds between background refreshes of the holder index
+HOLDER_INDEX_REFRESH_INTERVAL = 60 * 60
+# Holder queries are answered from the index if it is younger than this, and from the atomic api otherwise
+HOLDER_INDEX_MAX_AGE = 3 * 60 * 60
+# Seconds between snapshots of the holder index, which can be compared to see who acquired or sold cards
+HOLDER_SNAPSHOT_INTERVAL = 24 * 60 * 60
+# Seconds that holder snapshots are kept for
+HOLDER_SNAPSHOT_RETENTION = 180 * 24 * 60 * 60
+# The maximum number of simultaneous requests made to the blacklist server by bulk blacklist commands
+BLACKLIST_BULK_CONCURRENCY = 10
+# Seconds between full comparisons of the local blacklist mirror with the blacklist server
+BLACKLIST_RECONCILE_INTERVAL = 10 * 60
+# If set, the blacklist mirror holds only a Bloom filter with this false positive rate in process, checking its
+# positives in redis, instead of a full copy of the blacklist. Saves memory once the blacklist is very large.
+BLACKLIST_BLOOM_FP_RATE = None
+# The maximum number of miner stats pages fetched at once when pulling every miner in a cycle
+MINER_FETCH_CONCURRENCY = 8
+# Seconds that the AW blacklist is cached for, and the maximum number of its pages fetched at once
+AW_BLACKLIST_CACHE_TTL = 60
+AW_BLACKLIST_CONCURRENCY = 4
+# Seconds that a request to the green api may take, and that a streamed response may take in total
+GREEN_API_TIMEOUT = 30
+GREEN_API_STREAM_TIMEOUT = 5 * 60
+# Seconds that a member's cached role ids are trusted for, in case discord missed telling the bot of a change
+MEMBER_ROLE_CACHE_TTL = 10 * 60
+# Whether the settings cache asks redis to report changes to cached keys (client tracking, redis 6+), instead of
+# relying on the bot's own invalidation messages. Catches writes made outside the bot.
+REDIS_CLIENT_TRACKING = False
 # The wax permissions for each type of use
 TIP_ACC_PERMISSION = "claimlink"
 SALT_ACC_PERMISSION = "match"
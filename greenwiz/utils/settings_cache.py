@@ -0,0 +1,214 @@
+import asyncio
+import json
+import uuid
+from typing import Any, Awaitable, Callable, Iterable, Optional, TypeVar
+
+from redis.exceptions import RedisError
+
+from utils.util import log
+
+# (guild id, key name after the guild id, hash field, "" for plain strings or "*" for a whole hash)
+CacheKey = tuple[int, str, str]
+T = TypeVar("T")
+
+# The families of keys which are cached, as the start of the key name after the guild id.
+CACHED_FAMILIES = ("settings:", "codex", "poem")
+
+
+class SettingsCache:
+    """A read-through, in-process cache of hot per-guild keys, such as settings and codex tables, shared by every
+    StorageManager, so that hot paths such as prefix resolution are a dict lookup rather than a redis round trip.
+    Values are cached under the guild id and the rest of their redis key, so "{guild}:settings:prefix" is
+    (guild, "settings:prefix").
+
+    Writers call invalidate, which drops the key here and publishes it on a pub/sub channel; every process
+    listens on that channel and drops the same key from its own cache. With track, redis reports changes itself:
+    the listener turns on client tracking in broadcast mode for the cached key families of every tracked guild,
+    so that a write from anywhere, even outside the bot, invalidates the entry. Keys of guilds that aren't tracked
+    yet are read through without being cached.
+
+    Entries are only served while the listener is subscribed, and the cache is emptied whenever it (re)subscribes
+    or stops, so a missed invalidation can't leave a stale value behind."""
+
+    channel = "settings:invalidate"
+    tracking_channel = "__redis__:invalidate"
+
+    def __init__(self, redis, track: bool = False) -> None:
+        self.redis = redis
+        self.track = track
+        self._entries: dict[CacheKey, Any] = {}
+        # Bumped by every invalidation, so that a read which raced one isn't cached.
+        self._generation = 0
+        self.active = False
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Identifies this process's own events, which it has already applied.
+        self.origin = uuid.uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+        # The guilds to track, and those redis is reporting on for the current subscription.
+        self._guilds: set[int] = {0}
+        self._tracked: frozenset[int] = frozenset()
+        self._resubscribe_pending = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        return (
+            f"<SettingsCache: {len(self)} entries, {self.hits} hits, {self.misses} misses, "
+            f"{self.invalidations} invalidations, {'tracking' if self.track else 'pub/sub'}, "
+            f"{'active' if self.active else 'inactive'}>"
+        )
+
+    async def get(self, guild_id: int, name: str, field: str, loader: Callable[[], Awaitable[T]]) -> T:
+        """Returns the value of the key "{guild_id}:{name}", or one field of it, calling loader to read it from redis
+        if it isn't cached. Callers must not mutate cached values."""
+        entry = (guild_id, name, field)
+        if self.active and entry in self._entries:
+            self.hits += 1
+            value: T = self._entries[entry]
+            return value
+        self.misses += 1
+        generation = self._generation
+        value = await loader()
+        if self.active and generation == self._generation and self._covers(guild_id):
+            self._entries[entry] = value
+        return value
+
+    def _covers(self, guild_id: int) -> bool:
+        if not self.track or guild_id in self._tracked:
+            return True
+        self.track_guilds([guild_id])
+        return False
+
+    def _drop(self, guild_id: int, name: str) -> None:
+        self._generation += 1
+        self.invalidations += 1
+        for entry in [entry for entry in self._entries if entry[0] == guild_id and entry[1] == name]:
+            del self._entries[entry]
+
+    async def invalidate(self, guild_id: int, name: str) -> None:
+        """Drops a key, with every one of its fields, here and in every other process."""
+        self._drop(guild_id, name)
+        if not self.track:
+            # When tracking, redis tells every process about the write itself.
+            await self.redis.publish(
+                self.channel, json.dumps({"guild": guild_id, "name": name, "origin": self.origin})
+            )
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+
+    def handle_event(self, data: str) -> None:
+        event = json.loads(data)
+        if event.get("origin") != self.origin:
+            self._drop(int(event["guild"]), event["name"])
+
+    def handle_tracking(self, keys: Optional[list[str]]) -> None:
+        """Drops the keys redis reports as changed. None means the whole database was flushed."""
+        if keys is None:
+            self.clear()
+            return
+        for key in keys:
+            guild_id, _, name = key.partition(":")
+            if guild_id.isdigit():
+                self._drop(int(guild_id), name)
+
+    def handle_message(self, message: list[Any]) -> None:
+        kind, channel, data = message[0], message[1], message[2]
+        if kind != "message":
+            return
+        if channel == self.tracking_channel:
+            self.handle_tracking(data)
+        else:
+            self.handle_event(data)
+
+    def track_guilds(self, guild_ids: Iterable[int]) -> None:
+        """Adds guilds whose keys should be cached when tracking. The listener resubscribes once, soon after, to
+        start tracking them, which empties the cache."""
+        new = set(guild_ids) - self._guilds
+        if not self.track or not new:
+            return
+        self._guilds |= new
+        if self._listener is not None and not self._resubscribe_pending:
+            self._resubscribe_pending = True
+            asyncio.get_running_loop().call_soon(self._resubscribe)
+
+    def _resubscribe(self) -> None:
+        self._resubscribe_pending = False
+        self.stop_listening()
+        self.start_listening()
+
+    async def listen(self, retry_delay: float = 5.0) -> None:
+        """Applies invalidations until cancelled, resubscribing if the connection to redis is lost. The cache is
+        bypassed while unsubscribed."""
+        while True:
+            try:
+                await self._listen_once()
+            except (RedisError, OSError) as e:
+                log(
+                    f"Lost the settings invalidation channel, resubscribing in {retry_delay}s: {type(e).__name__}: {e}",
+                    "WARN",
+                )
+                await asyncio.sleep(retry_delay)
+
+    async def _command(self, connection, *args: Any) -> Any:
+        await connection.send_command(*args)
+        return await connection.read_response()
+
+    async def _listen_once(self) -> None:
+        # A connection of our own rather than a PubSub, which would quietly reconnect and resubscribe, losing any
+        # invalidations sent in between, as well as client tracking.
+        pool = self.redis.connection_pool
+        connection = await pool.get_connection()
+        try:
+            channels = [self.channel]
+            if self.track:
+                # Tracking is redirected to this same connection, which then receives invalidations on the
+                # tracking channel. It ends when the connection does.
+                tracked = frozenset(self._guilds)
+                client_id = await self._command(connection, "CLIENT", "ID")
+                prefixes = [
+                    arg
+                    for guild_id in sorted(tracked)
+                    for family in CACHED_FAMILIES
+                    for arg in ("PREFIX", f"{guild_id}:{family}")
+                ]
+                await self._command(connection, "CLIENT", "TRACKING", "ON", "REDIRECT", client_id, "BCAST", *prefixes)
+                self._tracked = tracked
+                channels.append(self.tracking_channel)
+            await connection.send_command("SUBSCRIBE", *channels)
+            for _ in channels:
+                await connection.read_response()
+            self.clear()
+            self.active = True
+            while True:
+                message = await connection.read_response()
+                try:
+                    self.handle_message(message)
+                except (ValueError, KeyError, IndexError, TypeError) as e:
+                    log(f"Ignoring a malformed settings invalidation: {e}", "WARN")
+        finally:
+            self.active = False
+            self._tracked = frozenset()
+            self.clear()
+            await connection.disconnect()
+            await pool.release(connection)
+
+    def start_listening(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self.listen())
+            self._listener.add_done_callback(self._log_exit)
+
+    def _log_exit(self, task: asyncio.Task) -> None:
+        """listen only returns by being cancelled, so anything else has left the cache bypassed for good."""
+        if not task.cancelled() and task.exception() is not None:
+            exc = task.exception()
+            log(f"The settings cache listener stopped, so the cache is off: {type(exc).__name__}: {exc}", "CRIT")
+
+    def stop_listening(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
@@ -1,18 +1,27 @@
-import asyncio
 import random
 from decimal import Decimal, InvalidOperation
-from typing import Union, Awaitable, Optional
+from typing import Union, Iterable, Optional
 
 import discord
 
 from utils.coerce_converters import sanitize_name
+from utils.drop_limits import DropLimits
 from utils.exceptions import InvalidInput, UnableToCompleteRequestedAction
+from utils.redis_scripts import scripts_for
+from utils.wallet_registry import WalletRegistry
+
+
+# The largest value a decimal stat can hold.
+STAT_CAP = Decimal(10**22)
 
 
 class StorageManager:
     def __init__(self, bot, guild: discord.Guild | None = None) -> None:
         self.bot = bot
         self.redis = bot.redis
+        self.scripts = scripts_for(self.redis)
+        self.wallets = WalletRegistry(self.redis)
+        self.drops = DropLimits(self.redis)
         if guild:
             self.guild: Optional[discord.Guild] = guild
             self.guild_id = guild.id
@@ -20,12 +29,23 @@ class StorageManager:
             self.guild = None
             self.guild_id = 0
 
-    async def get_setting(self, setting: str, key: str = "") -> str:
-        """Gets a redis setting for a specified id, for example a users' auth level"""
+    async def _read_setting(self, setting: str, key: str = "") -> Optional[str]:
         if key == "":
-            result = await self.redis.get(f"{self.guild_id}:settings:{setting}")
+            result: Optional[str] = await self.redis.get(f"{self.guild_id}:settings:{setting}")
         else:
             result = await self.redis.hget(f"{self.guild_id}:settings:{setting}", key)
+        return result
+
+    async def get_setting(self, setting: str, key: str = "") -> str:
+        """Gets a redis setting for a specified id, for example a users' auth level. Served from the bot's
+        settings cache when it has one."""
+        cache = getattr(self.bot, "settings_cache", None)
+        if cache is not None:
+            result = await cache.get(
+                self.guild_id, f"settings:{setting}", key, lambda: self._read_setting(setting, key)
+            )
+        else:
+            result = await self._read_setting(setting, key)
         if result is None:
             if setting == "prefix":
                 result = self.bot.settings.DEFAULT_PREFIX
@@ -43,6 +63,9 @@ class StorageManager:
             res = await self.redis.hset(
                 f"{self.guild_id}:settings:{setting}", key, str(value)
             )
+        cache = getattr(self.bot, "settings_cache", None)
+        if cache is not None:
+            await cache.invalidate(self.guild_id, f"settings:{setting}")
         if not res:
             raise UnableToCompleteRequestedAction(
                 f"Fields were not properly added to redis db when saving {setting} "
@@ -50,40 +73,55 @@ class StorageManager:
             )
         return value
 
-    async def get_settings(self, num: int = 1000) -> dict[str, str]:
-        """Returns up to 50 settings and their value for this server."""
-        cur, keys = await self.redis.scan(
-            match=f"{self.guild_id}:settings:*", count=num
-        )
-        results = dict()
+    async def get_settings(self, num: int = 1000) -> dict[str, Union[str, dict[str, str]]]:
+        """Returns every setting and its value for this server. Keys are found with SCAN, num at a time, and all of
+        their values are read in a single pipeline: each key is read both as a string and as a hash, and whichever
+        read matches its type is kept, so no separate TYPE lookups are needed."""
+        prefix = f"{self.guild_id}:settings:"
+        keys = [key async for key in self.redis.scan_iter(match=f"{prefix}*", count=num)]
+        if not keys:
+            return {}
+        tr = self.redis.pipeline(transaction=False)
         for key in keys:
-            id_ = str(key).split(":")[-1][:-1]
-            if await self.redis.type(key) == b"string":  # noqa: E721
-                value = await self.redis.get(key)
-            else:
-                value = await self.redis.hgetall(key)
-            results[id_] = value
+            tr.get(key)
+            tr.hgetall(key)
+        values = await tr.execute(raise_on_error=False)
+        results: dict[str, Union[str, dict[str, str]]] = dict()
+        for key, as_string, as_hash in zip(keys, values[::2], values[1::2]):
+            value = as_hash if isinstance(as_string, Exception) else as_string
+            if value is None or isinstance(value, Exception):
+                # Expired or deleted since the scan, or not a string or hash.
+                continue
+            results[key.removeprefix(prefix)] = value
         return results
 
     async def get_auth(self, user: discord.User) -> int:
         """Get the authorization level of a user"""
         if user.id == self.bot.owner_id:
             return 10
-        try:
-            result = int(await self.get_setting("auth", key=str(user.id)))
-        except TypeError:
-            return 0
-        return result
+        return (await self.get_auth_table()).get(user.id, 0)
 
     async def set_auth(self, user: discord.User, level: int) -> None:
         """Set the authorization level of a user"""
         await self.set_setting("auth", str(level), key=str(user.id))
 
-    async def get_commanders(self) -> dict[int, int]:
-        """Return the full list of commanders and their level."""
+    async def _read_auth_table(self) -> dict[int, int]:
         result = await self.redis.hgetall(f"{self.guild_id}:settings:auth")
         return {int(key): int(value) for key, value in result.items()}
 
+    async def get_auth_table(self) -> dict[int, int]:
+        """The auth level of every commander, read once and then served from the bot's settings cache until an auth
+        level changes. Don't modify the returned dict."""
+        cache = getattr(self.bot, "settings_cache", None)
+        if cache is None:
+            return await self._read_auth_table()
+        table: dict[int, int] = await cache.get(self.guild_id, "settings:auth", "*", self._read_auth_table)
+        return table
+
+    async def get_commanders(self) -> dict[int, int]:
+        """Return the full list of commanders and their level."""
+        return dict(await self.get_auth_table())
+
     async def get_stat_user(self, user: Union[discord.User, int], stat: str) -> str:
         """Gets a redis stat for a specified user"""
         if not isinstance(user, int):
@@ -111,65 +149,50 @@ class StorageManager:
 
     async def add_stat_user(
         self, user: Union[discord.User, int], stat: str, value: Decimal
-    ) -> None:
-        """Increases a redis stat for a user by a specified amount, atomically. Must be a Decimal stat."""
+    ) -> Decimal:
+        """Increases a redis stat for a user by a specified amount, atomically, in one round trip. Must be a Decimal
+        stat. The stat is capped at 10**22, and can't go below zero. Returns the new value.
+        Redis adds in long doubles, so sums are exact to about 18 significant digits and kept to at most 17 decimal
+        places: fractions of a balance above about 10**17 are rounded away. The sign and cap checks are done in
+        doubles, which are exact to about 15 significant digits."""
         if not isinstance(user, int):
             user = user.id
-        await self.watch(f"stat:{stat}")
-        bal = await self.get_stat_user(user, stat)
+        ok, result = await self.scripts.add_decimal_stat(
+            keys=[f"{self.guild_id}:stat:{stat}"], args=[str(user), f"{value:f}", f"{STAT_CAP:f}"]
+        )
+        if not int(ok):
+            raise InvalidInput(f"{stat} can not be negative.")
         try:
-            new_bal = value + Decimal(bal)
+            return Decimal(result)
         except InvalidOperation:
-            new_bal = value + Decimal(0)
-        try:
-            if new_bal < 0:
-                raise InvalidInput(f"{stat} can not be negative.")
-            if new_bal > Decimal(10**22):
-                new_bal = Decimal(10**22)
-            tr = self.redis.multi_exec()
-            tr.hset(f"{self.guild_id}:stat:{stat}", str(user), str(new_bal))
-            await tr.execute()
-            if not await self.get_stat_user(user, stat) == str(new_bal):
-                raise UnableToCompleteRequestedAction("Try running this command again.")
-        finally:
-            await self.redis.unwatch()
-
-    def watch(self, stat_name) -> Awaitable[str]:
-        """Returns a future for redis-watching a specified stat. Just for readability."""
-        return self.redis.watch(f"{self.guild_id}:{stat_name}")  # type: ignore
+            raise UnableToCompleteRequestedAction(f"Redis returned {result} as the new {stat}.")
 
     async def recent_activity_to_activity(
         self, user_id: int, actweight: int = 0
     ) -> None:
         """Converts all of a user's recent activity to long-term activity points."""
-        tx = [
-            self.watch("activity"),
-            self.watch("recent_activity"),
-        ]
-        await asyncio.gather(*tx)
-        try:
-            transference = await self.redis.hget(
-                f"{self.guild_id}:recent_activity", user_id
-            )
-            if transference == 0:
-                return
-            if int(transference) <= 0:
-                raise InvalidInput("User recent activity can not be less than 1")
-            tr = self.redis.multi_exec()
-            tr.incrby(f"{self.guild_id}:activity", user_id, transference)
-            tr.hset(f"{self.guild_id}:recent_activity", user_id, 0)
-            await tr.execute()
-        finally:
-            await self.redis.unwatch()
+        await self.fold_recent_activity([user_id])
+
+    async def fold_recent_activity(
+        self, user_ids: Optional[Iterable[int]] = None, batch_size: int = 1000
+    ) -> int:
+        """Converts recent activity to long-term activity points atomically, in a script run by redis. The given
+        users are updated batch_size at a time, one round trip per batch; without user_ids, every user with recent
+        activity is updated in a single round trip. Returns the number of users whose activity changed."""
+        keys = [f"{self.guild_id}:recent_activity", f"{self.guild_id}:stat:activity"]
+        if user_ids is None:
+            return int(await self.scripts.fold_activity(keys=keys))
+        ids = [str(user_id) for user_id in user_ids]
+        updated = 0
+        # An empty batch would mean every user to the script, so there is never one.
+        for start in range(0, len(ids), batch_size):
+            updated += int(await self.scripts.fold_activity(keys=keys, args=ids[start:start + batch_size]))
+        return updated
 
     async def do_activity_update(self) -> int:
         """Update activity scores for all users.
         Returns the number of users updated."""
-        activities = await self.get_all_users_with_int_balances("activity")
-        actweight = Decimal(await self.get_setting("actweight"))
-        for user_id, activity in activities.items():
-            await self.recent_activity_to_activity(user_id, actweight=int(actweight))
-        return len(activities)
+        return await self.fold_recent_activity()
 
     async def get_all_stat(self, stat) -> dict[int, Decimal]:
         """Return all user's balances"""
@@ -213,23 +236,90 @@ class StorageManager:
     @sanitize_name
     async def set_note(self, user: discord.User, name: str, note: str) -> None:
         """Saves or updates a note"""
+        if name == WalletRegistry.note:
+            await self.wallets.link(user.id, note)
+            return
         await self.redis.hset(f"notes:{user.id}", name, note)
 
     @sanitize_name
     async def del_note(self, user: discord.User, name: str) -> None:
         """Deletes a note"""
+        if name == WalletRegistry.note:
+            await self.wallets.unlink(user.id)
+            return
         await self.redis.hdel(f"notes:{user.id}", name)
 
+    async def add_price_alert(
+        self, user: Union[discord.User, int], template_id: int, max_price: float
+    ) -> None:
+        """Subscribes a user to be notified when the template is listed at or below max_price WAX."""
+        if not isinstance(user, int):
+            user = user.id
+        tr = self.redis.pipeline()
+        tr.hset(f"price_alerts:{template_id}", str(user), str(max_price))
+        tr.hset(f"price_alerts:user:{user}", str(template_id), str(max_price))
+        await tr.execute()
+
+    async def remove_price_alert(
+        self, user: Union[discord.User, int], template_id: int
+    ) -> bool:
+        """Removes a user's price alert for a template. Returns whether there was one."""
+        if not isinstance(user, int):
+            user = user.id
+        tr = self.redis.pipeline()
+        tr.hdel(f"price_alerts:{template_id}", str(user))
+        tr.hdel(f"price_alerts:user:{user}", str(template_id))
+        removed, _ = await tr.execute()
+        return bool(removed)
+
+    async def get_user_price_alerts(
+        self, user: Union[discord.User, int]
+    ) -> dict[int, float]:
+        """Returns a user's price alerts as template_id: max_price."""
+        if not isinstance(user, int):
+            user = user.id
+        res = await self.redis.hgetall(f"price_alerts:user:{user}")
+        return {int(key): float(value) for key, value in res.items()}
+
+    async def get_price_alerts(
+        self, template_ids: list[int]
+    ) -> dict[int, dict[int, float]]:
+        """Returns the subscribers of each template as template_id: {user_id: max_price}, in one round trip."""
+        tr = self.redis.pipeline()
+        for template_id in template_ids:
+            tr.hgetall(f"price_alerts:{template_id}")
+        results = await tr.execute()
+        return {
+            template_id: {int(key): float(value) for key, value in res.items()}
+            for template_id, res in zip(template_ids, results)
+        }
+
+    async def _codex_table(self, style: str) -> dict[str, str]:
+        """Every codex of a style, served from the bot's settings cache when it has one. Don't modify it."""
+        cache = getattr(self.bot, "settings_cache", None)
+        if cache is None:
+            return dict(await self.redis.hgetall(f"{self.guild_id}:{style}"))
+        table: dict[str, str] = await cache.get(
+            self.guild_id, style, "*", lambda: self.redis.hgetall(f"{self.guild_id}:{style}")
+        )
+        return table
+
+    async def _codex_changed(self, style: str) -> None:
+        cache = getattr(self.bot, "settings_cache", None)
+        if cache is not None:
+            await cache.invalidate(self.guild_id, style)
+
     @sanitize_name
     async def set_codex(self, name: str, note: str, style: str = "codex") -> str:
         """Saves or updates a server-wide note/codex."""
         await self.redis.hset(f"{self.guild_id}:{style}", name, note)
+        await self._codex_changed(style)
         return name
 
     @sanitize_name
     async def get_codex(self, name: str, style: str = "codex") -> str:
         """Retrieves a server-wide note/codex."""
-        note = await self.redis.hget(f"{self.guild_id}:{style}", name)
+        note = (await self._codex_table(style)).get(name)
         if not note or len(note) == 0:
             return "Not found."
         return str(note)
@@ -238,15 +328,15 @@ class StorageManager:
     async def del_codex(self, name: str, style: str = "codex") -> None:
         """Deletes specified codex entry."""
         await self.redis.hdel(f"{self.guild_id}:{style}", name)
+        await self._codex_changed(style)
 
     async def get_codex_names(self, style: str = "codex") -> dict[str, str]:
         """Retrieves up to 50 codex names."""
-        res = await self.redis.hgetall(f"{self.guild_id}:{style}")
-        return dict(res)
+        return dict(await self._codex_table(style))
 
     async def get_random_codex(self, style: str = "codex") -> tuple[str, str]:
         """Retrieves a random codex."""
-        res = await self.redis.hgetall(f"{self.guild_id}:{style}")
+        res = await self._codex_table(style)
         try:
             selection: tuple[str, str] = random.choice(list(res.items()))
         except (KeyError, IndexError):
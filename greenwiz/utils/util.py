@@ -7,6 +7,7 @@ import discord
 from aioeosabi.exceptions import EosAssertMessageException
 
 from utils.exceptions import InvalidInput
+from utils.role_cache import member_roles
 
 # Returns current timestamp in the desired format, in this case MM/DD/YYYY HH:MM:SS
 from utils.settings import (
@@ -265,22 +266,12 @@ def scope() -> typing.Callable[..., bool]:
 
 def has_cm_role(user: discord.User, role: str, bot) -> bool:
     member = bot.get_guild(CM_GUID).get_member(user.id)
-    if not member:
-        return False
-    for role_obj in member.roles:
-        if role_obj.name.lower() == role.lower():
-            return True
-    return False
+    return member_roles.has_named(member, [role], ignore_case=True)
 
 
 def is_citizen(user, bot) -> bool:
     member = bot.get_guild(BANANO_GUID).get_member(user.id)
-    if not member:
-        return False
-    for role in member.roles:
-        if role.name.lower() == "citizens" or role.name.lower() == "citizen":
-            return True
-    return False
+    return member_roles.has_named(member, ["citizens", "citizen"], ignore_case=True)
 
 
 def calc_msg_activity(bot, author: discord.User, content: str) -> int:
@@ -476,3 +467,4 @@ class WaxNFT:
     # Helper class for storing information on cached assets that may be needed later
     asset_id: int
     ipfs_hash: str
+    template_id: int = -1
@@ -0,0 +1,86 @@
+from typing import Iterable, Optional
+
+from utils.redis_scripts import scripts_for
+
+
+class WalletRegistry:
+    """The wax wallets users have linked, stored in their notes, with a reverse index from each wallet to the set of
+    users who linked it, so that finding the owners of a wallet is a single lookup. Links and unlinks go through a
+    script which checks and updates both in one atomic call; wallets for many users are read in one pipeline."""
+
+    # The notes field holding a user's wallet, as written by set_note("LinkedWallet", ...).
+    note = "linkedwallet"
+    owners_prefix = "wallets:owners:"
+    # Set once the index has been built from the notes written before it existed.
+    indexed_key = "wallets:indexed"
+
+    def __init__(self, redis) -> None:
+        self.redis = redis
+        self.scripts = scripts_for(redis)
+
+    async def link(self, user_id: int, wallet: str) -> Optional[str]:
+        """Links a user to a wallet. Returns the wallet they had linked before, if any."""
+        notes = f"notes:{user_id}"
+        old = await self.redis.hget(notes, self.note) or ""
+        while True:
+            # Retried if the link changed between reading it and running the script.
+            done, old = await self.scripts.link_wallet(
+                keys=[notes, self.owners_prefix + old, self.owners_prefix + (wallet or old)],
+                args=[self.note, str(user_id), wallet, old],
+            )
+            if done:
+                return old or None
+
+    async def unlink(self, user_id: int) -> Optional[str]:
+        """Unlinks a user's wallet. Returns the wallet that was linked, if any."""
+        return await self.link(user_id, "")
+
+    async def get_wallet(self, user_id: int) -> Optional[str]:
+        wallet: Optional[str] = await self.redis.hget(f"notes:{user_id}", self.note)
+        return wallet or None
+
+    async def get_wallets(self, user_ids: Iterable[int]) -> dict[int, Optional[str]]:
+        """The linked wallet, or None, of every user, read in one round trip."""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        tr = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            tr.hget(f"notes:{user_id}", self.note)
+        wallets = await tr.execute()
+        return {user_id: wallet or None for user_id, wallet in zip(user_ids, wallets)}
+
+    async def owners(self, wallet: str) -> list[int]:
+        """The ids of the users who linked a wallet, in order."""
+        return sorted(int(user_id) for user_id in await self.redis.smembers(self.owners_prefix + wallet))
+
+    async def rebuild_index(self, batch_size: int = 1000) -> int:
+        """Rebuilds the reverse index from everyone's notes, for wallets linked before it existed.
+        Returns the number of linked wallets found."""
+        owners: dict[str, set[str]] = {}
+        batch: list[str] = []
+
+        async def read(keys: list[str]) -> None:
+            tr = self.redis.pipeline(transaction=False)
+            for key in keys:
+                tr.hget(key, self.note)
+            for key, wallet in zip(keys, await tr.execute()):
+                if wallet:
+                    owners.setdefault(wallet, set()).add(key.split(":", 1)[1])
+
+        async for key in self.redis.scan_iter(match="notes:*", count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                await read(batch)
+                batch = []
+        if batch:
+            await read(batch)
+        stale = [key async for key in self.redis.scan_iter(match=f"{self.owners_prefix}*", count=batch_size)]
+        tr = self.redis.pipeline()
+        if stale:
+            tr.delete(*stale)
+        for wallet, user_ids in owners.items():
+            tr.sadd(self.owners_prefix + wallet, *user_ids)
+        tr.set(self.indexed_key, "1")
+        await tr.execute()
+        return len(owners)
@@ -6,6 +6,7 @@ from discord.ext import commands
 
 from utils.cryptomonkey_util import cryptomonkey_dropper_admin, has_nifty
 from utils.exceptions import UnableToCompleteRequestedAction
+from utils.role_cache import member_roles
 from utils.settings import (
     YOSHI_PRIV_KEY,
     WAX_PRIV_KEY,
@@ -19,30 +20,22 @@ from utils.settings import (
     BAD_SANTA_PRIV_KEY,
 )
 
+# Uplift team members
+YOSHI_ADMIN_ROLE_IDS = frozenset({869557082452553768})
+# Uplift team members and community moderators
+YOSHI_DROPPER_ROLE_IDS = frozenset({848630244844109914, 870013351391035422, 869557082452553768, 894809331411853366})
+
 
 def yoshi_admin(user: discord.User, bot):
     """Uplift team members can drop an unlimited number of cards per day"""
     member = bot.get_guild(805449582124466206).get_member(user.id)
-    for role in member.roles:
-        if role.id in [869557082452553768]:
-            return True
-    return False
+    return member_roles.has_any(member, YOSHI_ADMIN_ROLE_IDS)
 
 
 def user_is_authd_to_drop_yoshis(user: discord.User, bot):
     """Uplift team members and community moderators can drop some cards every day."""
     member = bot.get_guild(805449582124466206).get_member(user.id)
-    if member is None:
-        return False
-    for role in member.roles:
-        if role.id in [
-            848630244844109914,
-            870013351391035422,
-            869557082452553768,
-            894809331411853366,
-        ]:
-            return True
-    return False
+    return member_roles.has_any(member, YOSHI_DROPPER_ROLE_IDS)
 
 
 collections: dict[str, dict[str, Any]] = {
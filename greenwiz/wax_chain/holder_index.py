@@ -0,0 +1,164 @@
+import base64
+import json
+import os
+from bisect import bisect_right
+from time import time
+from typing import Iterable, Optional
+
+from bitarray import bitarray
+from bitarray.util import sc_decode, sc_encode, zeros
+
+
+def encode_bitmap(bits: bitarray) -> str:
+    """Compresses a bitmap (sparse ones compress well) into a string that can be stored in json."""
+    return base64.b64encode(sc_encode(bits)).decode("ascii")
+
+
+def decode_bitmap(data: str) -> bitarray:
+    return sc_decode(base64.b64decode(data))
+
+
+class HolderIndex:
+    """Maps every known wax account to a small integer id and stores the holders of each template as a bitmap over
+    those ids, so that ownership queries across many templates become bitwise operations.
+    Ids are only ever appended, so a bitmap stays valid as new accounts are added; bitmaps shorter than the number
+    of accounts are treated as zero-padded, and old snapshots of the bitmaps can be compared with current ones.
+    A snapshot only stores the bitmaps of templates whose holders changed since the previous snapshot."""
+
+    def __init__(self) -> None:
+        self.accounts: list[str] = []
+        self.ids: dict[str, int] = {}
+        self.bitmaps: dict[int, bitarray] = {}
+        self.updated: dict[int, float] = {}
+        self.snapshot_times: list[float] = []
+        # template_id: [(snapshot time, bitmap)], oldest first.
+        self.snapshots: dict[int, list[tuple[float, bitarray]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def __contains__(self, template_id: int) -> bool:
+        return template_id in self.bitmaps
+
+    def account_id(self, account: str) -> int:
+        """Returns the id of an account, assigning it the next free id if it hasn't been seen before."""
+        account_id = self.ids.get(account)
+        if account_id is None:
+            account_id = self.ids[account] = len(self.accounts)
+            self.accounts.append(account)
+        return account_id
+
+    def update(self, template_id: int, owners: Iterable[str]) -> tuple[int, int]:
+        """Replaces the holders of a template. Returns how many holders were added and removed since the last
+        update."""
+        owner_ids = [self.account_id(owner) for owner in owners if owner]
+        bits = zeros(len(self.accounts))
+        for account_id in owner_ids:
+            bits[account_id] = 1
+        old = self.bitmap(template_id)
+        self.bitmaps[template_id] = bits
+        self.updated[template_id] = time()
+        return (bits & ~old).count(), (old & ~bits).count()
+
+    def pad(self, bits: bitarray) -> bitarray:
+        """Zero-extends a bitmap to cover every known account."""
+        if len(bits) < len(self.accounts):
+            bits = bits + zeros(len(self.accounts) - len(bits))
+        return bits
+
+    def bitmap(self, template_id: int) -> bitarray:
+        """The holders of a template as a bitmap covering every known account. Empty if the template isn't
+        indexed."""
+        return self.pad(self.bitmaps.get(template_id, bitarray()))
+
+    def snapshot(self, now: Optional[float] = None) -> int:
+        """Records the current holders of every template. Returns how many templates changed since the last one."""
+        if now is None:
+            now = time()
+        changed = 0
+        for template_id, bits in self.bitmaps.items():
+            history = self.snapshots.setdefault(template_id, [])
+            if history and self.pad(history[-1][1]) == self.pad(bits):
+                continue
+            history.append((now, bits.copy()))
+            changed += 1
+        self.snapshot_times.append(now)
+        return changed
+
+    def prune_snapshots(self, before: float) -> None:
+        """Forgets snapshots taken before a time, keeping the last one of each template that is still in effect."""
+        self.snapshot_times = [stamp for stamp in self.snapshot_times if stamp >= before]
+        for template_id, history in self.snapshots.items():
+            keep_from = max(bisect_right([stamp for stamp, _ in history], before) - 1, 0)
+            self.snapshots[template_id] = history[keep_from:]
+
+    def bitmap_at(self, template_id: int, when: Optional[float] = None) -> bitarray:
+        """The holders of a template as of the last snapshot taken at or before a time, or currently if no time is
+        given. Empty if the template wasn't indexed yet."""
+        if when is None:
+            return self.bitmap(template_id)
+        history = self.snapshots.get(template_id, [])
+        position = bisect_right([stamp for stamp, _ in history], when)
+        if position == 0:
+            return self.pad(bitarray())
+        return self.pad(history[position - 1][1])
+
+    def snapshot_before(self, when: float) -> Optional[float]:
+        """The time of the last snapshot taken at or before a time, if there is one."""
+        position = bisect_right(self.snapshot_times, when)
+        return self.snapshot_times[position - 1] if position else None
+
+    def is_fresh(self, template_ids: Iterable[int], max_age: float) -> bool:
+        """Whether every given template has been indexed within the last max_age seconds."""
+        now = time()
+        return all(now - self.updated.get(template_id, 0) < max_age for template_id in template_ids)
+
+    def names(self, bits: bitarray) -> list[str]:
+        """Converts a bitmap back into account names."""
+        return [self.accounts[i] for i in bits.search(1)]
+
+    def holders(self, template_id: int) -> list[str]:
+        return self.names(self.bitmaps.get(template_id, bitarray()))
+
+    def to_json(self) -> dict:
+        return {
+            "accounts": self.accounts,
+            "bitmaps": {str(template_id): encode_bitmap(bits) for template_id, bits in self.bitmaps.items()},
+            "updated": {str(template_id): stamp for template_id, stamp in self.updated.items()},
+            "snapshot_times": self.snapshot_times,
+            "snapshots": {
+                str(template_id): [[stamp, encode_bitmap(bits)] for stamp, bits in history]
+                for template_id, history in self.snapshots.items()
+            },
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "HolderIndex":
+        index = cls()
+        index.accounts = list(data["accounts"])
+        index.ids = {account: account_id for account_id, account in enumerate(index.accounts)}
+        index.bitmaps = {int(template_id): decode_bitmap(bits) for template_id, bits in data["bitmaps"].items()}
+        index.updated = {int(template_id): stamp for template_id, stamp in data.get("updated", {}).items()}
+        index.snapshot_times = list(data.get("snapshot_times", []))
+        index.snapshots = {
+            int(template_id): [(stamp, decode_bitmap(bits)) for stamp, bits in history]
+            for template_id, history in data.get("snapshots", {}).items()
+        }
+        return index
+
+    def save(self, path: str) -> None:
+        """Writes the index to disk. The file is replaced atomically so a crash can't leave a partial index behind.
+        This is blocking, so call it in a thread from async code."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_json(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["HolderIndex"]:
+        """Reads an index from disk, or returns None if there isn't one."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls.from_json(json.load(f))
+        except FileNotFoundError:
+            return None
@@ -0,0 +1,84 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Optional
+
+from utils.util import WaxNFT
+
+
+@dataclass
+class TemplateHolding:
+    # How many assets of one template a drop account holds, and what they are worth. Price is -1 if unknown.
+    template_id: int
+    name: str
+    count: int
+    price: float = -1.0
+
+    @property
+    def value(self) -> float:
+        return self.count * self.price if self.price >= 0 else 0.0
+
+
+@dataclass
+class InventoryValuation:
+    holdings: list[TemplateHolding] = field(default_factory=list)
+
+    @property
+    def total_assets(self) -> int:
+        return sum(holding.count for holding in self.holdings)
+
+    @property
+    def total_value(self) -> float:
+        return sum(holding.value for holding in self.holdings)
+
+    @property
+    def unpriced_assets(self) -> int:
+        return sum(holding.count for holding in self.holdings if holding.price < 0)
+
+    def runway(self, drops_per_day: float) -> float:
+        """Days until the inventory runs out at the given drop rate. Infinite if nothing is being dropped."""
+        if drops_per_day <= 0:
+            return float("inf")
+        return self.total_assets / drops_per_day
+
+    def render(self, drops_per_day: float) -> str:
+        """Formats the valuation as fixed width text, most valuable templates first."""
+        runway = self.runway(drops_per_day)
+        lines = [
+            f"{self.total_assets} assets across {len(self.holdings)} templates, worth {self.total_value:.2f} WAX"
+            f" ({self.unpriced_assets} assets have no cached price yet).",
+            f"At {drops_per_day:.1f} drops per day, that lasts "
+            + ("indefinitely." if runway == float("inf") else f"{runway:.1f} days."),
+            "",
+            f"{'Template':>9} {'Name':<20} {'Count':>6} {'Price':>9} {'Value':>10}",
+        ]
+        for holding in self.holdings:
+            lines.append(
+                f"{holding.template_id:>9} {holding.name[:20]:<20} {holding.count:>6} {holding.price:>9.2f} "
+                f"{holding.value:>10.2f}"
+            )
+        return "\n".join(lines)
+
+
+def value_inventory(
+    assets: Iterable[WaxNFT],
+    price_of: Callable[[int], Optional[float]],
+    names: Optional[dict[int, str]] = None,
+) -> InventoryValuation:
+    """Groups assets by template in a single pass and values each template once with price_of, which should only
+    consult cached prices. Assets without a known template are grouped under template -1."""
+    if names is None:
+        names = {}
+    counts = Counter(asset.template_id for asset in assets)
+    holdings = []
+    for template_id, count in counts.items():
+        price = price_of(template_id) if template_id >= 0 else None
+        holdings.append(
+            TemplateHolding(
+                template_id=template_id,
+                name=names.get(template_id, "Unknown"),
+                count=count,
+                price=-1.0 if price is None else price,
+            )
+        )
+    holdings.sort(key=lambda holding: (-holding.value, -holding.count))
+    return InventoryValuation(holdings)
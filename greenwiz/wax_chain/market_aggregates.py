@@ -0,0 +1,162 @@
+import asyncio
+from dataclasses import dataclass
+from time import time
+from typing import Optional
+
+import aiohttp
+
+from utils.util import log
+from wax_chain.wax_market_utils import (
+    get_lowest_current_offer,
+    get_owners,
+    get_sales_history,
+    sale_price_ema,
+)
+from wax_chain.wax_util import template_price_cache, update_cache_cards
+
+DAY = 60 * 60 * 24
+
+
+@dataclass
+class TemplateMarketStats:
+    # Precomputed market figures for one template. Prices are in WAX, -1 where there is no data.
+    template_id: int
+    card_num: int
+    name: str
+    floor: float = -1.0
+    last_sale: float = -1.0
+    last_sale_time: float = 0.0
+    volume_24h: float = 0.0
+    volume_7d: float = 0.0
+    sales_24h: int = 0
+    sales_7d: int = 0
+    holders: int = 0
+    updated: float = 0.0
+
+
+def summarize_sales(
+    sales: list[tuple[float, float]], now: Optional[float] = None
+) -> tuple[float, float, float, float, int, int]:
+    """Reduces a list of (timestamp, price) sales to last sale price, last sale time, 24h volume, 7d volume,
+    24h sale count and 7d sale count."""
+    if now is None:
+        now = time()
+    last_sale, last_sale_time = -1.0, 0.0
+    volume_24h = volume_7d = 0.0
+    sales_24h = sales_7d = 0
+    for stamp, price in sales:
+        if stamp > last_sale_time:
+            last_sale, last_sale_time = price, stamp
+        age = now - stamp
+        if age <= 7 * DAY:
+            volume_7d += price
+            sales_7d += 1
+            if age <= DAY:
+                volume_24h += price
+                sales_24h += 1
+    return last_sale, last_sale_time, volume_24h, volume_7d, sales_24h, sales_7d
+
+
+class MarketAggregates:
+    """A table of per-template market figures for a collection, kept up to date in the background by refresh so that
+    dashboards can be rendered from memory."""
+
+    def __init__(self, concurrency: int = 5) -> None:
+        self.stats: dict[int, TemplateMarketStats] = {}
+        self.updated: float = 0.0
+        self.concurrency = concurrency
+
+    def __len__(self) -> int:
+        return len(self.stats)
+
+    async def refresh(self, session: aiohttp.ClientSession) -> int:
+        """Refreshes the figures for every card, a few templates at a time. Returns how many were updated.
+        Templates that fail to refresh keep their previous figures."""
+        cards = await update_cache_cards(session)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def refresh_one(card_num: int, info: dict) -> bool:
+            async with semaphore:
+                try:
+                    await self.refresh_template(
+                        session,
+                        int(info["template_id"]),
+                        card_num,
+                        info["name"],
+                        info["issued_supply"],
+                    )
+                except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError) as e:
+                    log(f"Unable to refresh market stats for card {card_num}: {type(e)} {e}", "WARN")
+                    return False
+                return True
+
+        results = await asyncio.gather(*[refresh_one(num, info) for num, info in cards.items()])
+        return sum(results)
+
+    async def refresh_template(
+        self,
+        session: aiohttp.ClientSession,
+        template_id: int,
+        card_num: int,
+        name: str,
+        issued_supply: int = 1000,
+    ) -> TemplateMarketStats:
+        """Fetches sales, the lowest offer and the owners of one template and stores the resulting figures."""
+        sales, floor, (_, owners) = await asyncio.gather(
+            get_sales_history(template_id, session),
+            get_lowest_current_offer(template_id, session),
+            get_owners(template_id, session, num=issued_supply),
+        )
+        last_sale, last_sale_time, volume_24h, volume_7d, sales_24h, sales_7d = summarize_sales(sales)
+        stats = TemplateMarketStats(
+            template_id=template_id,
+            card_num=card_num,
+            name=name,
+            floor=floor,
+            last_sale=last_sale,
+            last_sale_time=last_sale_time,
+            volume_24h=volume_24h,
+            volume_7d=volume_7d,
+            sales_24h=sales_24h,
+            sales_7d=sales_7d,
+            holders=len(set(owners)),
+            updated=time(),
+        )
+        self.stats[template_id] = stats
+        self.updated = stats.updated
+        # The same data prices the card, so warm the fair price cache while we have it.
+        template_price_cache.set(template_id, (sale_price_ema([price for _, price in sales]), floor))
+        return stats
+
+    def rows(self, sort: str = "card") -> list[TemplateMarketStats]:
+        """Returns the stored figures ordered by card number, or by floor, 24h volume, 7d volume or holders."""
+        keys = {
+            "card": lambda s: s.card_num,
+            "floor": lambda s: (s.floor < 0, s.floor),
+            "volume": lambda s: -s.volume_24h,
+            "24h": lambda s: -s.volume_24h,
+            "7d": lambda s: -s.volume_7d,
+            "holders": lambda s: -s.holders,
+        }
+        if sort not in keys:
+            raise ValueError(f"Can't sort by {sort}, try one of {', '.join(keys)}.")
+        return sorted(self.stats.values(), key=keys[sort])
+
+    def render(self, sort: str = "card") -> str:
+        """Formats the whole table as fixed width text."""
+        rows = self.rows(sort)
+        floors = [row.floor for row in rows if row.floor >= 0]
+        lines = [
+            f"{len(rows)} templates. Collection floor: {min(floors) if floors else -1:.2f} WAX. "
+            f"24h volume: {sum(row.volume_24h for row in rows):.2f} WAX over {sum(row.sales_24h for row in rows)} "
+            f"sales. 7d volume: {sum(row.volume_7d for row in rows):.2f} WAX over "
+            f"{sum(row.sales_7d for row in rows)} sales.",
+            "",
+            f"{'#':>4} {'Name':<20} {'Floor':>9} {'Last':>9} {'24h Vol':>10} {'7d Vol':>10} {'Holders':>7}",
+        ]
+        for row in rows:
+            lines.append(
+                f"{row.card_num:>4} {row.name[:20]:<20} {row.floor:>9.2f} {row.last_sale:>9.2f} "
+                f"{row.volume_24h:>10.2f} {row.volume_7d:>10.2f} {row.holders:>7}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,60 @@
+from typing import Any
+
+import aiohttp
+
+from wax_chain.wax_market_utils import get_new_listings
+
+
+class ListingFeed:
+    """Incrementally follows new market listings of one or more collections. Each poll only returns listings which
+    weren't returned by a previous poll, so any number of consumers can share one upstream poll."""
+
+    def __init__(self, collections: list[str]) -> None:
+        self.collections = collections
+        # The highest sale id seen so far per collection. None until the first poll establishes a baseline.
+        self.last_sale_ids: dict[str, int | None] = {collection: None for collection in collections}
+
+    async def poll(self, session: aiohttp.ClientSession) -> list[dict[str, Any]]:
+        """Returns every listing created since the last poll, across all followed collections. The first poll of a
+        collection only records where the feed starts, so existing listings aren't reported as new. A collection
+        has no starting point until the market returns a sale for it, so an error or an empty response isn't
+        mistaken for a market without listings."""
+        new_listings: list[dict[str, Any]] = []
+        for collection in self.collections:
+            last_sale_id = self.last_sale_ids[collection]
+            meta: dict[str, Any] = {}
+            if last_sale_id is None:
+                listings = await get_new_listings(collection, session, max_pages=1, meta=meta)
+            else:
+                listings = await get_new_listings(collection, session, after_sale_id=last_sale_id, meta=meta)
+            if "last_sale_id" in meta:
+                self.last_sale_ids[collection] = max(last_sale_id or 0, meta["last_sale_id"])
+            if last_sale_id is not None:
+                new_listings.extend(listings)
+        return new_listings
+
+def match_price_alerts(
+    cheapest: dict[int, dict[str, Any]], subscriptions: dict[int, dict[int, float]]
+) -> dict[int, list[dict[str, Any]]]:
+    """Matches the cheapest listing of each template, from cheapest_listings, against price alerts given as
+    template_id: {user_id: max_price}. Returns the listings each user should be told about by user id."""
+    notifications: dict[int, list[dict[str, Any]]] = {}
+    for template_id, subscribers in subscriptions.items():
+        listing = cheapest.get(template_id)
+        if listing is None:
+            continue
+        for user_id, max_price in subscribers.items():
+            if listing["price"] <= max_price:
+                notifications.setdefault(user_id, []).append(listing)
+    return notifications
+
+
+def cheapest_listings(listings: list[dict[str, Any]]) -> dict[int, dict[str, Any]]:
+    """The cheapest of the listings of each template, by template id. Only these need matching against price alerts,
+    as nobody the cheapest misses would be matched by the rest."""
+    cheapest: dict[int, dict[str, Any]] = {}
+    for listing in listings:
+        current = cheapest.get(listing["template_id"])
+        if current is None or listing["price"] < current["price"]:
+            cheapest[listing["template_id"]] = listing
+    return cheapest
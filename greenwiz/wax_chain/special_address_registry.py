@@ -0,0 +1,103 @@
+import asyncio
+from time import time
+
+import aiohttp
+
+from utils.util import log
+from wax_chain.wax_addresses import async_get_special_wax_address_page, fallback_special_wax_addresses
+
+PAGE_SIZE = 1000
+
+
+class SpecialAddressRegistry:
+    """Keeps the list of special wax addresses, persisted in redis so that it is available as soon as the bot starts.
+    The list is published as an immutable frozenset which is swapped out whole on every change, so readers holding
+    the previous set never see it half updated. Each change bumps the version.
+
+    Refreshes are incremental: newly sold names show up on the last pages of the auction records, so only the pages
+    from the last, partly filled one onwards are fetched, and only new names are written to redis. Every
+    full_refresh_every refreshes, every page is fetched again in case older pages changed."""
+
+    key = "special_wax_addresses"
+
+    def __init__(self, redis, full_refresh_every: int = 7) -> None:
+        self.redis = redis
+        self.full_refresh_every = full_refresh_every
+        self.specials: frozenset[str] = frozenset()
+        self.version = 0
+        self.updated = 0.0
+        # The number of pages of auction records seen so far, including a final partly filled page.
+        self.pages = 0
+        self.refreshes = 0
+        # Whether redis holds the published list, rather than it coming from the bundled fallback file.
+        self.persisted = False
+
+    def __len__(self) -> int:
+        return len(self.specials)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.specials
+
+    def publish(self, specials: frozenset[str]) -> None:
+        self.specials = specials
+
+    async def load(self) -> str:
+        """Loads the last persisted list from redis, or the bundled fallback list if there isn't one yet.
+        Returns where the list came from."""
+        meta, members = await asyncio.gather(
+            self.redis.hgetall(f"{self.key}:meta"), self.redis.smembers(self.key)
+        )
+        if members:
+            self.version = int(meta.get("version", 0))
+            self.updated = float(meta.get("updated", 0))
+            self.pages = int(meta.get("pages", 0))
+            self.persisted = True
+            self.publish(frozenset(members))
+            return "redis"
+        self.publish(frozenset(await asyncio.to_thread(fallback_special_wax_addresses)))
+        return "fallback"
+
+    async def refresh(self, session: aiohttp.ClientSession, full: bool = False) -> int:
+        """Fetches special addresses sold since the last refresh, persists and publishes them. Returns how many new
+        addresses were found. If a page can't be fetched, whatever was found before it is still kept."""
+        # Counted from 1, so that the first refresh after loading a persisted list is incremental.
+        self.refreshes += 1
+        full = full or self.pages == 0 or self.refreshes % self.full_refresh_every == 0
+        page = 1 if full else self.pages
+        found: set[str] = set()
+        pages = self.pages
+        while True:
+            names = await async_get_special_wax_address_page(session, page)
+            if names is None:
+                break
+            found.update(names)
+            pages = max(pages, page)
+            if len(names) < PAGE_SIZE:
+                break
+            page += 1
+        new = found - self.specials
+        self.pages = pages
+        if new:
+            await self.persist(new)
+            self.publish(self.specials | new)
+        else:
+            await self.redis.hset(f"{self.key}:meta", "pages", str(self.pages))
+        return len(new)
+
+    async def persist(self, new: set[str]) -> None:
+        self.version += 1
+        self.updated = time()
+        tr = self.redis.pipeline()
+        # The first time round, seed redis with everything we know, including the fallback list.
+        tr.sadd(self.key, *(new if self.persisted else self.specials | new))
+        tr.hset(
+            f"{self.key}:meta",
+            mapping={"version": str(self.version), "updated": str(self.updated), "pages": str(self.pages)},
+        )
+        await tr.execute()
+        self.persisted = True
+        log(f"Persisted {len(new)} new special wax addresses, now at version {self.version}.")
+
+    def describe(self) -> str:
+        when = f"<t:{int(self.updated)}:R>" if self.updated else "never"
+        return f"{len(self)} special wax addresses, version {self.version}, last updated {when}."
@@ -1,11 +1,12 @@
 import re
 import requests
-from typing import Optional
+from typing import Collection, Iterable, Optional
 
 import aiohttp
 
 from utils.exceptions import UnableToCompleteRequestedAction
 from utils.settings import QUERY_SPECIALS_URL, ENV
+from utils.util import log
 
 fallback_file_name: str = "fallback_special_wax_addresses.txt"
 _fallback_special_wax_addresses: set[str] = set()
@@ -51,7 +52,7 @@ def _update_fallback_special_wax_addresses(filename: str = fallback_file_name) -
     return True
 
 
-extra_specials = {"wam", "waa", "wax"}
+extra_specials = frozenset({"wam", "waa", "wax"})
 system_accounts = {
     "eosio.bpay",
     "eosio.msig",
@@ -66,28 +67,72 @@ system_accounts = {
 }
 
 
+_address_pattern = re.compile(r"[a-z1-5.]{1,12}")
+_address_pattern_ci = re.compile(r"[a-z1-5.]{1,12}", flags=re.I)
+_base_pattern = re.compile(r"\.?(?P<a>[a-z1-5]+$)")
+_base_pattern_ci = re.compile(r"\.?(?P<a>[a-z1-5]+$)", flags=re.I)
+
+
+class WaxAddressValidator:
+    """Validates wax addresses against one version of the special address list. The list is merged with the extra
+    specials into a single frozen set once, so validating many addresses doesn't copy it for each one."""
+
+    def __init__(self, valid_specials: Optional[Iterable[str]] = None, case_sensitive: bool = False) -> None:
+        if valid_specials is None:
+            valid_specials = fallback_special_wax_addresses()
+        self.specials: frozenset[str] = frozenset(valid_specials) | extra_specials
+        self.address_pattern = _address_pattern if case_sensitive else _address_pattern_ci
+        self.base_pattern = _base_pattern if case_sensitive else _base_pattern_ci
+
+    def is_valid(self, addr: str) -> bool:
+        if len(addr) > 12 or self.address_pattern.fullmatch(addr) is None:
+            return False
+        if len(addr) == 12 or addr in system_accounts:
+            return True
+        base = self.base_pattern.search(addr)
+        return base is not None and base.group("a") in self.specials
+
+    def partition(self, addresses: Iterable[str]) -> tuple[list[str], list[str]]:
+        """Splits addresses into valid and invalid ones in a single pass, keeping their order."""
+        valid: list[str] = []
+        invalid: list[str] = []
+        is_valid = self.is_valid
+        for addr in addresses:
+            (valid if is_valid(addr) else invalid).append(addr)
+        return valid, invalid
+
+
+# The most recently used validator, reused for as long as callers pass the same, unchanged special address list.
+_validator_cache: dict[bool, tuple[Optional[Collection[str]], int, WaxAddressValidator]] = {}
+
+
+def wax_address_validator(
+    valid_specials: Optional[Collection[str]] = None, case_sensitive: bool = False
+) -> WaxAddressValidator:
+    """Returns a validator for a special address list, only building a new one when a different list is passed."""
+    size = -1 if valid_specials is None else len(valid_specials)
+    cached = _validator_cache.get(case_sensitive)
+    if cached is not None and cached[0] is valid_specials and cached[1] == size:
+        return cached[2]
+    validator = WaxAddressValidator(valid_specials, case_sensitive=case_sensitive)
+    _validator_cache[case_sensitive] = (valid_specials, size, validator)
+    return validator
+
+
 def is_valid_wax_address(addr: str, valid_specials: Optional[set[str]] = None, case_sensitive: bool = False) -> bool:
     """Returns whether the provided string is a valid wax address. An optional
     valid_specials allows injecting an up to date list of special wax addresses,
      otherwise the stored list will be used. It is recommended to use
      get_special_wax_address_list to provide this function with an up to date list."""
-    flags = 0 if case_sensitive else re.I
-    if len(addr) > 12:
-        return False
-    match = re.match(r"[a-z1-5\.]{1,12}", addr, flags=flags)
-    if match is None:
-        return False
-    if match.group() != addr:
-        return False
-    if len(match.group()) == 12:
-        return True
-    if match.group() in system_accounts:
-        return True
-    base = re.search(r"\.?(?P<a>[a-z1-5]+$)", match.group(), flags=flags)
-    if base is None:
-        return False
-    valid_specials = valid_specials or fallback_special_wax_addresses()
-    return base.group("a") in valid_specials | extra_specials
+    return wax_address_validator(valid_specials or None, case_sensitive).is_valid(addr)
+
+
+def validate_wax_addresses(
+    addresses: Iterable[str], valid_specials: Optional[Collection[str]] = None, case_sensitive: bool = False
+) -> tuple[list[str], list[str]]:
+    """Splits addresses into valid and invalid wax addresses, in order, in one pass. Prefer this to calling
+    is_valid_wax_address in a loop."""
+    return wax_address_validator(valid_specials or None, case_sensitive).partition(addresses)
 
 
 def parse_wax_address(
@@ -109,7 +154,7 @@ def get_special_wax_address_list() -> set[str]:
     eosauthority's api's records of auctions. Failing that, it returns a hardcoded
     list as a fallback. This method is syncronous, using requests."""
     page = 1
-    specials = fallback_special_wax_addresses()
+    specials = set(fallback_special_wax_addresses())
     while True:
         with requests.get(f"{QUERY_SPECIALS_URL}{page}&sort=rank&type=sold") as resp:
             if int(resp.status_code) != 200:  # type: ignore[attr-defined]
@@ -133,6 +178,27 @@ def get_special_wax_address_list() -> set[str]:
     return specials
 
 
+async def async_get_special_wax_address_page(
+    session: aiohttp.ClientSession, page: int
+) -> Optional[list[str]]:
+    """Fetches one page of up to 1000 special wax addresses from eosauthority's api's records of auctions.
+    Returns None if the page couldn't be fetched."""
+    async with session.get(f"{QUERY_SPECIALS_URL}{page}&sort=rank&type=sold") as resp:
+        if int(resp.status) != 200:
+            log(
+                f"Unable to update special wax addresses at the moment, using stored list. Received status "
+                f"{resp.status}",
+                "WARN",
+            )
+            return None
+        try:
+            respo = await resp.json()
+            return [x["newname"] for x in respo["sold"]["data"]]
+        except KeyError:
+            log("Key error attempting to decode data in async_get_special_wax_address_page", "WARN")
+            return None
+
+
 async def async_get_special_wax_address_list(
     session: aiohttp.ClientSession,
 ) -> set[str]:
@@ -142,26 +208,12 @@ async def async_get_special_wax_address_list(
     if session.closed:
         raise UnableToCompleteRequestedAction
     page = 1
-    specials = fallback_special_wax_addresses()
+    specials = set(fallback_special_wax_addresses())
     while True:
-        async with session.get(
-            f"{QUERY_SPECIALS_URL}{page}&sort=rank&type=sold"
-        ) as resp:
-            if int(resp.status) != 200:
-                print(
-                    f"Unable to update special wax addresses at the moment, "
-                    f"using stored list. Received status {resp.status}"
-                )
-                return specials
-            try:
-                respo = await resp.json()
-                response = respo["sold"]["data"]
-            except KeyError:
-                print(
-                    "Key error attempting to decode data in get_special_wax_address_list"
-                )
-                return specials
-        specials.update([x["newname"] for x in response])
+        response = await async_get_special_wax_address_page(session, page)
+        if response is None:
+            return specials
+        specials.update(response)
         if len(response) < 1000:
             break
         page += 1
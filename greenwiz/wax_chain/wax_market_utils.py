@@ -1,4 +1,5 @@
 from math import ceil
+from typing import Any, Optional
 
 import aiohttp
 
@@ -83,13 +84,27 @@ async def get_owners(
     return template_id, prep_list
 
 
-async def get_sales(template_id: int, session: aiohttp.ClientSession) -> list[float]:
-    """Returns a list of past sale prices in WAX for the specified template_id"""
+async def get_sales_history(
+    template_id: int, session: aiohttp.ClientSession
+) -> list[tuple[float, float]]:
+    """Returns a list of (timestamp, price in WAX) for recent sales of the specified template_id, in the order the
+    api returns them (newest first). Timestamps are in seconds since the epoch."""
     params = {"symbol": "WAX", "template_id": template_id}
     async with session.get(market_api + "prices/sales", params=params) as response:
         json_obj = await response.json()
     data = json_obj["data"]
-    return [int(item["price"]) / (10 ** item["token_precision"]) for item in data]
+    return [
+        (
+            int(item.get("block_time", 0)) / 1000,
+            int(item["price"]) / (10 ** item["token_precision"]),
+        )
+        for item in data
+    ]
+
+
+async def get_sales(template_id: int, session: aiohttp.ClientSession) -> list[float]:
+    """Returns a list of past sale prices in WAX for the specified template_id"""
+    return [price for _, price in await get_sales_history(template_id, session)]
 
 
 async def get_lowest_current_offer(
@@ -123,7 +138,12 @@ async def get_geometric_regressed_sale_price(
     template_id: int, session: aiohttp.ClientSession
 ) -> float:
     """Returns the exponential moving average of sales price based on recent sales for a given template id"""
-    prices = await get_sales(template_id, session)
+    return sale_price_ema(await get_sales(template_id, session))
+
+
+def sale_price_ema(prices: list[float]) -> float:
+    """Returns the exponential moving average of a list of sale prices, newest first. -1 if there are none."""
+    prices = list(prices)
     num_data_points = len(prices)
     if num_data_points < 1:
         return -1
@@ -136,3 +156,54 @@ async def get_geometric_regressed_sale_price(
         num_data_points = max_precision if i > max_precision else i
         ma = ema(prices[i], ma, num_data_points)
     return ma
+
+
+async def get_new_listings(
+    collection: str,
+    session: aiohttp.ClientSession,
+    after_sale_id: int = 0,
+    max_pages: int = 5,
+    meta: Optional[dict[str, Any]] = None,
+) -> list[dict[str, Any]]:
+    """Returns the active single-asset market listings of a collection with a sale id greater than after_sale_id,
+    newest first, as dicts with sale_id, template_id, asset_id, seller and price (in WAX). Stops paging at the first
+    listing already seen, so a poll costs one request unless more than a page was listed since the last one.
+    If meta is given, its "last_sale_id" is set to the highest sale id returned by the market, bundles included,
+    when there was one."""
+    listings: list[dict[str, Any]] = []
+    for page in range(1, max_pages + 1):
+        params = {
+            "state": 1,
+            "collection_name": collection,
+            "symbol": "WAX",
+            "sort": "created",
+            "order": "desc",
+            "limit": 100,
+            "page": page,
+        }
+        async with session.get(market_api + "sales", params=params) as response:
+            json_obj = await response.json()
+        data = json_obj.get("data", None) or []
+        for item in data:
+            sale_id = int(item["sale_id"])
+            if meta is not None:
+                meta["last_sale_id"] = max(meta.get("last_sale_id", sale_id), sale_id)
+            if sale_id <= after_sale_id:
+                return listings
+            if len(item.get("assets", [])) != 1:
+                continue  # Bundles don't have a per-card price
+            asset = item["assets"][0]
+            template = asset.get("template") or {}
+            listings.append(
+                {
+                    "sale_id": sale_id,
+                    "template_id": int(template.get("template_id", -1)),
+                    "asset_id": int(asset["asset_id"]),
+                    "seller": item.get("seller", ""),
+                    "price": int(item["price"]["amount"])
+                    / (10 ** int(item["price"]["token_precision"])),
+                }
+            )
+        if len(data) < 100:
+            break
+    return listings
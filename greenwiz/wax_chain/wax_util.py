@@ -19,9 +19,9 @@ Utilities for interacting with unreliable Wax endpoints for transactions on that
 import asyncio
 import binascii
 import hashlib
+import os
 import traceback
 from json import JSONDecodeError, dumps
-from time import time
 from typing import Any, List, Optional, Union
 
 import aiohttp
@@ -39,6 +39,7 @@ from aioeosabi.exceptions import EosAssertMessageException, EosRpcException
 from aioeosabi.rpc import ERROR_NAME_MAP
 from aiohttp import ClientConnectorError, ClientOSError, ServerDisconnectedError
 from discord import Forbidden, HTTPException
+from utils.async_cache import AsyncTTLCache
 from utils.exceptions import (
     InvalidInput,
     InvalidResponse,
@@ -51,9 +52,10 @@ from utils.settings import (
     MONKEYMATCH_PRIV_KEY,
     SALT_ACC_PERMISSION,
     TIP_ACC_PERMISSION,
+    WAX_CACHE_MAX_ENTRIES,
     WAX_CACHE_TIME,
 )
-from utils.util import WaxNFT, load_json_var, log, today, usage_react, write_json_var
+from utils.util import WaxNFT, load_json_var, log, usage_react
 
 from wax_chain.collection_config import determine_collection, get_collection_info
 from wax_chain.wax_contracts import atomicassets, atomictoolsx, monkeysmatch
@@ -203,11 +205,16 @@ full_api_weighted_list = [
     {"node_url": "https://eu.wax.eosrio.io", "type": "history", "weight": 0},
 ]
 
-wax_dict: dict[str, dict[int, dict[str, str]]] = {}
-cache_ages: dict[str, dict[int, float]] = {}
-cache_cards, card_cache_age = {}, 0
-template_id_price_cache: dict[int, tuple[float, float]] = {}
-template_id_price_cache_ages: dict[int, float] = {}
+# Card distribution by (collection, page), card info by collection, and (sale ema, lowest offer) by template id.
+card_dict_cache: AsyncTTLCache[tuple[str, int], dict[int, dict[str, str]]] = AsyncTTLCache(
+    WAX_CACHE_TIME, maxsize=WAX_CACHE_MAX_ENTRIES, name="card distribution"
+)
+card_info_cache: AsyncTTLCache[str, dict[int, dict[str, Any]]] = AsyncTTLCache(
+    WAX_CACHE_TIME, maxsize=WAX_CACHE_MAX_ENTRIES, name="card info"
+)
+template_price_cache: AsyncTTLCache[int, tuple[float, float]] = AsyncTTLCache(
+    WAX_CACHE_TIME, maxsize=WAX_CACHE_MAX_ENTRIES, name="template price"
+)
 
 
 # https://validate.eosnation.io/wax/reports/endpoints.html
@@ -855,25 +862,13 @@ class WaxConnection:
         raise UnableToCompleteRequestedAction("All the apis I am connected to appear to be down at the moment. (2)")
 
 
-def incr_given_today(uid: int) -> None:
-    usage = load_json_var("card_sends")
-    log(f"Reading usage: {usage}", "TST")
-    try:
-        usage[today()][str(uid)] += 1
-    except KeyError:
-        try:
-            usage[today()][str(uid)] = 1
-        except KeyError:
-            usage[today()] = dict()
-            usage[today()][str(uid)] = 1
-    log(f"Writing usage: {usage}", "DBUG")
-    write_json_var("card_sends", usage)
-
-
-def check_given_today(uid: int) -> int:
-    usage = load_json_var("card_sends")
-    res = int(usage.get(today(), {}).get(str(uid), 0))
-    return res
+async def import_card_sends(bot_) -> None:
+    """Moves the daily drop counts from the file they used to be kept in to redis, once."""
+    if not os.path.exists("./res/card_sends.json"):
+        return
+    usage = await asyncio.to_thread(load_json_var, "card_sends")
+    if await bot_.storage[None].drops.import_json(usage):
+        log(f"Imported daily drop counts for {len(usage)} days from card_sends.json", "INFO")
 
 
 async def schedule_dm_user(user, increments, message) -> None:
@@ -886,17 +881,14 @@ async def schedule_dm_user(user, increments, message) -> None:
 
 
 async def get_template_id(card_num: int, session: aiohttp.ClientSession) -> int:
-    global cache_cards, card_cache_age
-    cache_cards = await update_cache_cards(session)
-    try:
-        card_info: dict[str, int] = cache_cards[card_num]
-    except IndexError:
-        await update_cache_cards(session)
-        try:
-            card_info = cache_cards[card_num]
-        except IndexError:
+    """Converts a cryptomonKey card number into its template id. Returns -1 if there is no such card."""
+    card_info = (await update_cache_cards(session)).get(card_num)
+    if card_info is None:
+        # The card may have been created since the cache was last refreshed.
+        card_info = (await update_cache_cards(session, force=True)).get(card_num)
+        if card_info is None:
             return -1
-    return card_info["template_id"]
+    return int(card_info["template_id"])
 
 
 async def announce_drop(
@@ -1035,8 +1027,8 @@ async def send_and_announce_drop(
     if wax_con is None:
         wax_con = bot_.wax_con
 
-    linked_wallet = await bot_.storage[None].get_note(member, "LinkedWallet")
-    if linked_wallet == "Not found.":
+    linked_wallet = await bot_.storage[None].wallets.get_wallet(member.id)
+    if linked_wallet is None:
         link: Claimlink = await wax_con.get_random_claim_link(
             str(member)[:50], memo=reason, num=num, collection=collection
         )
@@ -1121,17 +1113,19 @@ async def send_link_start_to_finish(
         # doublespends of finite drops.
         bot_.drop_send_reentrancy[sender.id] = True
 
+    drops = bot_.storage[None].drops
     used = 0
     if authd < 2:
-        # Verify nifty not spamming
-        used = check_given_today(sender.id)
-        if used >= cinfo.daily_limit:
+        # Verify nifty not spamming. The drop is counted now, and given back if it can't be sent, so that
+        # simultaneous drops can't go over the limit.
+        allowed, used, claimed_on = await drops.claim(sender.id, cinfo.daily_limit)
+        if not allowed:
             bot_.drop_send_reentrancy[sender.id] = False
             raise InvalidInput("You have given out the maximum number of drops for today. Try again tomorrow.")
+        used -= 1
         # Allow for easy testing of the daily limit
         if "test42" in reason:
             try:
-                incr_given_today(sender.id)
                 await message.add_reaction("✔")
                 await usage_react(used, message)
             finally:
@@ -1139,6 +1133,7 @@ async def send_link_start_to_finish(
             await message.channel.send(f"Command usages today: {used + 1}/{cinfo.daily_limit}")
             return [-1]
 
+    sent = False
     try:
         await message.add_reaction("⌛")
 
@@ -1150,11 +1145,13 @@ async def send_link_start_to_finish(
             wax_con=wax_con,
             num=num,
         )
-
-        if authd < 2:
-            incr_given_today(sender.id)
+        sent = True
     finally:
         bot_.drop_send_reentrancy[sender.id] = False
+        # Checked here rather than in an except block so that the drop is also given back if the command is
+        # cancelled. Shielded so that being cancelled again doesn't interrupt giving it back.
+        if not sent and authd < 2:
+            await asyncio.shield(drops.release(sender.id, claimed_on))
 
     await message.clear_reactions()
     await message.add_reaction("✔")
@@ -1194,116 +1191,115 @@ async def get_card_dict(
     :param force: Whether to query api even if cache time hasn't passed
     :return: the dict of relevant info, has the form
     :param show_prices: Whether to get the prices for each card as well
-    {collection: {template_id: {'name': name, 'max_supply': max_supply, 'undistributed': undistributed,
-     'distributed_percentage': distributed_percentage}}}
+    {template_id: {'name': name, 'max_supply': max_supply, 'undistributed': undistributed,
+     'distributed_percentage': distributed_percentage}}
     """
-    global wax_dict, cache_ages
-    collection_caches = cache_ages.get(collection, {})
-    last_cached_time = collection_caches.get(page, 0)
-
-    if time() - last_cached_time < WAX_CACHE_TIME and collection in wax_dict and not force and not show_prices:
-        # If cache has this collection and time hasn't yet passed, use cached dict
-        return wax_dict[collection]
-    if not (time() - last_cached_time < WAX_CACHE_TIME and collection in wax_dict and not force):
-        try:
-            params = {"limit": 24, "collection_name": collection, "page": page}
-            async with session.get(atomic_api + "templates", params=params) as response:
-                try:
-                    json_data = await response.json()
-                    if response.status == 429:
-                        log("I've been rate limited by the wax_chain api.", "WARN")
-                        return wax_dict[collection]
-                    response_data = json_data["data"]
-                except (aiohttp.ContentTypeError, KeyError) as e:
-                    log(f"{type(e)} trying to fetch card distribution: {e}.", "WARN")
-                    return wax_dict.get(collection, {})
-        except aiohttp.ClientConnectionError:
-            log("Unable to connect to api to fetch card distribution.", "WARN")
-            return wax_dict[collection]
-        base_addr = response_data[0]["collection"]["author"]
-        wax_dict[collection] = {}
-        if response_data[0]["collection"]["collection_name"] != collection:
-            raise NameError("Collection not found.")
-        templates = {
-            int(item["template_id"]): {
-                "name": item["name"],
-                "issued_supply": int(item["issued_supply"]),
-                "max_supply": int(item["max_supply"]),
-            }
-            for item in response_data
+    try:
+        cards = await card_dict_cache.get(
+            (collection, page), lambda: fetch_card_dict(session, collection, page), force=force
+        )
+    except InvalidResponse as e:
+        log(f"{e} Using the last known card distribution.", "WARN")
+        cards = card_dict_cache.peek((collection, page), {})
+
+    if not show_prices:
+        return cards
+
+    # Prices are added to a copy so that the cached distribution isn't mutated.
+    priced = {card_id: dict(card) for card_id, card in cards.items()}
+    price_responses = await asyncio.gather(
+        *[get_fair_price_for_card(card_id, session, detail=True) for card_id in priced]  # type: ignore[arg-type]
+    )
+    for combined_resp in price_responses:
+        # Values are split out like this for type checker
+        _card_id: int = combined_resp[0]
+        market: float = combined_resp[1]
+        sale_ema: float = combined_resp[2]
+        lowest_offer: float = combined_resp[3]
+        priced[_card_id]["fair_price"] = str(market)
+        priced[_card_id]["sale_ema"] = str(sale_ema)
+        priced[_card_id]["lowest_offer"] = str(lowest_offer)
+    return priced
+
+
+async def fetch_card_dict(
+    session: aiohttp.ClientSession, collection: str = DEFAULT_WAX_COLLECTION, page: int = 1
+) -> dict[int, dict[str, str]]:
+    """Fetches one page of a collection's card distribution from the atomic api. Raises InvalidResponse if the api
+    can't be reached or responds badly. Use get_card_dict for the cached version."""
+    try:
+        params = {"limit": 24, "collection_name": collection, "page": page}
+        async with session.get(atomic_api + "templates", params=params) as response:
+            try:
+                json_data = await response.json()
+                if response.status == 429:
+                    raise InvalidResponse("I've been rate limited by the wax_chain api.")
+                response_data = json_data["data"]
+            except (aiohttp.ContentTypeError, KeyError) as e:
+                raise InvalidResponse(f"{type(e)} trying to fetch card distribution: {e}.") from e
+    except aiohttp.ClientConnectionError as e:
+        raise InvalidResponse("Unable to connect to api to fetch card distribution.") from e
+    base_addr = response_data[0]["collection"]["author"]
+    if response_data[0]["collection"]["collection_name"] != collection:
+        raise NameError("Collection not found.")
+    templates = {
+        int(item["template_id"]): {
+            "name": item["name"],
+            "issued_supply": int(item["issued_supply"]),
+            "max_supply": int(item["max_supply"]),
         }
-        _tasks = []
-        for template in templates:
-            _tasks.append(asyncio.create_task(get_owners(template, session, num=templates[template]["issued_supply"])))
-        responses: list[tuple[int, list[str]]] = await asyncio.gather(
-            *_tasks
-        )  # a list of the list of owners of each card
-        try:
-            cache_ages[collection][page] = time()
-        except KeyError:
-            cache_ages[collection] = {}
-            cache_ages[collection][page] = time()
-        for card_id, _response in responses:
-            max_card = templates[card_id]["max_supply"]
-            undistributed: int = _response.count(base_addr) + (max_card - templates[card_id]["issued_supply"])
-            if max_card == 0:
-                distributed_percentage = 0
-            else:
-                distributed_percentage = int((max_card - undistributed) / max_card * 100)
-            card_dict = {
-                "name": templates[card_id]["name"],
-                "max_supply": templates[card_id]["max_supply"],
-                "undistributed": undistributed,
-                "distributed_percentage": distributed_percentage,
-            }
-            wax_dict[collection][card_id] = card_dict
-
-    if show_prices:
-        _tasks = []
-        for card_id in wax_dict[collection]:
-            _tasks.append(
-                asyncio.create_task(
-                    get_fair_price_for_card(card_id, session, detail=True)  # type: ignore[arg-type]
-                )
-            )
-        new_responses = await asyncio.gather(*_tasks)
-        for combined_resp in new_responses:
-            # Values are split out like this for type checker
-            _card_id: int = combined_resp[0]
-            market: float = combined_resp[1]
-            sale_ema: float = combined_resp[2]
-            lowest_offer: float = combined_resp[3]
-            wax_dict[collection][_card_id]["fair_price"] = str(market)
-            wax_dict[collection][_card_id]["sale_ema"] = str(sale_ema)
-            wax_dict[collection][_card_id]["lowest_offer"] = str(lowest_offer)
-
-    return wax_dict[collection]
-
-
-async def update_cache_cards(session: aiohttp.ClientSession, force: bool = False) -> dict[int, dict[str, int]]:
-    global cache_cards, card_cache_age
+        for item in response_data
+    }
+    responses: list[tuple[int, list[str]]] = await asyncio.gather(
+        *[get_owners(template, session, num=templates[template]["issued_supply"]) for template in templates]
+    )  # a list of the list of owners of each card
+    cards: dict[int, dict[str, Any]] = {}
+    for card_id, _response in responses:
+        max_card = templates[card_id]["max_supply"]
+        undistributed: int = _response.count(base_addr) + (max_card - templates[card_id]["issued_supply"])
+        if max_card == 0:
+            distributed_percentage = 0
+        else:
+            distributed_percentage = int((max_card - undistributed) / max_card * 100)
+        cards[card_id] = {
+            "name": templates[card_id]["name"],
+            "max_supply": templates[card_id]["max_supply"],
+            "undistributed": undistributed,
+            "distributed_percentage": distributed_percentage,
+        }
+    return cards
+
+
+async def update_cache_cards(session: aiohttp.ClientSession, force: bool = False) -> dict[int, dict[str, Any]]:
+    """Returns info on every cryptomonKey by card number, refreshing as necessary."""
     collection = DEFAULT_WAX_COLLECTION
-    if time() - card_cache_age < WAX_CACHE_TIME and not force:
-        # If cache has this collection and time hasn't yet passed, use cached dict
-        return cache_cards
+    try:
+        return await card_info_cache.get(collection, lambda: fetch_card_info(session, collection), force=force)
+    except InvalidResponse as e:
+        log(f"{e} Using the last known card info.", "WARN")
+        return card_info_cache.peek(collection, {})
+
+
+async def fetch_card_info(
+    session: aiohttp.ClientSession, collection: str = DEFAULT_WAX_COLLECTION
+) -> dict[int, dict[str, Any]]:
+    """Fetches info on every card of a collection from the atomic api, by card number. Raises InvalidResponse if the
+    api can't be reached or responds badly. Use update_cache_cards for the cached version."""
     try:
         params = {"limit": 1000, "collection_name": collection}
         async with session.get(atomic_api + "templates", params=params) as response:
             try:
                 json_data = await response.json()
                 if response.status == 429:
-                    log("I've been rate limited by the wax_chain api.", "WARN")
-                    return cache_cards
+                    raise InvalidResponse("I've been rate limited by the wax_chain api.")
                 response_data = json_data["data"]
-            except aiohttp.ContentTypeError:
-                log("ContentTypeError trying to fetch card info.", "WARN")
-                return cache_cards
-    except aiohttp.ClientConnectionError:
-        log("Unable to connect to api to fetch card info.", "WARN")
-        return cache_cards
+            except aiohttp.ContentTypeError as e:
+                raise InvalidResponse("ContentTypeError trying to fetch card info.") from e
+    except aiohttp.ClientConnectionError as e:
+        raise InvalidResponse("Unable to connect to api to fetch card info.") from e
     if response_data[0]["collection"]["collection_name"] != collection:
         raise NameError("Collection not found.")
-    cache_cards = {
+    return {
         int(item["immutable_data"].get("card_id", "0")): {
             "name": item["name"],
             "rarity": item["immutable_data"].get("rarity", ""),
@@ -1319,7 +1315,15 @@ async def update_cache_cards(session: aiohttp.ClientSession, force: bool = False
         }
         for item in response_data
     }
-    return cache_cards
+
+
+async def fetch_template_price(template_id: int, session: aiohttp.ClientSession) -> tuple[float, float]:
+    """Fetches the sale price ema and the lowest current offer for a template id."""
+    sale_ema, lowest_offer = await asyncio.gather(
+        get_geometric_regressed_sale_price(template_id, session),
+        get_lowest_current_offer(template_id, session),
+    )
+    return sale_ema, lowest_offer
 
 
 async def get_fair_price_for_card(
@@ -1330,18 +1334,20 @@ async def get_fair_price_for_card(
 ) -> Union[float, tuple[int, float, float, float]]:
     if 0 < template_id < 1000:
         template_id = await get_template_id(template_id, session)
-    global template_id_price_cache_ages, template_id_price_cache
-    last_cached_time = template_id_price_cache_ages.get(template_id, 0)
-    if time() - last_cached_time < WAX_CACHE_TIME and template_id in template_id_price_cache and not force:
-        # If cache has this collection and time hasn't yet passed, use cached dict
-        sale_ema, lowest_offer = template_id_price_cache[template_id]
-    else:
-        sale_ema = await get_geometric_regressed_sale_price(template_id, session)
-        lowest_offer = await get_lowest_current_offer(template_id, session)
-        template_id_price_cache_ages[template_id] = time()
-        template_id_price_cache[template_id] = (sale_ema, lowest_offer)
+    sale_ema, lowest_offer = await template_price_cache.get(
+        template_id, lambda: fetch_template_price(template_id, session), force=force
+    )
 
     market: float = fair_est(sale_ema, lowest_offer)
     if not detail:
         return market
     return template_id, market, sale_ema, lowest_offer
+
+
+def cached_fair_price(template_id: int) -> Optional[float]:
+    """The fair price of a template from whatever is already in the price cache, however old, without fetching
+    anything. None if the template hasn't been priced yet."""
+    prices = template_price_cache.peek(template_id)
+    if prices is None:
+        return None
+    return fair_est(*prices)
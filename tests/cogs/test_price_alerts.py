@@ -0,0 +1,89 @@
+import asyncio
+from pathlib import Path
+import sys
+from types import SimpleNamespace
+from typing import Any, Optional
+
+import discord
+from redis.exceptions import RedisError
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from cogs.price_alerts import PriceAlerts
+from tests.fake_redis import FakeRedis
+from utils.storage import StorageManager
+
+
+class FakeUser:
+    def __init__(self, error: Optional[Exception] = None) -> None:
+        self.error = error
+        self.sent: list[str] = []
+
+    async def send(self, content: str) -> None:
+        if self.error is not None:
+            raise self.error
+        self.sent.append(content)
+
+
+def http_error(exc_type: type[discord.HTTPException], status: int) -> discord.HTTPException:
+    return exc_type(SimpleNamespace(status=status, reason="error"), "error")
+
+
+def cog_for(users: dict[int, FakeUser]) -> tuple[Any, StorageManager, list[str]]:
+    """Stands in for the cog in notify, with users as the only users the bot can find."""
+    storage = StorageManager(SimpleNamespace(redis=FakeRedis(), settings=SimpleNamespace(DEFAULT_PREFIX=",")))
+    logged: list[str] = []
+
+    async def fetch_user(user_id: int) -> FakeUser:
+        if user_id not in users:
+            raise http_error(discord.NotFound, 404)
+        return users[user_id]
+
+    bot = SimpleNamespace(get_user=lambda user_id: None, fetch_user=fetch_user)
+    cog = SimpleNamespace(bot=bot, alerts=storage, log=lambda message, level="INFO": logged.append(message))
+    return cog, storage, logged
+
+
+def test_alerts_are_removed_only_once_delivered() -> None:
+    users = {
+        1: FakeUser(),
+        2: FakeUser(http_error(discord.Forbidden, 403)),
+        3: FakeUser(http_error(discord.HTTPException, 500)),
+    }
+    cog, storage, logged = cog_for(users)
+    listing = {"sale_id": 7, "template_id": 100, "asset_id": 7, "seller": "s.wam", "price": 2.0}
+
+    async def run() -> None:
+        for user_id in (1, 2, 3, 4):
+            await storage.add_price_alert(user_id, 100, 5.0)
+        for user_id in (1, 2, 3, 4):
+            await PriceAlerts.notify(cog, user_id, [listing])
+        assert await storage.get_price_alerts([100]) == {100: {2: 5.0, 3: 5.0}}
+
+    asyncio.run(run())
+
+    assert "2.00 WAX" in users[1].sent[0] and "/sale/7>" in users[1].sent[0]
+    assert len(logged) == 3
+
+
+def test_a_failed_check_is_logged_rather_than_ending_the_loop() -> None:
+    logged: list[str] = []
+
+    class FailingFeed:
+        async def poll(self, session: Any) -> list[dict[str, Any]]:
+            return [{"sale_id": 7, "template_id": 100, "asset_id": 7, "seller": "s.wam", "price": 2.0}]
+
+    class FailingAlerts:
+        async def get_price_alerts(self, template_ids: list[int]) -> dict[int, dict[int, float]]:
+            raise RedisError("Connection reset by peer")
+
+    cog = SimpleNamespace(
+        session=SimpleNamespace(closed=False),
+        feed=FailingFeed(),
+        alerts=FailingAlerts(),
+        log=lambda message, level="INFO": logged.append(message),
+    )
+
+    asyncio.run(PriceAlerts.check_price_alerts.coro(cog))
+
+    assert len(logged) == 1 and "Connection reset" in logged[0]
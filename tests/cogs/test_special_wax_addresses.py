@@ -0,0 +1,22 @@
+import asyncio
+from pathlib import Path
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from cogs.special_wax_addresses import SpecialWaxAddresses
+from tests.fake_redis import FakeRedis
+from wax_chain.special_address_registry import SpecialAddressRegistry
+
+
+def test_specials_are_loaded_with_the_cog() -> None:
+    redis = FakeRedis()
+    redis.data[SpecialAddressRegistry.key] = {"a", "b"}
+    bot = SimpleNamespace(
+        special_addresses=SpecialAddressRegistry(redis), special_addr_list=frozenset(), log=lambda *_args: None
+    )
+
+    asyncio.run(SpecialWaxAddresses.cog_load(SimpleNamespace(bot=bot)))  # type: ignore[arg-type]
+
+    assert bot.special_addr_list == {"a", "b"}
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import inspect
+import json
+from typing import Any, AsyncIterator, Callable
+
+import aiohttp
+
+
+class FakeContent:
+    def __init__(self, body: bytes, chunk_size: int) -> None:
+        self._body = body
+        self._chunk_size = chunk_size
+
+    async def iter_chunked(self, n: int) -> AsyncIterator[bytes]:
+        size = min(n, self._chunk_size)
+        for start in range(0, len(self._body), size):
+            yield self._body[start:start + size]
+
+
+class FakeResponse:
+    """A response which can be awaited or used as an async context manager, like aiohttp's."""
+
+    def __init__(self, session: "FakeSession", url: str) -> None:
+        self._session = session
+        self._url = url
+        self.status = 0
+        self.body = b""
+        self.content = FakeContent(b"", session.chunk_size)
+
+    async def _resolve(self) -> "FakeResponse":
+        result = self._session.handler(self._url)
+        if inspect.isawaitable(result):
+            result = await result
+        self.status, body = result if isinstance(result, tuple) else (200, result)
+        self.body = json.dumps(body).encode()
+        self.content = FakeContent(self.body, self._session.chunk_size)
+        return self
+
+    def __await__(self):
+        return self._resolve().__await__()
+
+    async def __aenter__(self) -> "FakeResponse":
+        return await self._resolve()
+
+    async def __aexit__(self, *args: Any) -> None:
+        return None
+
+    def raise_for_status(self) -> None:
+        if self.status >= 400:
+            raise aiohttp.ClientConnectionError(f"HTTP {self.status}")
+
+    async def json(self) -> Any:
+        return json.loads(self.body)
+
+
+class FakeSession:
+    """Answers GET requests by calling handler(url), which returns (or is a coroutine returning) a json-serialisable
+    body or (status, body). Bodies are delivered in chunks of chunk_size bytes, to exercise incremental parsing.
+    Records the timeout of every request."""
+
+    def __init__(self, handler: Callable[[str], Any], chunk_size: int = 37) -> None:
+        self.handler = handler
+        self.chunk_size = chunk_size
+        self.timeouts: list[Any] = []
+
+    def get(self, url: str, headers: Any = None, timeout: Any = None) -> FakeResponse:
+        self.timeouts.append(timeout)
+        return FakeResponse(self, url)
@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from decimal import Decimal, InvalidOperation, localcontext
+from fractions import Fraction
+from fnmatch import fnmatchcase
+from typing import Any, AsyncIterator, Optional
+
+from redis.exceptions import ResponseError
+
+from utils import redis_scripts
+
+WRONGTYPE = "WRONGTYPE Operation against a key holding the wrong kind of value"
+
+
+class FakePipeline:
+    """Queues commands and runs them against the fake on execute, like a redis pipeline."""
+
+    def __init__(self, redis: "FakeRedis") -> None:
+        self._redis = redis
+        self._commands: list[tuple[str, tuple[Any, ...], dict[str, Any]]] = []
+
+    def __getattr__(self, name: str) -> Any:
+        def queue(*args: Any, **kwargs: Any) -> "FakePipeline":
+            self._commands.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self, raise_on_error: bool = True) -> list[Any]:
+        await self._redis.round_trip()
+        results = []
+        for name, args, kwargs in self._commands:
+            try:
+                results.append(await getattr(self._redis, name)(*args, **kwargs))
+            except ResponseError as e:
+                if raise_on_error:
+                    raise
+                results.append(e)
+        self._commands = []
+        return results
+
+
+def _fold_activity(redis: "FakeRedis", keys: list[str], args: list[Any]) -> int:
+    recent = redis.data.get(keys[0], {})
+    activity = redis.data.setdefault(keys[1], {})
+    updated = 0
+    for user in [str(arg) for arg in args] or list(recent):
+        amount = int(recent.pop(user, 0))
+        if amount > 0:
+            activity[user] = str(int(activity.get(user, 0)) + amount)
+            updated += 1
+    return updated
+
+
+def _long_double(value: Fraction) -> Fraction:
+    """Rounds to the nearest x87 long double, with its 64 bit significand, which HINCRBYFLOAT computes in."""
+    if value == 0:
+        return value
+    magnitude = abs(value)
+    exponent = magnitude.numerator.bit_length() - magnitude.denominator.bit_length()
+    if Fraction(2) ** exponent > magnitude:
+        exponent -= 1
+    scale = Fraction(2) ** (63 - exponent)
+    return (1 if value > 0 else -1) * Fraction(round(magnitude * scale)) / scale
+
+
+def _hincrbyfloat(current: str, amount: str) -> str:
+    """What HINCRBYFLOAT stores: the long double sum, printed with 17 decimal places and trailing zeros removed."""
+    total = _long_double(_long_double(Fraction(Decimal(current))) + _long_double(Fraction(Decimal(amount))))
+    with localcontext() as context:
+        context.prec = 80
+        text = f"{Decimal(total.numerator) / Decimal(total.denominator):.17f}"
+    return text.rstrip("0").rstrip(".")
+
+
+def _add_decimal_stat(redis: "FakeRedis", keys: list[str], args: list[Any]) -> list[Any]:
+    # Lua numbers are doubles, so the checks are done with floats.
+    stats = redis.data.setdefault(keys[0], {})
+    user, amount, cap = args
+    raw = stats.get(user)
+    try:
+        current: Optional[float] = float(Decimal(raw))
+    except (InvalidOperation, TypeError):
+        current = None
+    new = (current or 0) + float(amount)
+    if new < 0:
+        return [0, raw or "0"]
+    if new > float(cap):
+        stats[user] = cap
+        return [1, cap]
+    if current is None:
+        stats[user] = amount
+        return [1, amount]
+    stats[user] = _hincrbyfloat(raw, amount)
+    return [1, stats[user]]
+
+
+def _link_wallet(redis: "FakeRedis", keys: list[str], args: list[Any]) -> list[Any]:
+    notes = redis.data.setdefault(keys[0], {})
+    field, user, wallet, expected = (str(arg) for arg in args)
+    old = notes.get(field, "")
+    if old != expected:
+        return [0, old]
+    if old:
+        redis.data.get(keys[1], set()).discard(user)
+    if wallet:
+        notes[field] = wallet
+        redis.data.setdefault(keys[2], set()).add(user)
+    else:
+        notes.pop(field, None)
+    return [1, old]
+
+
+def _claim_drops(redis: "FakeRedis", keys: list[str], args: list[Any]) -> list[int]:
+    given = redis.data.setdefault(keys[0], {})
+    user, amount, limit, expire_at, day = (str(arg) for arg in args)
+    used = int(given.get(user, 0))
+    if limit != "" and int(amount) > 0 and used + int(amount) > int(limit):
+        return [0, used]
+    given[user] = str(used + int(amount))
+    redis.expiries[keys[0]] = int(expire_at)
+    totals = redis.data.setdefault(keys[1], {})
+    totals[day] = str(int(totals.get(day, 0)) + int(amount))
+    return [1, used + int(amount)]
+
+
+def _import_drops(redis: "FakeRedis", keys: list[str], args: list[Any]) -> int:
+    if keys[0] in redis.data:
+        return 0
+    today, totals, given, expire_at = args
+    for day, total in json.loads(totals).items():
+        redis.data.setdefault(keys[1], {})
+        redis.data[keys[1]][day] = str(int(redis.data[keys[1]].get(day, 0)) + total)
+    given = json.loads(given)
+    if given:
+        todays = redis.data.setdefault(keys[2], {})
+        for user, count in given.items():
+            todays[user] = str(int(todays.get(user, 0)) + count)
+        redis.expiries[keys[2]] = int(expire_at)
+    redis.data[keys[0]] = str(today)
+    return 1
+
+
+# Python equivalents of the Lua scripts, keyed by their source, so the tests don't need Lua. test_redis_scripts
+# checks that they agree with the scripts run in redis.
+SCRIPTS = {
+    redis_scripts.FOLD_ACTIVITY: _fold_activity,
+    redis_scripts.ADD_DECIMAL_STAT: _add_decimal_stat,
+    redis_scripts.LINK_WALLET: _link_wallet,
+    redis_scripts.CLAIM_DROPS: _claim_drops,
+    redis_scripts.IMPORT_DROPS: _import_drops,
+}
+
+
+class FakeScript:
+    def __init__(self, redis: "FakeRedis", source: str) -> None:
+        self._redis = redis
+        self._run = SCRIPTS[source]
+
+    async def __call__(self, keys: Any = None, args: Any = None) -> Any:
+        await self._redis.round_trip()
+        return self._run(self._redis, list(keys or []), list(args or []))
+
+
+class FakeRedis:
+    """An in-memory stand in for the parts of redis.asyncio (with decode_responses=True) used by the bot.
+    Pipelines and scripts count as round trips, each taking latency seconds."""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.data: dict[str, Any] = {}
+        self.round_trips = 0
+        self.latency = latency
+        self.published: list[tuple[str, str]] = []
+        # Unix times at which keys expire. Nothing is expired; tests check the times.
+        self.expiries: dict[str, int] = {}
+
+    async def round_trip(self) -> None:
+        self.round_trips += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def pipeline(self, transaction: bool = True) -> FakePipeline:
+        return FakePipeline(self)
+
+    def register_script(self, source: str) -> FakeScript:
+        return FakeScript(self, source)
+
+    async def exists(self, key: str) -> int:
+        return int(key in self.data)
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def _typed(self, key: str, kind: type) -> Any:
+        value = self.data.get(key)
+        if value is not None and not isinstance(value, kind):
+            raise ResponseError(WRONGTYPE)
+        return value
+
+    async def scan_iter(self, match: str = "*", count: Any = None) -> AsyncIterator[str]:
+        self.round_trips += 1
+        for key in list(self.data):
+            if fnmatchcase(key, match):
+                yield key
+
+    async def get(self, key: str) -> Any:
+        return self._typed(key, str)
+
+    async def set(self, key: str, value: Any, nx: bool = False) -> Optional[bool]:
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value)
+        return True
+
+    async def expireat(self, key: str, when: int) -> bool:
+        if key not in self.data:
+            return False
+        self.expiries[key] = int(when)
+        return True
+
+    async def expiretime(self, key: str) -> int:
+        if key not in self.data:
+            return -2
+        return self.expiries.get(key, -1)
+
+    async def hget(self, key: str, field: str) -> Any:
+        return self.data.get(key, {}).get(str(field))
+
+    async def hmget(self, key: str, fields: list[Any]) -> list[Any]:
+        hash_ = self.data.get(key, {})
+        return [hash_.get(str(field)) for field in fields]
+
+    async def hgetall(self, key: str) -> dict[str, str]:
+        return dict(self._typed(key, dict) or {})
+
+    async def hset(self, key: str, field: Any = None, value: Any = None, mapping: Any = None) -> int:
+        hash_ = self.data.setdefault(key, {})
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        added = 0
+        for item_field, item_value in items.items():
+            added += str(item_field) not in hash_
+            hash_[str(item_field)] = str(item_value)
+        return added
+
+    async def hincrby(self, key: str, field: Any, amount: int = 1) -> int:
+        hash_ = self.data.setdefault(key, {})
+        hash_[str(field)] = str(int(hash_.get(str(field), 0)) + int(amount))
+        return int(hash_[str(field)])
+
+    async def hdel(self, key: str, *fields: Any) -> int:
+        hash_ = self.data.get(key, {})
+        return sum(hash_.pop(str(field), None) is not None for field in fields)
+
+    async def sadd(self, key: str, *members: Any) -> int:
+        set_ = self.data.setdefault(key, set())
+        before = len(set_)
+        set_.update(str(member) for member in members)
+        return len(set_) - before
+
+    async def srem(self, key: str, *members: Any) -> int:
+        set_ = self.data.get(key, set())
+        before = len(set_)
+        set_.difference_update(str(member) for member in members)
+        return before - len(set_)
+
+    async def smembers(self, key: str) -> set[str]:
+        return set(self.data.get(key, set()))
+
+    async def sismember(self, key: str, member: Any) -> bool:
+        return str(member) in self.data.get(key, set())
+
+    async def scard(self, key: str) -> int:
+        return len(self.data.get(key, set()))
+
+    async def smismember(self, key: str, members: list[Any]) -> list[int]:
+        set_ = self.data.get(key, set())
+        return [int(str(member) in set_) for member in members]
+
+    async def sscan_iter(self, key: str, match: Any = None, count: Any = None) -> AsyncIterator[str]:
+        self.round_trips += 1
+        for member in list(self.data.get(key, set())):
+            yield member
+
+    async def rename(self, src: str, dst: str) -> bool:
+        self.data[dst] = self.data.pop(src)
+        return True
+
+    async def publish(self, channel: str, message: str) -> int:
+        self.published.append((channel, message))
+        return 0
@@ -0,0 +1,161 @@
+import asyncio
+from pathlib import Path
+import sys
+
+import pytest
+from pytest import MonkeyPatch
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from utils import async_cache
+from utils.async_cache import AsyncTTLCache
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class CountingLoader:
+    def __init__(self, value: str = "value", delay: float = 0.0) -> None:
+        self.value = value
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return f"{self.value}{self.calls}"
+
+
+def test_concurrent_misses_share_one_load() -> None:
+    cache: AsyncTTLCache[str, str] = AsyncTTLCache(ttl=60)
+    loader = CountingLoader(delay=0.01)
+
+    async def run() -> list[str]:
+        return await asyncio.gather(*[cache.get("key", loader) for _ in range(50)])
+
+    results = asyncio.run(run())
+
+    assert loader.calls == 1
+    assert set(results) == {"value1"}
+
+
+def test_stale_entry_is_served_while_refreshing(monkeypatch: MonkeyPatch) -> None:
+    clock = Clock()
+    monkeypatch.setattr(async_cache, "monotonic", clock)
+    cache: AsyncTTLCache[str, str] = AsyncTTLCache(ttl=60)
+    loader = CountingLoader()
+
+    async def run() -> tuple[str, str, str]:
+        first = await cache.get("key", loader)
+        clock.now += 61
+        stale = await cache.get("key", loader)
+        await asyncio.sleep(0.01)
+        refreshed = await cache.get("key", loader)
+        return first, stale, refreshed
+
+    assert asyncio.run(run()) == ("value1", "value1", "value2")
+    assert cache.stale_hits == 1
+
+
+def test_entries_past_max_stale_block_on_reload(monkeypatch: MonkeyPatch) -> None:
+    clock = Clock()
+    monkeypatch.setattr(async_cache, "monotonic", clock)
+    cache: AsyncTTLCache[str, str] = AsyncTTLCache(ttl=60, max_stale=60)
+    loader = CountingLoader()
+
+    async def run() -> tuple[str, str]:
+        first = await cache.get("key", loader)
+        clock.now += 121
+        return first, await cache.get("key", loader)
+
+    assert asyncio.run(run()) == ("value1", "value2")
+
+
+def test_expired_entry_is_served_while_refreshing(monkeypatch: MonkeyPatch) -> None:
+    clock = Clock()
+    monkeypatch.setattr(async_cache, "monotonic", clock)
+    cache: AsyncTTLCache[str, str] = AsyncTTLCache(ttl=60, max_stale=60)
+    loader = CountingLoader()
+
+    async def run() -> tuple[str, str, str]:
+        first = await cache.get("key", loader)
+        cache.expire()
+        stale = await cache.get("key", loader)
+        await asyncio.sleep(0.01)
+        return first, stale, await cache.get("key", loader)
+
+    assert asyncio.run(run()) == ("value1", "value1", "value2")
+    assert cache.stale_hits == 1
+
+    # Expiring an entry doesn't make it any younger.
+    clock.now += 100
+    cache.expire("key")
+    assert cache.age("key") == 100
+
+
+def test_failed_refresh_keeps_stale_value(monkeypatch: MonkeyPatch) -> None:
+    clock = Clock()
+    monkeypatch.setattr(async_cache, "monotonic", clock)
+    cache: AsyncTTLCache[str, str] = AsyncTTLCache(ttl=60)
+
+    async def failing_loader() -> str:
+        raise ValueError("upstream is down")
+
+    async def run() -> str:
+        cache.set("key", "old")
+        clock.now += 61
+        await cache.get("key", failing_loader)
+        await asyncio.sleep(0.01)
+        return await cache.get("key", failing_loader)
+
+    assert asyncio.run(run()) == "old"
+
+    with pytest.raises(ValueError):
+        asyncio.run(cache.get("missing", failing_loader))
+
+
+def test_least_recently_used_entry_is_evicted() -> None:
+    cache: AsyncTTLCache[int, int] = AsyncTTLCache(ttl=60, maxsize=2)
+
+    async def run() -> None:
+        for key in (1, 2):
+            await cache.get(key, CountingLoader(str(key)))  # type: ignore[arg-type]
+        await cache.get(1, CountingLoader())  # type: ignore[arg-type]
+        await cache.get(3, CountingLoader())  # type: ignore[arg-type]
+
+    asyncio.run(run())
+
+    assert 1 in cache and 3 in cache
+    assert 2 not in cache
+
+
+def test_loads_started_before_an_invalidation_are_not_stored() -> None:
+    for change in ("invalidate", "expire"):
+        cache: AsyncTTLCache[str, str] = AsyncTTLCache(ttl=60)
+        loader = CountingLoader(delay=0.01)
+
+        async def run() -> tuple[str, str]:
+            cache.set("key", "old")
+            cache.expire("key")
+            stale = await cache.get("key", loader)
+            # The background refresh has started, but the source changes before it returns.
+            getattr(cache, change)("key")
+            await asyncio.sleep(0.02)
+            assert cache.peek("key") == (None if change == "invalidate" else "old")
+            # A load started after the change is stored.
+            after = await cache.get("key", loader)
+            await asyncio.sleep(0.02)
+            return stale, after
+
+        stale, after = asyncio.run(run())
+
+        assert stale == "old"
+        # Once the entry is gone the caller waits for the new load, otherwise the expired entry is served meanwhile.
+        assert after == ("value2" if change == "invalidate" else "old")
+        assert cache.peek("key") == "value2"
+        assert loader.calls == 2
@@ -0,0 +1,120 @@
+import asyncio
+from pathlib import Path
+import sys
+from typing import Any, Optional
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from tests.fake_http import FakeSession
+from utils.green_api_wrapper import GreenApi
+
+
+class FakePagedServer:
+    """Serves the AW blacklist list endpoint with limit/offset paging, optionally reporting the total."""
+
+    def __init__(self, wallets: int, report_total: bool = True) -> None:
+        self.wallets = [f"aw{i}.wam" for i in range(wallets)]
+        self.report_total = report_total
+        self.requests: list[int] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.fail_at: Optional[int] = None
+        self.malformed = False
+
+    async def handle(self, url: str) -> Any:
+        query = parse_qs(urlparse(url).query)
+        limit, offset = int(query["limit"][0]), int(query["offset"][0])
+        self.requests.append(offset)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+        if offset == self.fail_at:
+            return 500, {"error": "oops"}
+        if self.malformed:
+            return {"rows": []}
+        response: dict[str, Any] = {"data": [{"wallet": w} for w in self.wallets[offset:offset + limit]]}
+        if self.report_total:
+            response["total"] = len(self.wallets)
+        return response
+
+
+def api_for(server: FakePagedServer) -> GreenApi:
+    return GreenApi(session=FakeSession(server.handle))
+
+
+def test_pages_are_fetched_concurrently_using_the_total() -> None:
+    server = FakePagedServer(10_500)
+    wallets = asyncio.run(api_for(server).fetch_awblacklist(concurrency=3))
+    assert wallets == set(server.wallets)
+    assert sorted(server.requests) == list(range(0, 11_000, 1000))
+    assert 1 < server.max_in_flight <= 3
+
+
+def test_pages_are_fetched_in_waves_without_a_total() -> None:
+    server = FakePagedServer(10_000, report_total=False)
+    wallets = asyncio.run(api_for(server).fetch_awblacklist(concurrency=4))
+    assert wallets == set(server.wallets)
+    # The exact multiple of the page size needs one short (empty) page to find the end.
+    assert max(server.requests) >= 10_000
+    assert len(server.requests) <= 11 + 4
+
+
+def test_cache_is_shared_and_invalidated() -> None:
+    server = FakePagedServer(2500)
+    api = api_for(server)
+
+    async def run() -> None:
+        first, second = await asyncio.gather(api.awget_blacklist(), api.awget_blacklist())
+        assert first == second == set(server.wallets)
+        assert len(server.requests) == 3
+        await api.awget_blacklist()
+        assert len(server.requests) == 3
+        api.awblacklist_cache.invalidate()
+        await api.awget_blacklist()
+        assert len(server.requests) == 6
+
+    asyncio.run(run())
+
+
+def test_changes_mark_the_cache_stale() -> None:
+    server = FakePagedServer(2500)
+    api = api_for(server)
+
+    async def post(url: str, **kwargs: Any) -> dict[str, Any]:
+        server.wallets.append(kwargs["data"])
+        return {"success": True}
+
+    api.get_resp = post  # type: ignore[method-assign]
+
+    async def run() -> None:
+        assert len(await api.awget_blacklist()) == 2500
+        await api.awblacklist_add("new.wam")
+        # The last list is still served, while the new one is fetched in the background.
+        assert "new.wam" not in await api.awget_blacklist()
+        assert len(server.requests) == 3
+        for _ in range(500):
+            if "new.wam" in await api.awget_blacklist():
+                break
+            await asyncio.sleep(0.01)
+        assert "new.wam" in await api.awget_blacklist()
+        assert len(server.requests) == 6
+
+    asyncio.run(run())
+
+
+def test_failed_fetch_returns_the_last_list() -> None:
+    server = FakePagedServer(2500)
+    api = api_for(server)
+
+    async def run() -> None:
+        assert len(await api.awget_blacklist()) == 2500
+        server.fail_at = 1000
+        assert len(await api.awget_blacklist(force=True)) == 2500
+        assert await api_for(server).awget_blacklist() == frozenset()
+        server.fail_at = None
+        server.malformed = True
+        assert len(await api.awget_blacklist(force=True)) == 2500
+
+    asyncio.run(run())
@@ -0,0 +1,113 @@
+import asyncio
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from tests.fake_redis import FakeRedis
+from utils.blacklist_mirror import BlacklistMirror
+
+
+def test_changes_are_shared_through_redis_and_events() -> None:
+    redis = FakeRedis()
+    first, second = BlacklistMirror(redis), BlacklistMirror(redis)
+
+    async def run() -> None:
+        await first.load()
+        assert not first.loaded
+        assert await first.reconcile({"a.wam", "b.wam"}) == (2, 0)
+        assert first.loaded
+
+        before = first.members
+        await first.add(["c.wam"])
+        await first.remove(["a.wam"])
+        assert before == {"a.wam", "b.wam"}
+        assert first.members == {"b.wam", "c.wam"}
+
+        await second.load()
+        assert second.members == first.members
+        assert await second.reconcile({"b.wam", "d.wam"}) == (1, 1)
+        for _, message in redis.published:
+            first.handle_event(message)
+        assert first.members == second.members == {"b.wam", "d.wam"}
+        assert await redis.smembers(BlacklistMirror.key) == {"b.wam", "d.wam"}
+
+    asyncio.run(run())
+
+
+def test_truncated_blacklists_are_ignored() -> None:
+    redis = FakeRedis()
+    mirror = BlacklistMirror(redis)
+
+    async def run() -> None:
+        assert await mirror.reconcile(set()) == (0, 0)
+        assert not mirror.loaded
+        everyone = {f"{i}.wam" for i in range(100)}
+        assert await mirror.reconcile(everyone) == (100, 0)
+        assert await mirror.reconcile(set()) == (0, 0)
+        assert await mirror.reconcile({f"{i}.wam" for i in range(10)}) == (0, 0)
+        assert mirror.members == everyone
+        assert await mirror.reconcile({f"{i}.wam" for i in range(60)}) == (0, 40)
+
+    asyncio.run(run())
+
+
+def test_a_real_shrink_is_accepted_once_it_is_confirmed() -> None:
+    redis = FakeRedis()
+    mirror = BlacklistMirror(redis)
+
+    async def run() -> None:
+        await mirror.reconcile({f"{i}.wam" for i in range(100)})
+        # Two small lists, then one of a quite different size, which starts the count again.
+        assert await mirror.reconcile({f"{i}.wam" for i in range(30)}) == (0, 0)
+        assert await mirror.reconcile({f"{i}.wam" for i in range(31)}) == (0, 0)
+        assert await mirror.reconcile({f"{i}.wam" for i in range(10)}) == (0, 0)
+        assert await mirror.reconcile(set()) == (0, 0)
+        assert await mirror.reconcile({f"{i}.wam" for i in range(30)}) == (0, 0)
+        assert await mirror.reconcile({f"{i}.wam" for i in range(29)}) == (0, 0)
+        assert len(mirror) == 100
+        assert await mirror.reconcile({f"{i}.wam" for i in range(30)}) == (0, 70)
+        assert len(mirror) == 30
+
+    asyncio.run(run())
+
+
+def test_changes_during_the_fetch_are_kept() -> None:
+    for fp_rate in (None, 0.01):
+        redis = FakeRedis()
+        mirror, other = BlacklistMirror(redis, bloom_fp_rate=fp_rate), BlacklistMirror(redis)
+
+        async def run() -> None:
+            await mirror.reconcile({"a.wam", "b.wam", "c.wam"})
+            mirror.begin_reconcile()
+            # While the blacklist is fetched, one address is added here, and another process removes one.
+            await mirror.add(["new.wam"])
+            await other.remove(["c.wam"])
+            for _, message in redis.published[-1:]:
+                mirror.handle_event(message)
+            assert await mirror.reconcile({"a.wam", "b.wam", "c.wam"}) == (0, 0)
+            assert await redis.smembers(BlacklistMirror.key) == {"a.wam", "b.wam", "new.wam"}
+            assert await mirror.exclude(["a.wam", "c.wam", "new.wam", "x.wam"]) == ["c.wam", "x.wam"]
+            # Without begin_reconcile, the next reconcile applies the list as it is.
+            assert await mirror.reconcile({"a.wam", "b.wam", "c.wam"}) == (1, 1)
+
+        asyncio.run(run())
+
+
+def test_compact_mirrors_keep_their_size() -> None:
+    redis = FakeRedis()
+    first, second = BlacklistMirror(redis, bloom_fp_rate=0.01), BlacklistMirror(redis, bloom_fp_rate=0.01)
+
+    async def run() -> None:
+        await first.reconcile({"a.wam", "b.wam"})
+        await second.load()
+        seen = len(redis.published)
+        await first.add(["b.wam", "c.wam"])
+        await first.remove(["a.wam", "x.wam"])
+        assert len(first) == 2
+        for _, message in redis.published[seen:]:
+            second.handle_event(message)
+        assert len(second) == 2
+        assert await second.exclude(["a.wam", "b.wam", "c.wam"]) == ["a.wam"]
+
+    asyncio.run(run())
@@ -0,0 +1,69 @@
+import asyncio
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from tests.fake_redis import FakeRedis
+from utils.blacklist_mirror import BlacklistMirror
+from utils.bloom_filter import BloomFilter, ScreenedSet
+
+
+def addresses(count: int, prefix: str = "m") -> list[str]:
+    return [f"{prefix}{i:07d}.wam" for i in range(count)]
+
+
+def test_bloom_filter_has_no_false_negatives_and_bounded_false_positives() -> None:
+    members = addresses(50_000)
+    bloom = BloomFilter.from_items(members, capacity=len(members), fp_rate=0.01)
+    assert all(member in bloom for member in members)
+    others = addresses(50_000, prefix="x")
+    false_positives = sum(other in bloom for other in others)
+    assert false_positives / len(others) < 0.02
+
+
+def test_screened_set_is_exact_and_much_smaller_than_a_set() -> None:
+    redis = FakeRedis()
+    members = addresses(200_000)
+    screened = ScreenedSet(redis, "blacklist:test", fp_rate=0.01)
+
+    async def run() -> None:
+        assert await screened.replace(members) == len(members)
+        candidates = members[::1000] + addresses(5000, prefix="x")
+        assert await screened.exclude(candidates) == addresses(5000, prefix="x")
+
+        await screened.remove([members[0]])
+        await screened.add(["x0000001.wam"])
+        assert await screened.contains_many([members[0], "x0000001.wam"]) == [False, True]
+
+        reloaded = ScreenedSet(redis, "blacklist:test", fp_rate=0.01)
+        assert await reloaded.load() == len(members)
+        assert await reloaded.exclude(["x0000001.wam", "x0000002.wam"]) == ["x0000002.wam"]
+
+    asyncio.run(run())
+    as_set = set(members)
+    set_bytes = sys.getsizeof(as_set) + sum(sys.getsizeof(member) for member in as_set)
+    assert screened.nbytes * 10 < set_bytes
+
+
+def test_compact_mirror_filters_exactly() -> None:
+    redis = FakeRedis()
+    compact = BlacklistMirror(redis, bloom_fp_rate=0.01)
+    full = BlacklistMirror(redis)
+
+    async def run() -> None:
+        await compact.load()
+        assert not compact.loaded
+        assert await compact.reconcile({"a.wam", "b.wam", "c.wam"}) == (3, 0)
+        assert compact.loaded and len(compact) == 3
+        assert compact.members == frozenset()
+
+        await full.load()
+        await full.remove(["a.wam"])
+        compact.handle_event(redis.published[-1][1])
+        assert await compact.exclude(["a.wam", "b.wam", "d.wam"]) == ["a.wam", "d.wam"]
+
+        assert await compact.reconcile({"b.wam", "d.wam"}) == (1, 1)
+        assert await compact.exclude(["b.wam", "c.wam", "d.wam"]) == ["c.wam"]
+
+    asyncio.run(run())
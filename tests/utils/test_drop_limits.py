@@ -0,0 +1,123 @@
+import asyncio
+from datetime import date, datetime, timezone
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from tests.fake_redis import FakeRedis
+from utils.drop_limits import DropLimits
+
+
+class FixedDayLimits(DropLimits):
+    day = date(2024, 3, 9)
+
+    def _today(self) -> date:  # type: ignore[override]
+        return self.day
+
+
+def test_claims_never_exceed_the_limit() -> None:
+    redis = FakeRedis()
+    limits = FixedDayLimits(redis)
+
+    async def run() -> list[tuple[bool, int, date]]:
+        return await asyncio.gather(*(limits.claim(42, limit=5) for _ in range(20)))
+
+    results = asyncio.run(run())
+    assert sum(ok for ok, _, _ in results) == 5
+    assert sorted(used for ok, used, _ in results if ok) == [1, 2, 3, 4, 5]
+    assert all(used == 5 for ok, used, _ in results if not ok)
+    assert {day for _, _, day in results} == {FixedDayLimits.day}
+    assert asyncio.run(limits.given_today(42)) == 5
+    assert asyncio.run(limits.given_today(43)) == 0
+    # Today's counts go away at the next UTC midnight.
+    key = limits.day_key(FixedDayLimits.day)
+    assert redis.expiries[key] == datetime(2024, 3, 10, tzinfo=timezone.utc).timestamp()
+
+
+def test_release_and_record() -> None:
+    redis = FakeRedis()
+    limits = FixedDayLimits(redis)
+
+    async def run() -> None:
+        day = FixedDayLimits.day
+        assert await limits.claim(1, limit=1) == (True, 1, day)
+        assert await limits.claim(1, limit=1) == (False, 1, day)
+        assert await limits.release(1, day) == 0
+        assert await limits.claim(1, limit=1) == (True, 1, day)
+        # Recording ignores the limit.
+        assert await limits.record(1, 2) == 3
+        assert redis.data[DropLimits.totals_key] == {"2024-03-09": "3"}
+
+    asyncio.run(run())
+
+
+def test_release_after_midnight_gives_back_the_claimed_day() -> None:
+    redis = FakeRedis()
+    limits = FixedDayLimits(redis)
+
+    async def run() -> None:
+        ok, used, claimed_on = await limits.claim(1, limit=1)
+        assert ok
+        # The send fails after UTC midnight.
+        limits.day = date(2024, 3, 10)
+        await limits.release(1, claimed_on)
+        assert await limits.given_today(1) == 0
+        assert await limits.claim(1, limit=1) == (True, 1, date(2024, 3, 10))
+        assert redis.data[limits.day_key(claimed_on)] == {"1": "0"}
+        assert redis.data[DropLimits.totals_key] == {"2024-03-09": "0", "2024-03-10": "1"}
+
+    asyncio.run(run())
+
+
+def test_import_json_once_and_average() -> None:
+    redis = FakeRedis()
+    limits = FixedDayLimits(redis)
+    usage = {
+        "2024-03-09": {"1": 2, "2": 1},
+        "2024-03-08": {"1": 4},
+        "2024-01-01": {"3": 10},
+    }
+
+    async def run() -> None:
+        await limits.claim(2, limit=5)
+        assert await limits.import_json(usage)
+        assert not await limits.import_json(usage)
+        assert await limits.given_today(1) == 2
+        assert await limits.given_today(2) == 2
+        assert await limits.claim(1, limit=2) == (False, 2, FixedDayLimits.day)
+        assert redis.data[DropLimits.totals_key] == {"2024-03-09": "4", "2024-03-08": "4", "2024-01-01": "10"}
+        assert await limits.average_per_day(2) == 4
+        assert await limits.average_per_day(7) == 8 / 7
+
+    asyncio.run(run())
+
+
+def test_a_failed_import_can_be_retried() -> None:
+    redis = FakeRedis()
+    limits = FixedDayLimits(redis)
+    script = limits.scripts.import_drops
+    calls = 0
+
+    async def flaky(**kwargs):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise ConnectionError("lost redis")
+        return await script(**kwargs)
+
+    limits.scripts.import_drops = flaky
+
+    async def run() -> None:
+        try:
+            await limits.import_json({"2024-03-09": {"1": 2}})
+        except ConnectionError:
+            pass
+        assert DropLimits.imported_key not in redis.data
+        assert await limits.import_json({"2024-03-09": {"1": 2}})
+        assert await limits.given_today(1) == 2
+
+    try:
+        asyncio.run(run())
+    finally:
+        limits.scripts.import_drops = script
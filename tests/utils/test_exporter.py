@@ -0,0 +1,77 @@
+import asyncio
+import gzip
+import json
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from utils.exporter import StreamingExporter
+
+
+def export(tmp_path: Path, rows, **kwargs) -> tuple[str, int]:
+    async def run() -> tuple[str, int]:
+        async with StreamingExporter("out.txt", directory=str(tmp_path), batch_size=3, **kwargs) as exporter:
+            written = await exporter.write_all(rows)
+            await exporter.close()
+            assert exporter.path is not None
+            if exporter.compress:
+                with gzip.open(exporter.path, "rt", encoding="utf-8") as f:
+                    return f.read(), written
+            return Path(exporter.path).read_text(encoding="utf-8"), written
+
+    return asyncio.run(run())
+
+
+def test_formats(tmp_path: Path) -> None:
+    rows = [{"user": f"m{i}.wam", "tlm": i} for i in range(7)]
+
+    lines, written = export(tmp_path, (row["user"] for row in rows))
+    assert lines.splitlines() == [f"m{i}.wam" for i in range(7)]
+    assert written == 7
+
+    ndjson, _ = export(tmp_path, rows, fmt="ndjson", compress=True)
+    assert [json.loads(line) for line in ndjson.splitlines()] == rows
+
+    csv_text, _ = export(tmp_path, rows, fmt="csv", fields=["user", "tlm"])
+    assert csv_text.splitlines()[:2] == ["user,tlm", "m0.wam,0"]
+
+    json_text, _ = export(tmp_path, rows, fmt="json")
+    assert json.loads(json_text) == rows
+    assert json.loads(export(tmp_path, [], fmt="json")[0]) == []
+
+    commas, _ = export(tmp_path, (row["user"] for row in rows), fmt="commas")
+    assert commas == ",".join(f"m{i}.wam" for i in range(7))
+
+
+def test_async_iterables_are_streamed(tmp_path: Path) -> None:
+    async def gen():
+        for i in range(5):
+            yield i
+
+    text, written = export(tmp_path, gen())
+
+    assert text == "0\n1\n2\n3\n4\n"
+    assert written == 5
+
+
+def test_temp_file_is_removed_even_on_failure(tmp_path: Path) -> None:
+    async def run() -> None:
+        async with StreamingExporter("out.txt", directory=str(tmp_path)) as exporter:
+            await exporter.write_all(["a", "b"])
+            raise RuntimeError("upload failed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+    assert list(tmp_path.iterdir()) == []
+
+    asyncio.run(export_and_discard(tmp_path))
+    assert list(tmp_path.iterdir()) == []
+
+
+async def export_and_discard(tmp_path: Path) -> None:
+    async with StreamingExporter("out.txt", directory=str(tmp_path)) as exporter:
+        await exporter.write_all(range(10))
+        await exporter.discord_file()
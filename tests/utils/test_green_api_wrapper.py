@@ -0,0 +1,145 @@
+import asyncio
+from pathlib import Path
+import sys
+from types import SimpleNamespace
+from typing import Any
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from utils.green_api_wrapper import GreenApi
+
+
+def test_bulk_add_is_bounded_ordered_and_retried() -> None:
+    api = GreenApi(session=None)
+    in_flight = 0
+    max_in_flight = 0
+    attempts: dict[str, int] = {}
+    progress: list[tuple[int, int]] = []
+
+    async def fake_request(action: str, address: str) -> dict[str, Any]:
+        nonlocal in_flight, max_in_flight
+        attempts[address] = attempts.get(address, 0) + 1
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        if address.startswith("flaky") and attempts[address] < 2:
+            raise aiohttp.ClientConnectionError("connection reset")
+        if address.startswith("down"):
+            raise aiohttp.ClientConnectionError("connection refused")
+        return {"success": True, "wallet": address}
+
+    async def report(done: int, total: int) -> None:
+        progress.append((done, total))
+
+    api._blacklist_request = fake_request  # type: ignore[method-assign]
+    addresses = [f"flaky{i}.wam" if i % 10 == 0 else f"ok{i}.wam" for i in range(200)] + ["down.wam"]
+
+    results = asyncio.run(api.blacklist_add_many(addresses, concurrency=8, backoff=0, progress=report))
+
+    assert max_in_flight <= 8
+    assert [result.get("wallet") for result in results[:-1]] == addresses[:-1]
+    assert results[-1]["success"] is False and "connection refused" in results[-1]["exception"]
+    assert attempts["flaky0.wam"] == 2 and attempts["down.wam"] == 3
+    assert progress[-1] == (201, 201)
+    assert len(progress) <= 11
+
+
+def test_failing_progress_callback_does_not_abort_bulk_add() -> None:
+    api = GreenApi(session=None)
+    calls: list[int] = []
+
+    async def fake_request(action: str, address: str) -> dict[str, Any]:
+        return {"success": True, "wallet": address}
+
+    async def report(done: int, total: int) -> None:
+        calls.append(done)
+        raise RuntimeError("progress message was deleted")
+
+    api._blacklist_request = fake_request  # type: ignore[method-assign]
+    addresses = [f"ok{i}.wam" for i in range(50)]
+
+    results = asyncio.run(api.blacklist_add_many(addresses, progress=report))
+
+    assert [result["wallet"] for result in results] == addresses
+    assert calls[-1] == 50 and len(calls) > 1
+
+
+def test_only_server_errors_and_rate_limits_are_retried() -> None:
+    api = GreenApi(session=None)
+    attempts: dict[str, int] = {}
+
+    async def fake_request(action: str, address: str) -> dict[str, Any]:
+        attempts[address] = attempts.get(address, 0) + 1
+        status = int(address.split(".")[0])
+        request = SimpleNamespace(real_url="https://blacklist/add")
+        raise aiohttp.ClientResponseError(request, (), status=status, message="error")  # type: ignore[arg-type]
+
+    api._blacklist_request = fake_request  # type: ignore[method-assign]
+    results = asyncio.run(api.blacklist_add_many(["400.wam", "403.wam", "429.wam", "500.wam", "503.wam"], backoff=0))
+
+    assert not any(result["success"] for result in results)
+    assert attempts == {"400.wam": 1, "403.wam": 1, "429.wam": 3, "500.wam": 3, "503.wam": 3}
+
+
+class FakeMinerStats:
+    """Serves miner pages of 1000 from a snapshot, which can be replaced with a newer one partway through a crawl."""
+
+    def __init__(self, miners: int) -> None:
+        self.snapshots = [(miners, "v0")]
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.update_after: list[int] = []
+
+    async def miner(self, cycle: int, page: int = 1, user: str = "") -> dict[str, Any]:
+        self.requests += 1
+        if self.update_after and self.requests > self.update_after[0]:
+            self.update_after.pop(0)
+            miners, _ = self.snapshots[-1]
+            self.snapshots.append((miners + 500, f"v{len(self.snapshots)}"))
+        miners, version = self.snapshots[-1]
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.001)
+        self.in_flight -= 1
+        data = [
+            {"user": f"{version}m{i}.wam", "rank": i} for i in range((page - 1) * 1000, min(page * 1000, miners))
+        ]
+        return {"count": len(data), "last_update": version, "data": data}
+
+
+def miner_api(stats: FakeMinerStats) -> GreenApi:
+    api = GreenApi(session=None)
+    api.miner = stats.miner  # type: ignore[method-assign]
+    api.cached_blacklist = {"v0m5.wam"}
+    api.cache_updated = 2**40
+    return api
+
+
+def test_all_miners_fetches_pages_concurrently() -> None:
+    stats = FakeMinerStats(20_500)
+    miners = asyncio.run(miner_api(stats).all_miners_for_cycle(cycle=1, concurrency=4))
+    assert [miner["rank"] for miner in miners] == [rank for rank in range(20_500) if rank != 5]
+    assert 1 < stats.max_in_flight <= 4
+    # 21 pages, plus at most one wave past the end.
+    assert stats.requests <= 21 + 4
+
+
+def test_all_miners_refetches_only_stale_pages_after_an_update() -> None:
+    stats = FakeMinerStats(20_500)
+    stats.update_after = [6]
+    miners = asyncio.run(miner_api(stats).all_miners_for_cycle(cycle=1, concurrency=4))
+    assert len(miners) == 21_000
+    assert {miner["user"][:2] for miner in miners} == {"v1"}
+    assert stats.requests < 2 * 25
+
+
+def test_all_miners_gives_up_on_a_constantly_changing_cycle() -> None:
+    stats = FakeMinerStats(5000)
+    stats.update_after = list(range(2, 1000, 3))
+    miners = asyncio.run(miner_api(stats).all_miners_for_cycle(cycle=1, concurrency=4, max_attempts=3))
+    assert miners
+    assert stats.requests < 60
@@ -0,0 +1,120 @@
+import asyncio
+import json
+from pathlib import Path
+import sys
+import tracemalloc
+from typing import Any, AsyncIterator
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from tests.fake_http import FakeSession
+from utils.green_api_wrapper import GreenApi, GreenApiException
+from utils.json_stream import JsonStream
+
+
+async def chunked(text: str, size: int) -> AsyncIterator[bytes]:
+    body = text.encode()
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+def parse(text: str, key: Any = None, size: int = 3) -> tuple[list[Any], dict[str, Any], bool]:
+    async def run() -> tuple[list[Any], dict[str, Any], bool]:
+        stream = JsonStream(chunked(text, size), key)
+        items = [item async for item in stream]
+        return items, stream.meta, stream.found
+
+    return asyncio.run(run())
+
+
+def test_items_and_meta_survive_any_chunking() -> None:
+    document = {
+        "count": 12345,
+        "ratio": -0.015625,
+        "data": [{"user": "ab.wam", "rank": 1.5e3}, [], "ünïcode", -7, 2.5e-08, 1234.5678, None, True],
+        "last_update": "2024-01-01 00:00:00",
+        "nested": {"data": [1, 2]},
+    }
+    text = json.dumps(document, ensure_ascii=False, indent=1)
+    for size in (1, 2, 3, 5, 7, 64, 10_000):
+        items, meta, found = parse(text, "data", size)
+        assert items == document["data"]
+        assert meta == {key: value for key, value in document.items() if key != "data"}
+        assert found
+
+
+def parse_chunks(chunks: list[str], key: Any = None) -> tuple[list[Any], dict[str, Any]]:
+    async def lines() -> AsyncIterator[bytes]:
+        for chunk in chunks:
+            yield chunk.encode()
+
+    async def run() -> tuple[list[Any], dict[str, Any]]:
+        stream = JsonStream(lines(), key)
+        return [item async for item in stream], stream.meta
+
+    return asyncio.run(run())
+
+
+def test_numbers_split_before_their_fraction_or_exponent() -> None:
+    assert parse_chunks(["[1.", "5, 2]"]) == ([1.5, 2], {})
+    assert parse_chunks(["[1e", "5]"]) == ([1e5], {})
+    assert parse_chunks(["[1e", "-", "2, -", "3]"]) == ([1e-2, -3], {})
+    assert parse_chunks(["[12", "34]"]) == ([1234], {})
+    assert parse_chunks(['{"last_update": 12.', '5, "data": [7', '.25]}'], "data") == ([7.25], {"last_update": 12.5})
+    assert parse_chunks(['{"count": 1', "E3}"], "data") == ([], {"count": 1e3})
+
+
+def test_top_level_lists_errors_and_malformed_documents() -> None:
+    assert parse('[1, 2, {"a": [3]}]') == ([1, 2, {"a": [3]}], {}, True)
+    assert parse(" [ ] ") == ([], {}, True)
+    assert parse('{"error": "nope"}') == ([], {"error": "nope"}, False)
+    assert parse('{"rows": [1]}', "data") == ([], {"rows": [1]}, False)
+    with pytest.raises(ValueError):
+        parse('{"data": [1, 2')
+    with pytest.raises(ValueError):
+        parse('{"data": [1 2]}')
+
+
+def test_streaming_uses_much_less_memory_than_loading() -> None:
+    wallets = [f"wallet{i:07d}.wam" for i in range(100_000)]
+    text = json.dumps([{"wallet": wallet, "added": "2024-01-01T00:00:00Z", "reason": "bot"} for wallet in wallets])
+
+    async def lazy_chunks() -> AsyncIterator[bytes]:
+        for start in range(0, len(text), 64 * 1024):
+            yield text[start:start + 64 * 1024].encode()
+
+    async def stream() -> set[str]:
+        return {item["wallet"] async for item in JsonStream(lazy_chunks())}
+
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    loaded = {item["wallet"] for item in json.loads(text)}
+    _, load_peak = tracemalloc.get_traced_memory()
+    load_peak -= base
+    del loaded
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    streamed = asyncio.run(stream())
+    _, stream_peak = tracemalloc.get_traced_memory()
+    stream_peak -= base
+    tracemalloc.stop()
+    assert streamed == set(wallets)
+    assert stream_peak < load_peak / 2
+
+
+def test_green_api_streams_with_timeouts() -> None:
+    def handle(url: str) -> Any:
+        if "page=2" in url:
+            return {"error": "cycle not found"}
+        return {"count": 2, "last_update": "t", "data": [{"user": "a.wam"}, {"user": "b.wam"}]}
+
+    session = FakeSession(handle)
+    api = GreenApi(session=session)
+    resp = asyncio.run(api.miner(cycle=1, page=1))
+    assert resp == {"count": 2, "last_update": "t", "data": [{"user": "a.wam"}, {"user": "b.wam"}]}
+    with pytest.raises(GreenApiException):
+        asyncio.run(api.miner(cycle=1, page=2))
+    assert all(timeout is api.stream_timeout for timeout in session.timeouts)
+    assert api.stream_timeout.sock_read is not None
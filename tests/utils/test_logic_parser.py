@@ -0,0 +1,64 @@
+from pathlib import Path
+import sys
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from utils.exceptions import InvalidInput
+from utils.logic_parser import compile_query
+
+HOLDERS = {
+    1: {"a", "b", "c"},
+    2: {"b", "c", "d"},
+    3: {"c", "e"},
+}
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        ("1 and 2", {"b", "c"}),
+        ("1 & (2 | 3)", {"b", "c"}),
+        ("1 or 2 and 3", {"a", "b", "c"}),
+        ("(1 or 2) and 3", {"c"}),
+        ("1 and !2", {"a"}),
+        ("!1", set()),
+        ("2 or !1", {"b", "c", "d"}),
+        ("not (1 or 2) or 3", {"c", "e"}),
+        ("atleast 2 (1, 2, 3)", {"b", "c"}),
+        ("atleast 3 of (1, 2, 3)", {"c"}),
+        ("atleast 1 (1 and 3, 2 and !1)", {"c", "d"}),
+    ],
+)
+def test_query_evaluation(text: str, expected: set[str]) -> None:
+    assert compile_query(text).evaluate(HOLDERS) == expected
+
+
+def test_referenced_templates_are_collected_once() -> None:
+    query = compile_query("1 and (1 or 2) and !atleast 1 (2, 3)")
+
+    assert query.template_ids == {1, 2, 3}
+
+
+@pytest.mark.parametrize("text", ["", "1 and", "(1 or 2", "1 2", "1 or foo", "atleast x (1)"])
+def test_malformed_queries_are_rejected(text: str) -> None:
+    with pytest.raises(InvalidInput):
+        compile_query(text)
+
+
+def test_large_queries_evaluate_correctly() -> None:
+    holders = {template_id: {f"wallet{i}" for i in range(template_id, 20_000, 3)} for template_id in range(1, 41)}
+    text = " and ".join(f"({i} or {i + 1} or !{i + 2})" for i in range(1, 39))
+    text += " or atleast 20 (" + ", ".join(str(i) for i in range(1, 41)) + ")"
+    query = compile_query(text)
+
+    wallets = set().union(*holders.values())
+    expected = {
+        wallet
+        for wallet in wallets
+        if all(wallet in holders[i] or wallet in holders[i + 1] or wallet not in holders[i + 2] for i in range(1, 39))
+        or sum(wallet in owners for owners in holders.values()) >= 20
+    }
+
+    assert query.evaluate(holders) == expected
@@ -0,0 +1,77 @@
+from pathlib import Path
+import random
+import sys
+from time import perf_counter
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from utils.miner_table import MinerTable
+
+
+def synthetic_miners(count: int) -> list[dict]:
+    rng = random.Random(42)
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    return [
+        {"user": f"m{i}.wam", "rank": rank, "tlm": rng.uniform(0, 5000), "mines": rng.randint(1, 2000)}
+        for i, rank in enumerate(ranks)
+    ]
+
+
+def test_columns_are_packed_and_rows_rebuilt() -> None:
+    table = MinerTable.from_rows(
+        [{"user": "a.wam", "rank": 2, "tlm": 1.5, "mines": 3}, {"user": "b.wam", "rank": 1, "tlm": 2, "mines": 4}]
+    )
+    assert len(table) == 2
+    assert table.column("rank").typecode == "q"  # type: ignore[attr-defined]
+    assert table.column("tlm").typecode == "d"  # type: ignore[attr-defined]
+    assert table.total("tlm") == 3.5
+    assert list(table.rows(table.top(1))) == [{"user": "b.wam", "rank": 1, "tlm": 2.0, "mines": 4}]
+    assert list(table.tuples(["user", "mines"])) == [("a.wam", 3), ("b.wam", 4)]
+    assert len(MinerTable.from_rows([])) == 0
+
+
+def test_top_and_order_of_many_miners() -> None:
+    miners = synthetic_miners(50_000)
+    table = MinerTable.from_rows(miners)
+
+    by_rank = sorted(miners, key=lambda x: x["rank"])
+    assert list(table.rows(table.top(100, "rank"))) == by_rank[:100]
+    richest = table.top(100, "tlm", largest=True)
+    assert [table.column("tlm")[i] for i in richest] == sorted((m["tlm"] for m in miners), reverse=True)[:100]
+    assert table.top(0) == []
+
+    assert list(table.rows(table.order("rank"))) == by_rank
+    assert [table.column("mines")[i] for i in table.order("mines", largest=True)] == sorted(
+        (m["mines"] for m in miners), reverse=True
+    )
+
+
+@pytest.mark.benchmark
+def test_benchmark_top_100_of_500k_miners() -> None:
+    miners = synthetic_miners(500_000)
+    table = MinerTable.from_rows(miners)
+
+    start = perf_counter()
+    expected = sorted(miners, key=lambda x: x["rank"])[:100]
+    sorting = perf_counter() - start
+
+    start = perf_counter()
+    top = list(table.rows(table.top(100, "rank")))
+    top_k = perf_counter() - start
+
+    start = perf_counter()
+    table.top(100, "tlm", largest=True)
+    by_tlm = perf_counter() - start
+
+    start = perf_counter()
+    table.order("rank")
+    ordering = perf_counter() - start
+
+    assert top == expected
+    print(
+        f"\nsort 500k: {sorting:.3f}s, top 100 by rank: {top_k:.3f}s, top 100 by tlm: {by_tlm:.3f}s, "
+        f"order all by rank: {ordering:.3f}s"
+    )
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import os
+from pathlib import Path
+import sys
+from typing import Any, Awaitable, Callable
+import uuid
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from tests.fake_redis import FakeRedis
+from utils.redis_scripts import RedisScripts
+
+# The tests run the shipped Lua scripts in redis, and check that the fake's Python stand ins for them agree.
+# They use the redis at REDIS_TEST_URL, writing only keys under a random prefix and deleting them afterwards, or
+# without one, fakeredis if it is installed with Lua support (pip install "fakeredis[lua]").
+REDIS_TEST_URL = os.getenv("REDIS_TEST_URL")
+
+
+def lua_redis() -> Any:
+    if REDIS_TEST_URL is not None:
+        import redis.asyncio as aioredis
+
+        return aioredis.from_url(REDIS_TEST_URL, decode_responses=True)
+    fakeredis = pytest.importorskip("fakeredis", reason="Set REDIS_TEST_URL or install fakeredis[lua].")
+    pytest.importorskip("lupa", reason="Set REDIS_TEST_URL or install fakeredis[lua].")
+    return fakeredis.FakeAsyncRedis(decode_responses=True)
+
+
+Scenario = Callable[[Any, RedisScripts, str], Awaitable[list[Any]]]
+
+
+async def dump(redis: Any, hashes: list[str] = [], sets: list[str] = [], strings: list[str] = []) -> list[Any]:
+    return (
+        [await redis.hgetall(key) for key in hashes]
+        + [sorted(await redis.smembers(key)) for key in sets]
+        + [await redis.get(key) for key in strings]
+    )
+
+
+def agree(scenario: Scenario) -> None:
+    """Runs a scenario against redis and the fake, and checks that it gives the same results in both."""
+    real = lua_redis()
+
+    async def run() -> tuple[list[Any], list[Any]]:
+        prefix = f"test:{uuid.uuid4().hex}:"
+        try:
+            in_redis = await scenario(real, RedisScripts(real), prefix)
+        finally:
+            keys = [key async for key in real.scan_iter(match=f"{prefix}*")]
+            if keys:
+                await real.delete(*keys)
+            await real.aclose()
+        fake = FakeRedis()
+        return in_redis, await scenario(fake, RedisScripts(fake), prefix)
+
+    in_redis, in_fake = asyncio.run(run())
+    assert in_redis == in_fake
+
+
+def test_fold_activity() -> None:
+    async def scenario(redis: Any, scripts: RedisScripts, prefix: str) -> list[Any]:
+        recent, activity = f"{prefix}recent", f"{prefix}activity"
+        await redis.hset(recent, mapping={"1": "3", "2": "0", "3": "5", "4": "2"})
+        await redis.hset(activity, mapping={"1": "10"})
+        results = [await scripts.fold_activity(keys=[recent, activity], args=["1", "2", "9"])]
+        results.append(await scripts.fold_activity(keys=[recent, activity], args=[]))
+        return results + await dump(redis, hashes=[recent, activity])
+
+    agree(scenario)
+
+
+def test_add_decimal_stat() -> None:
+    if REDIS_TEST_URL is None:
+        pytest.skip("fakeredis computes HINCRBYFLOAT in doubles, where redis uses long doubles.")
+
+    async def scenario(redis: Any, scripts: RedisScripts, prefix: str) -> list[Any]:
+        stats = f"{prefix}stats"
+        await redis.hset(stats, mapping={"2": "1234567.1", "3": "not a number"})
+        calls = [
+            ("1", "0.1"), ("1", "0.2"), ("1", "-5"), ("1", "-0.3"),
+            ("2", "0.000001"), ("2", "1e9"), ("3", "1.5"), ("4", "0.1"), ("4", "1e-7"),
+        ]
+        results = [
+            await scripts.add_decimal_stat(keys=[stats], args=[user, amount, "1e9"]) for user, amount in calls
+        ]
+        return results + await dump(redis, hashes=[stats])
+
+    agree(scenario)
+
+
+def test_link_wallet() -> None:
+    async def scenario(redis: Any, scripts: RedisScripts, prefix: str) -> list[Any]:
+        notes, owners = f"{prefix}notes", f"{prefix}owners:"
+
+        async def link(user: str, wallet: str, expected: str) -> Any:
+            keys = [notes + user, owners + expected, owners + (wallet or expected)]
+            return await scripts.link_wallet(keys=keys, args=["linkedwallet", user, wallet, expected])
+
+        results = [
+            await link("1", "a.wam", ""),
+            await link("2", "a.wam", ""),
+            await link("1", "b.wam", "a.wam"),
+            # The caller's read is out of date, so nothing changes.
+            await link("1", "c.wam", "a.wam"),
+            await link("2", "", "a.wam"),
+            await link("3", "", ""),
+        ]
+        return results + await dump(
+            redis, hashes=[notes + user for user in "123"], sets=[owners + w for w in ("a.wam", "b.wam", "c.wam")]
+        )
+
+    agree(scenario)
+
+
+def test_claim_drops() -> None:
+    async def scenario(redis: Any, scripts: RedisScripts, prefix: str) -> list[Any]:
+        given, totals = f"{prefix}given", f"{prefix}totals"
+        calls = [("1", "1", "2"), ("1", "1", "2"), ("1", "1", "2"), ("1", "-1", ""), ("2", "5", ""), ("1", "1", "2")]
+        results = [
+            await scripts.claim_drops(keys=[given, totals], args=[user, amount, limit, "4102444800", "2100-01-01"])
+            for user, amount, limit in calls
+        ]
+        return results + [await redis.expiretime(given)] + await dump(redis, hashes=[given, totals])
+
+    agree(scenario)
+
+
+def test_import_drops() -> None:
+    async def scenario(redis: Any, scripts: RedisScripts, prefix: str) -> list[Any]:
+        marker, totals, given = f"{prefix}imported", f"{prefix}totals", f"{prefix}given"
+        await redis.hset(totals, mapping={"2100-01-01": "2"})
+        days = json.dumps({"2099-12-31": 4, "2100-01-01": 3})
+        args = ["2100-01-01", days, json.dumps({"1": 2, "2": 1}), "4102444800"]
+        results = [await scripts.import_drops(keys=[marker, totals, given], args=args) for _ in range(2)]
+        return results + await dump(redis, hashes=[totals, given], strings=[marker])
+
+    agree(scenario)
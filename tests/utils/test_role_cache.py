@@ -0,0 +1,96 @@
+from pathlib import Path
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+import utils.role_cache
+from utils.role_cache import MemberRoleCache
+
+
+class Member(SimpleNamespace):
+    @property
+    def roles(self) -> list:
+        self.role_reads += 1
+        return [SimpleNamespace(id=role_id) for role_id in self.role_ids]
+
+
+class Guild(SimpleNamespace):
+    @property
+    def roles(self) -> list:
+        self.role_reads += 1
+        return [SimpleNamespace(id=role_id, name=name) for role_id, name in self.names.items()]
+
+
+def member(guild_id: int, member_id: int, *role_ids: int) -> Member:
+    return Member(guild=SimpleNamespace(id=guild_id), id=member_id, role_ids=list(role_ids), role_reads=0)
+
+
+def test_role_checks_are_cached_until_forgotten() -> None:
+    cache = MemberRoleCache()
+    alice = member(1, 10, 100, 101)
+    for _ in range(50):
+        assert cache.has_any(alice, {101, 999})
+        assert not cache.has_any(alice, {999})
+    assert alice.role_reads == 1
+
+    alice.role_ids = [999]
+    assert not cache.has_any(alice, {999})
+    cache.forget(alice)
+    assert cache.has_any(alice, {999})
+    assert alice.role_reads == 2
+
+    assert not cache.has_any(None, {999})
+    assert not cache.has_any(SimpleNamespace(id=5), {999})
+
+
+def test_forgetting_a_guild_and_the_size_bound() -> None:
+    cache = MemberRoleCache(maxsize=3)
+    members = [member(1, 10, 1), member(2, 20, 2), member(1, 30, 3)]
+    for m in members:
+        cache.role_ids(m)
+    cache.forget_guild(1)
+    assert len(cache) == 1
+    for i in range(5):
+        cache.role_ids(member(3, i, 4))
+    assert len(cache) == 3
+
+
+def test_entries_expire_and_clear(monkeypatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr(utils.role_cache.time, "monotonic", lambda: now[0])
+    cache = MemberRoleCache(ttl=60)
+    alice = member(1, 10, 100)
+    assert cache.has_any(alice, {100})
+    alice.role_ids = [101]
+    now[0] += 59
+    assert cache.has_any(alice, {100})
+    now[0] += 1
+    assert cache.has_any(alice, {101})
+    assert alice.role_reads == 2
+
+    alice.role_ids = [102]
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.has_any(alice, {102})
+
+
+def test_roles_checked_by_name() -> None:
+    cache = MemberRoleCache()
+    guild = Guild(id=1, names={100: "Citizen", 101: "Jungle Fanta", 102: "other"}, role_reads=0)
+    alice = Member(guild=guild, id=10, role_ids=[100], role_reads=0)
+    bob = Member(guild=guild, id=20, role_ids=[101, 102], role_reads=0)
+    for _ in range(10):
+        assert cache.has_named(alice, ["citizens", "citizen"], ignore_case=True)
+        assert not cache.has_named(alice, ["citizen"])
+        assert cache.has_named(bob, ["Jungle Fanta"])
+        assert not cache.has_named(bob, ["jungle fanta"])
+    assert guild.role_reads == 4
+    assert not cache.has_named(None, ["Citizen"])
+
+    guild.names[103] = "citizen"
+    alice.role_ids = [103]
+    cache.forget(alice)
+    assert not cache.has_named(alice, ["citizen"])
+    cache.forget_guild(1)
+    assert cache.has_named(alice, ["citizen"])
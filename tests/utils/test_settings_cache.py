@@ -0,0 +1,199 @@
+import asyncio
+from pathlib import Path
+import sys
+from types import SimpleNamespace
+from typing import Any
+
+from redis.exceptions import TimeoutError as RedisTimeoutError
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from tests.fake_redis import FakeRedis
+from utils.settings_cache import SettingsCache
+from utils.storage import StorageManager
+
+
+class FakeConnection:
+    """Answers the commands the settings cache listener sends, then hands it whatever messages are pushed."""
+
+    def __init__(self, client_id: int) -> None:
+        self.client_id = client_id
+        self.commands: list[tuple[Any, ...]] = []
+        self.replies: asyncio.Queue = asyncio.Queue()
+        self.disconnected = False
+
+    async def send_command(self, *args: Any) -> None:
+        self.commands.append(args)
+        if args[:2] == ("CLIENT", "ID"):
+            self.replies.put_nowait(self.client_id)
+        elif args[0] == "CLIENT":
+            self.replies.put_nowait("OK")
+        elif args[0] == "SUBSCRIBE":
+            for count, channel in enumerate(args[1:], 1):
+                self.replies.put_nowait(["subscribe", channel, count])
+
+    async def read_response(self) -> Any:
+        return await self.replies.get()
+
+    async def disconnect(self) -> None:
+        self.disconnected = True
+
+
+class FakePool:
+    def __init__(self) -> None:
+        self.connections: list[FakeConnection] = []
+
+    async def get_connection(self) -> FakeConnection:
+        self.connections.append(FakeConnection(len(self.connections) + 100))
+        return self.connections[-1]
+
+    async def release(self, connection: FakeConnection) -> None:
+        pass
+
+
+class TrackingRedis(FakeRedis):
+    def __init__(self) -> None:
+        super().__init__()
+        self.connection_pool = FakePool()
+        self.reads = 0
+
+    async def get(self, key: str):  # type: ignore[override]
+        self.reads += 1
+        return await super().get(key)
+
+    async def hgetall(self, key: str):  # type: ignore[override]
+        self.reads += 1
+        return await super().hgetall(key)
+
+
+def storage_for(redis: FakeRedis, cache: SettingsCache, guild_id: int = 0) -> StorageManager:
+    bot = SimpleNamespace(redis=redis, settings=SimpleNamespace(DEFAULT_PREFIX=","), settings_cache=cache)
+    storage = StorageManager(bot)
+    storage.guild_id = guild_id
+    return storage
+
+
+async def until(condition) -> None:
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0)
+    raise AssertionError("Timed out")
+
+
+def test_tracking_invalidations_from_redis() -> None:
+    redis = TrackingRedis()
+    redis.data["0:settings:prefix"] = "!"
+    redis.data["0:codex"] = {"rules": "Be nice"}
+    cache = SettingsCache(redis, track=True)
+    storage = storage_for(redis, cache)
+
+    async def run() -> None:
+        cache.start_listening()
+        await until(lambda: cache.active)
+        connection = redis.connection_pool.connections[0]
+        assert connection.commands == [
+            ("CLIENT", "ID"),
+            (
+                "CLIENT", "TRACKING", "ON", "REDIRECT", 100, "BCAST",
+                "PREFIX", "0:settings:", "PREFIX", "0:codex", "PREFIX", "0:poem",
+            ),
+            ("SUBSCRIBE", SettingsCache.channel, SettingsCache.tracking_channel),
+        ]
+
+        for _ in range(50):
+            assert await storage.get_setting("prefix") == "!"
+            assert await storage.get_codex("rules") == "Be nice"
+        assert redis.reads == 2
+        assert cache.hits == 98
+
+        # A write made outside the bot, reported by redis.
+        redis.data["0:settings:prefix"] = "?"
+        connection.replies.put_nowait(["message", SettingsCache.tracking_channel, ["0:settings:prefix"]])
+        await until(lambda: cache.invalidations == 1)
+        assert await storage.get_setting("prefix") == "?"
+        assert await storage.get_codex("rules") == "Be nice"
+        assert redis.reads == 3
+
+        # Writes through the bot rely on redis too, rather than publishing.
+        await storage.set_codex("faq", "Read the rules", style="codex")
+        assert redis.published == []
+        assert await storage.get_codex("faq") == "Read the rules"
+
+        # A flush empties the cache.
+        connection.replies.put_nowait(["message", SettingsCache.tracking_channel, None])
+        await until(lambda: len(cache) == 0)
+
+        cache.stop_listening()
+        await until(lambda: connection.disconnected)
+        assert not cache.active
+
+    asyncio.run(run())
+
+
+def test_untracked_guilds_are_read_through_until_tracked() -> None:
+    redis = TrackingRedis()
+    redis.data["5:settings:prefix"] = "$"
+    cache = SettingsCache(redis, track=True)
+    storage = storage_for(redis, cache, guild_id=5)
+
+    async def run() -> None:
+        cache.start_listening()
+        await until(lambda: cache.active)
+        assert await storage.get_setting("prefix") == "$"
+        assert len(cache) == 0
+
+        # The first read asked the listener to resubscribe with the guild tracked.
+        await until(lambda: len(redis.connection_pool.connections) == 2 and cache.active)
+        assert redis.connection_pool.connections[0].disconnected
+        tracking = redis.connection_pool.connections[1].commands[1]
+        assert "5:settings:" in tracking and "0:settings:" in tracking
+        assert await storage.get_setting("prefix") == "$"
+        assert await storage.get_setting("prefix") == "$"
+        assert redis.reads == 2
+        cache.stop_listening()
+
+    asyncio.run(run())
+
+
+def test_pub_sub_mode_publishes_invalidations() -> None:
+    redis = TrackingRedis()
+    cache = SettingsCache(redis)
+    storage = storage_for(redis, cache)
+
+    async def run() -> None:
+        cache.start_listening()
+        await until(lambda: cache.active)
+        assert redis.connection_pool.connections[0].commands == [("SUBSCRIBE", SettingsCache.channel)]
+        await storage.set_codex("rules", "Be nice", style="poem")
+        assert len(redis.published) == 1
+        other = SettingsCache(redis)
+        other.active = True
+        assert await other.get(0, "poem", "*", lambda: redis.hgetall("0:poem")) == {"rules": "Be nice"}
+        other.handle_event(redis.published[0][1])
+        assert len(other) == 0
+        cache.stop_listening()
+
+    asyncio.run(run())
+
+
+def test_listener_resubscribes_after_timeouts_and_os_errors() -> None:
+    redis = TrackingRedis()
+    cache = SettingsCache(redis)
+    failures: list[Exception] = [RedisTimeoutError("Timeout reading from socket"), ConnectionResetError()]
+    get_connection = redis.connection_pool.get_connection
+
+    async def flaky_connection() -> FakeConnection:
+        if failures:
+            raise failures.pop(0)
+        return await get_connection()
+
+    redis.connection_pool.get_connection = flaky_connection  # type: ignore[method-assign]
+
+    async def run() -> None:
+        listener = asyncio.create_task(cache.listen(retry_delay=0))
+        await until(lambda: cache.active)
+        assert not failures
+        listener.cancel()
+
+    asyncio.run(run())
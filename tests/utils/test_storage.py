@@ -0,0 +1,239 @@
+import asyncio
+from decimal import Decimal
+from pathlib import Path
+import sys
+from time import perf_counter
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from tests.fake_redis import FakeRedis
+from utils.exceptions import InvalidInput
+from utils.settings_cache import SettingsCache
+from utils.storage import StorageManager
+
+
+def storage_for(redis: FakeRedis) -> StorageManager:
+    return StorageManager(SimpleNamespace(redis=redis, settings=SimpleNamespace(DEFAULT_PREFIX=",")))
+
+
+def test_get_settings_reads_every_setting_in_one_pipeline() -> None:
+    redis = FakeRedis()
+    for i in range(2500):
+        redis.data[f"0:settings:setting{i}"] = str(i)
+    redis.data["0:settings:auth"] = {"1": "5", "2": "3"}
+    redis.data["0:settings:with:colon"] = "kept"
+    redis.data["123:settings:other_guild"] = "ignored"
+    storage = storage_for(redis)
+
+    settings = asyncio.run(storage.get_settings())
+    assert len(settings) == 2502
+    assert settings["setting2499"] == "2499"
+    assert settings["auth"] == {"1": "5", "2": "3"}
+    assert settings["with:colon"] == "kept"
+    # One scan and one pipeline, however many settings there are.
+    assert redis.round_trips == 2
+
+
+def test_get_settings_without_settings() -> None:
+    assert asyncio.run(storage_for(FakeRedis()).get_settings()) == {}
+
+
+class CountingRedis(FakeRedis):
+    def __init__(self) -> None:
+        super().__init__()
+        self.reads = 0
+
+    async def get(self, key: str):  # type: ignore[override]
+        self.reads += 1
+        return await super().get(key)
+
+    async def hget(self, key: str, field: str):  # type: ignore[override]
+        self.reads += 1
+        return await super().hget(key, field)
+
+
+def test_settings_are_cached_until_invalidated() -> None:
+    redis = CountingRedis()
+    storage = storage_for(redis)
+    cache = SettingsCache(redis)
+    cache.active = True
+    storage.bot.settings_cache = cache
+    other = SettingsCache(redis)
+    other.active = True
+
+    async def run() -> None:
+        assert await storage.get_setting("prefix") == ","
+        await storage.set_setting("prefix", "!")
+        for _ in range(100):
+            assert await storage.get_setting("prefix") == "!"
+        await storage.set_setting("auth", "5", key="42")
+        assert await storage.get_setting("auth", key="42") == "5"
+        assert await storage.get_setting("auth", key="42") == "5"
+        assert redis.reads == 3
+        assert cache.hits == 100
+
+        assert await other.get(0, "settings:prefix", "", lambda: redis.get("0:settings:prefix")) == "!"
+        await storage.set_setting("prefix", "?")
+        for _, message in redis.published:
+            other.handle_event(message)
+            cache.handle_event(message)
+        assert await other.get(0, "settings:prefix", "", lambda: redis.get("0:settings:prefix")) == "?"
+        assert await storage.get_setting("prefix") == "?"
+
+        cache.active = False
+        await storage.get_setting("prefix")
+        await storage.get_setting("prefix")
+        assert cache.misses == 6
+
+    asyncio.run(run())
+
+
+def test_auth_table_is_read_once_and_refreshed_on_change() -> None:
+    redis = CountingRedis()
+    redis.data["0:settings:auth"] = {"1": "5"}
+    storage = storage_for(redis)
+    storage.bot.owner_id = 99
+    cache = SettingsCache(redis)
+    cache.active = True
+    storage.bot.settings_cache = cache
+
+    async def run() -> None:
+        for _ in range(20):
+            assert await storage.get_auth(SimpleNamespace(id=1)) == 5
+            assert await storage.get_auth(SimpleNamespace(id=2)) == 0
+        assert await storage.get_auth(SimpleNamespace(id=99)) == 10
+        assert cache.misses == 1
+        await storage.set_auth(SimpleNamespace(id=2), 3)
+        assert await storage.get_commanders() == {1: 5, 2: 3}
+        assert cache.misses == 2
+
+    asyncio.run(run())
+
+
+def test_fold_recent_activity() -> None:
+    redis = FakeRedis()
+    redis.data["0:recent_activity"] = {"1": "4", "2": "0", "3": "7"}
+    redis.data["0:stat:activity"] = {"1": "10"}
+    storage = storage_for(redis)
+
+    async def run() -> None:
+        await storage.recent_activity_to_activity(1)
+        assert redis.data["0:stat:activity"] == {"1": "14"}
+        assert await storage.fold_recent_activity([]) == 0
+        assert await storage.do_activity_update() == 1
+        assert redis.data["0:stat:activity"] == {"1": "14", "3": "7"}
+        assert redis.data["0:recent_activity"] == {}
+
+    asyncio.run(run())
+
+
+def seeded_activity(users: list[str]) -> FakeRedis:
+    redis = FakeRedis()
+    redis.data["0:recent_activity"] = {user: "3" for user in users}
+    redis.data["0:stat:activity"] = {user: "1" for user in users}
+    return redis
+
+
+async def update_activity_per_user(redis: FakeRedis, users: list[str]) -> None:
+    # What the old loop needed at best, without WATCH or retries: a read and a write per user.
+    for user in users:
+        await redis.round_trip()
+        recent = await redis.hget("0:recent_activity", user)
+        tr = redis.pipeline()
+        tr.hincrby("0:stat:activity", user, int(recent))
+        tr.hdel("0:recent_activity", user)
+        await tr.execute()
+
+
+def test_activity_update_for_10k_users_takes_few_round_trips() -> None:
+    users = [str(i) for i in range(10_000)]
+
+    baseline = seeded_activity(users)
+    asyncio.run(update_activity_per_user(baseline, users))
+
+    scripted = seeded_activity(users)
+    storage = storage_for(scripted)
+    updated = asyncio.run(storage.do_activity_update())
+    asyncio.run(storage.fold_recent_activity(users))
+
+    assert updated == 10_000
+    assert scripted.data["0:stat:activity"] == baseline.data["0:stat:activity"]
+    assert baseline.round_trips == 20_000
+    # One for the whole update, and one per batch of 1000 users.
+    assert scripted.round_trips == 1 + 10
+
+
+@pytest.mark.benchmark
+def test_benchmark_activity_update_for_10k_users() -> None:
+    users = [str(i) for i in range(10_000)]
+    # The fake has no network, so each round trip is modelled as taking half a millisecond on top of what's measured.
+    rtt = 0.0005
+
+    def timed(redis: FakeRedis, update) -> str:
+        start = perf_counter()
+        asyncio.run(update())
+        elapsed = perf_counter() - start
+        return f"{redis.round_trips} round trips, {elapsed:.3f}s + {redis.round_trips * rtt:.3f}s network"
+
+    baseline = seeded_activity(users)
+    per_user = timed(baseline, lambda: update_activity_per_user(baseline, users))
+    scripted = seeded_activity(users)
+    script = timed(scripted, storage_for(scripted).do_activity_update)
+    batched = seeded_activity(users)
+    batches = timed(batched, lambda: storage_for(batched).fold_recent_activity(users))
+
+    assert scripted.data["0:stat:activity"] == batched.data["0:stat:activity"] == baseline.data["0:stat:activity"]
+    print(f"\nper user: {per_user}; script: {script}; batches of 1000: {batches}")
+
+
+def test_add_stat_user_is_one_atomic_round_trip() -> None:
+    redis = FakeRedis()
+    redis.data["0:stat:balance"] = {"2": "not a number"}
+    storage = storage_for(redis)
+
+    async def run() -> None:
+        results = await asyncio.gather(*(storage.add_stat_user(1, "balance", Decimal("0.1")) for _ in range(100)))
+        assert max(results) == Decimal("10.0")
+        assert redis.round_trips == 100
+        assert await storage.add_stat_user(1, "balance", Decimal("-2.5")) == Decimal("7.5")
+        with pytest.raises(InvalidInput):
+            await storage.add_stat_user(1, "balance", Decimal("-8"))
+        assert redis.data["0:stat:balance"]["1"] == "7.5"
+        assert await storage.add_stat_user(2, "balance", Decimal("3")) == Decimal("3")
+        assert await storage.add_stat_user(3, "balance", Decimal(10**23)) == Decimal(10**22)
+        # Redis adds in long doubles, so very large balances lose their fractions.
+        assert await storage.add_stat_user(4, "balance", Decimal("12345678901234567890")) == Decimal(
+            "12345678901234567890"
+        )
+        assert await storage.add_stat_user(4, "balance", Decimal("0.75")) == Decimal("12345678901234567891")
+        assert await storage.add_stat_user(5, "balance", Decimal("1234567.1")) == Decimal("1234567.1")
+        # And sums of numbers without an exact binary form pick up error in their last printed places.
+        result = await storage.add_stat_user(5, "balance", Decimal("0.000001"))
+        assert result != Decimal("1234567.100001")
+        assert abs(result - Decimal("1234567.100001")) < Decimal("1e-12")
+
+    asyncio.run(run())
+
+
+def test_price_alerts_are_stored_by_template_and_by_user() -> None:
+    redis = FakeRedis()
+    storage = storage_for(redis)
+
+    async def run() -> None:
+        await storage.add_price_alert(1, 100, 5.5)
+        await storage.add_price_alert(2, 100, 3)
+        await storage.add_price_alert(1, 200, 10)
+        await storage.add_price_alert(1, 100, 4)
+        assert await storage.get_user_price_alerts(1) == {100: 4.0, 200: 10.0}
+        before = redis.round_trips
+        assert await storage.get_price_alerts([100, 200, 300]) == {100: {1: 4.0, 2: 3.0}, 200: {1: 10.0}, 300: {}}
+        assert redis.round_trips == before + 1
+        assert await storage.remove_price_alert(1, 100)
+        assert not await storage.remove_price_alert(1, 100)
+        assert await storage.get_user_price_alerts(1) == {200: 10.0}
+        assert await storage.get_price_alerts([100]) == {100: {2: 3.0}}
+
+    asyncio.run(run())
@@ -0,0 +1,121 @@
+import asyncio
+from pathlib import Path
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from tests.fake_redis import FakeRedis
+from utils.storage import StorageManager
+from utils.wallet_registry import WalletRegistry
+
+
+def storage_for(redis: FakeRedis) -> StorageManager:
+    return StorageManager(SimpleNamespace(redis=redis, settings=SimpleNamespace(DEFAULT_PREFIX=",")))
+
+
+def user(user_id: int) -> SimpleNamespace:
+    return SimpleNamespace(id=user_id)
+
+
+def test_set_note_keeps_the_reverse_index() -> None:
+    redis = FakeRedis()
+    storage = storage_for(redis)
+    owners = storage.wallets.owners
+
+    async def run() -> None:
+        await storage.set_note(user(1), "LinkedWallet", "abcde.wam")
+        assert await storage.get_note(user(1), "LinkedWallet") == "abcde.wam"
+        assert await owners("abcde.wam") == [1]
+
+        # Changing wallet frees the old one.
+        await storage.set_note(user(1), "LinkedWallet", "fghij.wam")
+        assert await owners("abcde.wam") == []
+        assert await owners("fghij.wam") == [1]
+
+        # Several users can link the same wallet, and unlinking one of them keeps the others.
+        await storage.set_note(user(2), "LinkedWallet", "fghij.wam")
+        assert await owners("fghij.wam") == [1, 2]
+        await storage.del_note(user(1), "LinkedWallet")
+        assert await storage.get_note(user(1), "LinkedWallet") == "Not found."
+        assert await owners("fghij.wam") == [2]
+
+        await storage.del_note(user(2), "LinkedWallet")
+        assert await owners("fghij.wam") == []
+
+        # Other notes don't touch the index.
+        await storage.set_note(user(3), "Favourite", "bananas")
+        assert await owners("bananas") == []
+
+    asyncio.run(run())
+
+
+def test_a_later_owner_unlinking_keeps_the_first() -> None:
+    redis = FakeRedis()
+    registry = WalletRegistry(redis)
+
+    async def run() -> None:
+        await registry.link(1, "w.wam")
+        await registry.link(2, "w.wam")
+        assert await registry.unlink(2) == "w.wam"
+        assert await registry.owners("w.wam") == [1]
+        assert await registry.get_wallet(1) == "w.wam"
+
+    asyncio.run(run())
+
+
+def test_get_wallets_is_one_round_trip() -> None:
+    redis = FakeRedis()
+    registry = WalletRegistry(redis)
+
+    async def run() -> dict:
+        for user_id in range(0, 500, 2):
+            await registry.link(user_id, f"wallet{user_id}.wam")
+        redis.round_trips = 0
+        return await registry.get_wallets(range(500))
+
+    wallets = asyncio.run(run())
+    assert redis.round_trips == 1
+    assert len(wallets) == 500
+    assert wallets[10] == "wallet10.wam"
+    assert wallets[11] is None
+    assert asyncio.run(registry.get_wallets([])) == {}
+
+
+def test_rebuild_index_from_existing_notes() -> None:
+    redis = FakeRedis()
+    redis.data["notes:1"] = {"linkedwallet": "abcde.wam", "other": "x"}
+    redis.data["notes:2"] = {"other": "y"}
+    redis.data["notes:3"] = {"linkedwallet": "fghij.wam"}
+    redis.data["notes:4"] = {"linkedwallet": "fghij.wam"}
+    redis.data[WalletRegistry.owners_prefix + "stale.wam"] = {"9"}
+    registry = WalletRegistry(redis)
+
+    assert asyncio.run(registry.rebuild_index(batch_size=2)) == 2
+    assert asyncio.run(registry.owners("fghij.wam")) == [3, 4]
+    assert asyncio.run(registry.owners("abcde.wam")) == [1]
+    assert asyncio.run(registry.owners("stale.wam")) == []
+    assert WalletRegistry.indexed_key in redis.data
+
+
+def test_a_link_changed_after_it_was_read_is_retried() -> None:
+    redis = FakeRedis()
+    registry = WalletRegistry(redis)
+
+    async def run() -> None:
+        await registry.link(1, "a.wam")
+        stale_read = redis.hget
+
+        async def hget(key: str, field: str):
+            # Another process links b.wam just after this one read a.wam.
+            wallet = await stale_read(key, field)
+            redis.hget = stale_read  # type: ignore[method-assign]
+            await registry.link(1, "b.wam")
+            return wallet
+
+        redis.hget = hget  # type: ignore[method-assign]
+        assert await registry.link(1, "c.wam") == "b.wam"
+        assert await registry.get_wallet(1) == "c.wam"
+        assert [await registry.owners(wallet) for wallet in ("a.wam", "b.wam", "c.wam")] == [[], [], [1]]
+
+    asyncio.run(run())
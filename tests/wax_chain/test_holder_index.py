@@ -0,0 +1,86 @@
+from pathlib import Path
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from utils.logic_parser import compile_query
+from wax_chain.holder_index import HolderIndex
+
+
+def test_updates_report_added_and_removed_holders() -> None:
+    index = HolderIndex()
+
+    assert index.update(1, ["a", "b", ""]) == (2, 0)
+    assert index.update(2, ["c"]) == (1, 0)
+    assert index.update(1, ["b", "c", "d"]) == (2, 1)
+    assert sorted(index.holders(1)) == ["b", "c", "d"]
+    assert len(index) == 4
+
+
+def test_index_round_trips_through_disk(tmp_path: Path) -> None:
+    index = HolderIndex()
+    index.update(1, ["a", "b"])
+    index.update(7, ["b", "c"])
+    path = str(tmp_path / "holder_index.json")
+
+    index.save(path)
+    loaded = HolderIndex.load(path)
+
+    assert loaded is not None
+    assert loaded.accounts == index.accounts
+    assert sorted(loaded.holders(7)) == ["b", "c"]
+    assert loaded.updated == index.updated
+    assert HolderIndex.load(str(tmp_path / "missing.json")) is None
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["1 and 2", "1 or 2 and !3", "!(1 | 2)", "atleast 2 (1, 2, 3, 4)", "1 & !atleast 3 of (2, 3, 4) | 5", "9 or 1"],
+)
+def test_bitmap_evaluation_matches_set_evaluation(text: str) -> None:
+    rng = random.Random(text)
+    holders = {template_id: {f"w{rng.randrange(200)}" for _ in range(80)} for template_id in range(1, 6)}
+    index = HolderIndex()
+    for template_id, owners in holders.items():
+        index.update(template_id, owners)
+    query = compile_query(text)
+
+    assert set(query.evaluate_index(index)) == query.evaluate(holders)
+
+
+def test_holders_of_fifty_cards_are_found() -> None:
+    index = HolderIndex()
+    for template_id in range(1, 51):
+        index.update(template_id, [f"wallet{i}" for i in range(100_000) if i % template_id == 0 or i < 10])
+    query = compile_query(" and ".join(str(template_id) for template_id in range(1, 51)))
+
+    result = query.evaluate_index(index)
+
+    # No wallet past the first ten is divisible by every number up to 50.
+    assert set(result) == {f"wallet{i}" for i in range(10)}
+
+
+def test_snapshots_are_diffed_without_storing_unchanged_templates() -> None:
+    index = HolderIndex()
+    index.update(1, ["a", "b"])
+    index.update(2, ["a"])
+    assert index.snapshot(now=100) == 2
+    index.update(1, ["b", "c"])
+    assert index.snapshot(now=200) == 1
+    index.update(2, ["a", "d"])
+
+    assert len(index.snapshots[2]) == 1
+    assert compile_query("1").diff_index(index, before=100, after=200) == (["c"], ["a"])
+    assert compile_query("1 and 2").diff_index(index, before=150) == ([], ["a"])
+    assert sorted(compile_query("1 or 2").evaluate_index(index, when=150)) == ["a", "b"]
+    assert index.snapshot_before(150) == 100
+    assert index.snapshot_before(50) is None
+
+    index.prune_snapshots(before=150)
+
+    assert index.snapshot_times == [200]
+    assert [stamp for stamp, _ in index.snapshots[2]] == [100]
+    assert compile_query("2").diff_index(index, before=200) == (["d"], [])
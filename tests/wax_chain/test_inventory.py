@@ -0,0 +1,28 @@
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from utils.util import WaxNFT
+from wax_chain.inventory import value_inventory
+
+
+def test_inventory_is_grouped_and_valued_per_template() -> None:
+    assets = [WaxNFT(asset_id=i, ipfs_hash="", template_id=i % 3) for i in range(9)]
+    assets.append(WaxNFT(asset_id=100, ipfs_hash=""))
+    priced: list[int] = []
+
+    def price_of(template_id: int) -> float | None:
+        priced.append(template_id)
+        return {0: 2.0, 1: 0.5}.get(template_id)
+
+    valuation = value_inventory(assets, price_of, {0: "Zero"})
+
+    assert sorted(priced) == [0, 1, 2]
+    assert [(h.template_id, h.count, h.value) for h in valuation.holdings[:2]] == [(0, 3, 6.0), (1, 3, 1.5)]
+    assert valuation.holdings[0].name == "Zero"
+    assert valuation.total_assets == 10
+    assert valuation.total_value == 7.5
+    assert valuation.unpriced_assets == 4
+    assert valuation.runway(2.5) == 4.0
+    assert valuation.runway(0) == float("inf")
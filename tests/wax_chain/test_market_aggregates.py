@@ -0,0 +1,97 @@
+import asyncio
+from pathlib import Path
+import sys
+from typing import Any
+
+import pytest
+from pytest import MonkeyPatch
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from wax_chain import market_aggregates
+from wax_chain.market_aggregates import DAY, MarketAggregates, summarize_sales
+from wax_chain.wax_util import template_price_cache
+
+NOW = 1_700_000_000.0
+
+
+def test_sales_are_summarized_by_age() -> None:
+    sales = [(NOW - 2 * DAY, 4.0), (NOW - 60, 2.0), (NOW - 8 * DAY, 100.0), (NOW - DAY, 1.0), (NOW - 3600, 3.0)]
+
+    assert summarize_sales(sales, now=NOW) == (2.0, NOW - 60, 6.0, 10.0, 3, 4)
+    assert summarize_sales([], now=NOW) == (-1.0, 0.0, 0.0, 0.0, 0, 0)
+
+
+def aggregates_for(monkeypatch: MonkeyPatch, market: dict[int, dict[str, Any]]) -> MarketAggregates:
+    """Answers the market lookups of each template from market, as sales, floor and owners."""
+
+    async def sales(template_id: int, session: Any) -> list[tuple[float, float]]:
+        return market[template_id]["sales"]
+
+    async def floor(template_id: int, session: Any) -> float:
+        return market[template_id]["floor"]
+
+    async def owners(template_id: int, session: Any, num: int = 1000) -> tuple[int, list[str]]:
+        return num, market[template_id]["owners"]
+
+    monkeypatch.setattr(market_aggregates, "get_sales_history", sales)
+    monkeypatch.setattr(market_aggregates, "get_lowest_current_offer", floor)
+    monkeypatch.setattr(market_aggregates, "get_owners", owners)
+    monkeypatch.setattr(market_aggregates, "time", lambda: NOW)
+    return MarketAggregates()
+
+
+def test_templates_are_refreshed_sorted_and_rendered(monkeypatch: MonkeyPatch) -> None:
+    aggregates = aggregates_for(
+        monkeypatch,
+        {
+            11: {"sales": [(NOW - 60, 2.0), (NOW - 3 * DAY, 6.0)], "floor": 2.5, "owners": ["a", "b", "a"]},
+            12: {"sales": [], "floor": -1, "owners": ["a"]},
+            13: {"sales": [(NOW - 60, 9.0)], "floor": 1.5, "owners": ["a", "b", "c"]},
+        },
+    )
+
+    async def run() -> None:
+        for card_num, template_id in enumerate((12, 11, 13), 1):
+            await aggregates.refresh_template(None, template_id, card_num, f"Card {card_num}")  # type: ignore[arg-type]
+
+    asyncio.run(run())
+
+    stats = aggregates.stats[11]
+    assert (stats.floor, stats.last_sale, stats.volume_24h, stats.volume_7d, stats.holders) == (2.5, 2.0, 2.0, 8.0, 2)
+    assert aggregates.updated == NOW
+    assert template_price_cache.peek(11) is not None
+    assert [row.template_id for row in aggregates.rows()] == [12, 11, 13]
+    assert [row.template_id for row in aggregates.rows("floor")] == [13, 11, 12]
+    assert [row.template_id for row in aggregates.rows("24h")] == [13, 11, 12]
+    assert [row.template_id for row in aggregates.rows("holders")] == [13, 11, 12]
+    with pytest.raises(ValueError):
+        aggregates.rows("name")
+
+    lines = aggregates.render().splitlines()
+    assert lines[0].startswith("3 templates. Collection floor: 1.50 WAX. 24h volume: 11.00 WAX over 2 sales.")
+    assert len(lines) == 3 + 3
+    assert lines[4].split() == ["2", "Card", "2", "2.50", "2.00", "2.00", "8.00", "2"]
+
+
+def test_failed_templates_keep_their_figures(monkeypatch: MonkeyPatch) -> None:
+    market: dict[int, dict[str, Any]] = {
+        11: {"sales": [(NOW - 60, 2.0)], "floor": 2.5, "owners": ["a"]},
+        12: {"sales": [], "floor": 1.0, "owners": ["a"]},
+    }
+    aggregates = aggregates_for(monkeypatch, market)
+
+    async def cards(session: Any) -> dict[int, dict[str, Any]]:
+        return {
+            1: {"template_id": "11", "name": "One", "issued_supply": 10},
+            2: {"template_id": "12", "name": "Two", "issued_supply": 10},
+        }
+
+    monkeypatch.setattr(market_aggregates, "update_cache_cards", cards)
+
+    assert asyncio.run(aggregates.refresh(None)) == 2  # type: ignore[arg-type]
+    del market[12]["sales"]
+    market[11]["floor"] = 3.0
+    assert asyncio.run(aggregates.refresh(None)) == 1  # type: ignore[arg-type]
+    assert aggregates.stats[11].floor == 3.0
+    assert aggregates.stats[12].floor == 1.0
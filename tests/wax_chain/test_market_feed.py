@@ -0,0 +1,93 @@
+import asyncio
+from pathlib import Path
+import sys
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from wax_chain.market_feed import ListingFeed, cheapest_listings, match_price_alerts
+
+
+def listing(sale_id: int, template_id: int, price: float) -> dict[str, Any]:
+    return {"sale_id": sale_id, "template_id": template_id, "asset_id": sale_id, "seller": "s.wam", "price": price}
+
+
+class FakeMarket:
+    """Serves the market's sales endpoint, newest first, from raw sales of one collection. A sale with two assets is
+    a bundle. While error is set, every request gets an error body without data."""
+
+    def __init__(self) -> None:
+        self.sales: list[dict[str, Any]] = []
+        self.error = False
+
+    def list(self, sale_id: int, template_id: int, price: float, assets: int = 1) -> None:
+        self.sales.insert(
+            0,
+            {
+                "sale_id": str(sale_id),
+                "seller": "s.wam",
+                "price": {"amount": str(int(price * 10**8)), "token_precision": 8},
+                "assets": [{"asset_id": str(sale_id), "template": {"template_id": str(template_id)}}] * assets,
+            },
+        )
+
+    def get(self, url: str, params: dict[str, Any]) -> "FakeMarket":
+        page, limit = params["page"], params["limit"]
+        self.body = {"message": "Too many requests"} if self.error else {
+            "data": self.sales[(page - 1) * limit:page * limit]
+        }
+        return self
+
+    async def json(self) -> dict[str, Any]:
+        return self.body
+
+    async def __aenter__(self) -> "FakeMarket":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        return None
+
+
+def poll(feed: ListingFeed, market: FakeMarket) -> list[int]:
+    return [item["sale_id"] for item in asyncio.run(feed.poll(market))]  # type: ignore[arg-type]
+
+
+def test_polls_only_return_listings_after_the_first() -> None:
+    market = FakeMarket()
+    market.list(5, 1, 1.0)
+    feed = ListingFeed(["a"])
+
+    assert poll(feed, market) == []
+    market.list(6, 1, 2.0)
+    market.list(7, 2, 3.0)
+    assert poll(feed, market) == [7, 6]
+    assert poll(feed, market) == []
+    # A bundle is skipped, but moves the feed on.
+    market.list(8, 2, 3.0, assets=2)
+    assert poll(feed, market) == []
+    assert feed.last_sale_ids["a"] == 8
+
+
+def test_feeds_start_at_the_first_sale_seen() -> None:
+    market = FakeMarket()
+    for sale_id in range(1, 301):
+        market.list(sale_id, 1, 1.0)
+    market.error = True
+    feed = ListingFeed(["a"])
+
+    # An error isn't taken as an empty market, which would report every listing as new on the next poll.
+    assert poll(feed, market) == []
+    market.error = False
+    market.list(301, 1, 1.0, assets=2)
+    assert poll(feed, market) == []
+    assert feed.last_sale_ids["a"] == 301
+    market.list(302, 1, 1.0)
+    assert poll(feed, market) == [302]
+
+
+def test_alerts_match_the_cheapest_listing_of_each_template() -> None:
+    cheapest = cheapest_listings([listing(1, 10, 5.0), listing(2, 10, 3.0), listing(3, 20, 8.0), listing(4, 10, 4.0)])
+    assert {template_id: item["sale_id"] for template_id, item in cheapest.items()} == {10: 2, 20: 3}
+
+    subscriptions = {10: {1: 3.0, 2: 2.99}, 20: {1: 10.0, 3: 7.0}, 30: {4: 100.0}}
+    assert match_price_alerts(cheapest, subscriptions) == {1: [cheapest[10], cheapest[20]]}
@@ -0,0 +1,62 @@
+import asyncio
+from pathlib import Path
+import sys
+
+from pytest import MonkeyPatch
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from tests.fake_redis import FakeRedis
+from wax_chain import special_address_registry
+from wax_chain.special_address_registry import SpecialAddressRegistry
+
+
+class FakeAuctions:
+    def __init__(self, names: list[str], page_size: int = 3) -> None:
+        self.names = names
+        self.page_size = page_size
+        self.requested: list[int] = []
+
+    async def __call__(self, session: object, page: int) -> list[str]:
+        self.requested.append(page)
+        start = (page - 1) * self.page_size
+        return self.names[start : start + self.page_size]
+
+
+def test_registry_persists_and_refreshes_incrementally(monkeypatch: MonkeyPatch) -> None:
+    auctions = FakeAuctions(["a", "b", "c", "d"])
+    monkeypatch.setattr(special_address_registry, "PAGE_SIZE", 3)
+    monkeypatch.setattr(special_address_registry, "async_get_special_wax_address_page", auctions)
+    monkeypatch.setattr(special_address_registry, "fallback_special_wax_addresses", lambda: {"old"})
+    redis = FakeRedis()
+
+    async def run() -> None:
+        registry = SpecialAddressRegistry(redis)
+        assert await registry.load() == "fallback"
+        assert registry.specials == {"old"}
+
+        published = registry.specials
+        assert await registry.refresh(session=None) == 4
+        assert published == {"old"}
+        assert registry.specials == {"old", "a", "b", "c", "d"}
+        assert auctions.requested == [1, 2]
+
+        auctions.names += ["e", "f"]
+        assert await registry.refresh(session=None) == 2
+        assert auctions.requested == [1, 2, 2, 3]
+        assert registry.version == 2
+
+        restarted = SpecialAddressRegistry(redis)
+        assert await restarted.load() == "redis"
+        assert restarted.specials == registry.specials
+        assert (restarted.version, restarted.pages) == (2, 3)
+        assert isinstance(restarted.specials, frozenset)
+
+        # Only every seventh refresh goes through every page, counting from the restart.
+        for _ in range(6):
+            await restarted.refresh(session=None)
+        assert auctions.requested[4:] == [3] * 6
+        await restarted.refresh(session=None)
+        assert auctions.requested[10:] == [1, 2, 3]
+
+    asyncio.run(run())
@@ -0,0 +1,72 @@
+from pathlib import Path
+import random
+import sys
+from time import perf_counter
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "greenwiz"))
+
+from wax_chain.wax_addresses import is_valid_wax_address, validate_wax_addresses, wax_address_validator
+
+SPECIALS = {"gm", "cmk"}
+
+
+def test_addresses_are_partitioned_in_order() -> None:
+    addresses = ["abcde.wam", "mon.cmk", "Abc.wam", "abc.xyz", "a" * 13, "eosio.token", "abcdefgh1234", "ab6.wam"]
+
+    valid, invalid = validate_wax_addresses(addresses, valid_specials=SPECIALS)
+
+    assert valid == ["abcde.wam", "mon.cmk", "Abc.wam", "eosio.token", "abcdefgh1234"]
+    assert invalid == ["abc.xyz", "a" * 13, "ab6.wam"]
+    assert validate_wax_addresses(["Abc.wam"], SPECIALS, case_sensitive=True) == ([], ["Abc.wam"])
+    assert [is_valid_wax_address(addr, valid_specials=SPECIALS) for addr in addresses] == [
+        addr in valid for addr in addresses
+    ]
+
+
+def test_validator_is_rebuilt_only_when_the_special_list_changes() -> None:
+    specials = set(SPECIALS)
+    validator = wax_address_validator(specials)
+
+    assert wax_address_validator(specials) is validator
+    specials.add("new")
+    assert wax_address_validator(specials) is not validator
+    assert is_valid_wax_address("x.new", valid_specials=specials)
+
+
+def random_addresses(count: int) -> list[str]:
+    rng = random.Random(34)
+    alphabet = "abcdefghijklmnopqrstuvwxyz12345"
+    return [
+        "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 8))) + rng.choice([".wam", ".cmk", ".xyz", ""])
+        for _ in range(count)
+    ]
+
+
+def test_batch_validation_matches_single_validation() -> None:
+    addresses = random_addresses(10_000)
+    specials = {f"special{i}" for i in range(50_000)} | SPECIALS
+
+    valid, invalid = validate_wax_addresses(addresses, valid_specials=specials)
+
+    assert len(valid) + len(invalid) == len(addresses)
+    assert valid == [address for address in addresses if is_valid_wax_address(address, valid_specials=specials)]
+    assert valid and invalid
+
+
+@pytest.mark.benchmark
+def test_benchmark_validating_100k_addresses() -> None:
+    addresses = random_addresses(100_000)
+    specials = {f"special{i}" for i in range(50_000)} | SPECIALS
+
+    start = perf_counter()
+    valid, invalid = validate_wax_addresses(addresses, valid_specials=specials)
+    batch = perf_counter() - start
+
+    start = perf_counter()
+    single = [address for address in addresses if is_valid_wax_address(address, valid_specials=specials)]
+    one_by_one = perf_counter() - start
+
+    assert valid == single
+    print(f"\nValidated {len(addresses)} addresses in {batch * 1000:.1f}ms, one by one in {one_by_one * 1000:.1f}ms")
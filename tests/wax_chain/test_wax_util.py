@@ -76,3 +76,54 @@ def test_claimlink_confirmation_rotates_history_endpoints(monkeypatch: MonkeyPat
     assert link_id == "12345"
     assert wax_con.session.calls[f"{bad_url}{wax_util.wax_history_api}"] == 1
     assert wax_con.session.calls[f"{good_url}{wax_util.wax_history_api}"] == 1
+
+
+class FakeDrops:
+    def __init__(self) -> None:
+        self.used = 0
+
+    async def claim(self, user_id: int, limit: int) -> tuple[bool, int, str]:
+        self.used += 1
+        return self.used <= limit, self.used, "2024-03-09"
+
+    async def release(self, user_id: int, day: str) -> None:
+        await asyncio.sleep(0)
+        self.used -= 1
+
+
+def test_cancelled_drop_is_given_back(monkeypatch: MonkeyPatch) -> None:
+    cinfo = SimpleNamespace(collection="crptomonkeys", daily_limit=2, intro_role=None, intro_ch=None)
+    monkeypatch.setattr(wax_util, "determine_collection", lambda *_args: (1, cinfo))
+    started = asyncio.Event()
+
+    async def send_forever(**_kwargs: Any) -> list[int]:
+        started.set()
+        await asyncio.Event().wait()
+        return [1]
+
+    async def add_reaction(_emoji: str) -> None:
+        return None
+
+    monkeypatch.setattr(wax_util, "send_and_announce_drop", send_forever)
+    drops = FakeDrops()
+    bot = SimpleNamespace(storage={None: SimpleNamespace(drops=drops)})
+    message = SimpleNamespace(guild=None, add_reaction=add_reaction)
+    sender = SimpleNamespace(id=7)
+
+    async def run() -> None:
+        task = asyncio.create_task(
+            wax_util.send_link_start_to_finish(None, bot, message, SimpleNamespace(), sender, "thanks")
+        )
+        await started.wait()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        else:
+            raise AssertionError("The drop should have been cancelled.")
+
+    asyncio.run(run())
+
+    assert drops.used == 0
+    assert bot.drop_send_reentrancy[7] is False